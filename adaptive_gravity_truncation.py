@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+This class evaluates the spherical harmonic acceleration with a degree and order
+truncation chosen automatically from the radius of each object, instead of the
+fixed order_zonal and order_tesseral given by the caller. The contribution of
+the degree l terms to the acceleration falls off as (R_earth/r)^l. At any
+point at radius r, the size of that contribution is bounded by
+
+    a_l(r) = mu/r^2*(2l + 1)*sqrt(l + 1)*(R_earth/r)^l*sigma_l
+
+where sigma_l = sqrt(sum_m(C_bar_lm^2 + S_bar_lm^2)) is the root-sum-square of
+the fully normalized coefficients of degree l. The bound follows from the
+Cauchy-Schwarz inequality. Summed over m, the squares of the normalized
+surface harmonics of degree l are 2l + 1 at every point, which bounds the
+radial component by (l + 1)*sqrt(2l + 1). The squares of their surface
+gradients sum to l*(l + 1)*(2l + 1), which bounds the horizontal components
+by sqrt(l*(l + 1)*(2l + 1)). The quadrature sum of the two gives the factor
+above. The RMS over the sphere is smaller by about sqrt(2l + 1), so the bound
+is conservative by that factor at most points. The truncation degree L is the
+smallest one for which the sum of a_l(r) over all dropped degrees l > L stays
+below the requested acceleration tolerance, so the truncation error at every
+point is below the tolerance.
+
+Radii are grouped into altitude bands of width band_width. The truncation of
+a band is chosen at the bottom of the band, which is the worst case within it,
+and then cached. Objects that share a truncation are evaluated together in one
+call to spherical_harmonic_acceleration_batch. The counters calls,
+objects_evaluated, terms_evaluated, band_cache_hits and band_cache_misses report
+how much work was actually done. terms_evaluated is the number of (l, m) terms
+summed over all objects.
+
+Inputs:
+    zonal_coeff_array: numpy array containing the C_l0 terms
+    sectorial_coeff_array: numpy array containing the C_lm terms
+    tesseral_coeff_array: numpy array containing the S_lm terms
+    tolerance: Largest truncation error of the acceleration at any point (m/s^2)
+    order_zonal: Largest number of zonal terms that may be used (default: all)
+    order_tesseral: Largest sectorial/tesseral degree that may be used (default: all)
+    normalized: True if the coefficient arrays are fully normalized (default False)
+    band_width: Width of the altitude bands used for caching (m)
+    engine: 'spherical' or 'cartesian', passed to spherical_harmonic_acceleration_batch
+    mu_earth: Gravitational parameter of the field (m^3/s^2, default EGM-96)
+    r_earth: Reference radius of the field (m, default EGM-96)
+
+Outputs:
+    Calling the object with an (N,3) array of ITRF positions (m) returns the
+    (N,3) array of accelerations in the ITRF reference frame (m/s^2)
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from load_gravity_field import normalization_factors, mu_earth_default, r_earth_default
+from spherical_harmonic_acceleration_batch import spherical_harmonic_acceleration_batch
+
+class AdaptiveGravityTruncation():
+    #
+    def __init__(self, zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array,\
+                 tolerance, order_zonal=None, order_tesseral=None, normalized=False,\
+                 band_width=50.0e3, engine='spherical', mu_earth=None, r_earth=None):
+        #
+        # Use the EGM-96 gravitational parameter and reference radius unless those
+        # of the field are given
+        #
+        self.mu_earth = mu_earth_default if mu_earth is None else mu_earth;
+        self.r_earth = r_earth_default if r_earth is None else r_earth;
+        #
+        self.zonal_coeff_array = zonal_coeff_array;
+        self.sectorial_coeff_array = sectorial_coeff_array;
+        self.tesseral_coeff_array = tesseral_coeff_array;
+        self.tolerance = tolerance;
+        self.normalized = normalized;
+        self.band_width = band_width;
+        self.engine = engine;
+        #
+        if order_zonal is None:
+            order_zonal = len(zonal_coeff_array);
+        if order_tesseral is None:
+            order_tesseral = sectorial_coeff_array.shape[0] - 1;
+        #
+        self.order_zonal = order_zonal;
+        self.order_tesseral = min(order_tesseral, sectorial_coeff_array.shape[0] - 1,\
+                                  order_zonal - 1);
+        #
+        # Root-sum-square of the normalized coefficients of each degree
+        #
+        degree_max = order_zonal - 1;
+        sigma_squared = np.zeros(degree_max + 1);
+        #
+        if normalized:
+            N_zonal = np.ones(degree_max + 1);
+            N_tesseral = np.ones((self.order_tesseral + 1, self.order_tesseral + 1));
+        else:
+            N_zonal = normalization_factors(degree_max, 0)[:, 0];
+            N_tesseral = normalization_factors(self.order_tesseral, self.order_tesseral);
+        #
+        sigma_squared[2:] = (zonal_coeff_array[2:degree_max + 1]/N_zonal[2:])**2;
+        #
+        for l in range(2, self.order_tesseral + 1):
+            sigma_squared[l] += np.sum((sectorial_coeff_array[l, 1:l + 1]/\
+                                N_tesseral[l, 1:l + 1])**2 + (tesseral_coeff_array[l, 1:l + 1]/\
+                                N_tesseral[l, 1:l + 1])**2);
+        #
+        self.sigma = np.sqrt(sigma_squared);
+        #
+        self.band_truncation = {};
+        self.reset_statistics();
+    #
+    def reset_statistics(self):
+        #
+        self.calls = 0;
+        self.objects_evaluated = 0;
+        self.terms_evaluated = 0;
+        self.band_cache_hits = 0;
+        self.band_cache_misses = 0;
+    #
+    def truncation_for_radius(self, r_mag):
+        #
+        # Smallest (order_zonal, order_tesseral) meeting the tolerance at r_mag
+        #
+        degree_max = self.order_zonal - 1;
+        l = np.arange(degree_max + 1);
+        #
+        a_l = self.mu_earth/r_mag**2*(2*l + 1)*np.sqrt(l + 1)*(self.r_earth/r_mag)**l*self.sigma;
+        #
+        # tail_error[L] bounds the error made by dropping every degree above L
+        #
+        tail_error = np.concatenate((np.cumsum(a_l[::-1])[::-1][1:], [0.0]));
+        #
+        degree = int(np.argmax(tail_error <= self.tolerance));
+        degree = max(degree, 2);
+        #
+        return degree + 1, min(degree, self.order_tesseral)
+    #
+    def truncation_for_band(self, band):
+        #
+        if band in self.band_truncation:
+            self.band_cache_hits += 1;
+        else:
+            self.band_cache_misses += 1;
+            r_bottom = max(band*self.band_width, self.r_earth);
+            self.band_truncation[band] = self.truncation_for_radius(r_bottom);
+        #
+        return self.band_truncation[band]
+    #
+    def __call__(self, r_ITRF_array):
+        #
+        r_ITRF_array = np.atleast_2d(np.asarray(r_ITRF_array, dtype=float));
+        #
+        r_mag = np.linalg.norm(r_ITRF_array, axis=1);
+        band_array = np.floor(r_mag/self.band_width).astype(int);
+        #
+        # Group the objects by truncation rather than by band, since neighbouring
+        # bands usually share the same truncation
+        #
+        truncation_groups = {};
+        #
+        for band in np.unique(band_array):
+            truncation = self.truncation_for_band(int(band));
+            truncation_groups.setdefault(truncation, []).append(band);
+        #
+        accel_spherical_harmonic_ITRF = np.zeros(r_ITRF_array.shape);
+        #
+        for (order_zonal, order_tesseral), bands in truncation_groups.items():
+            #
+            in_group = np.isin(band_array, bands);
+            #
+            accel_spherical_harmonic_ITRF[in_group] = spherical_harmonic_acceleration_batch(\
+            self.zonal_coeff_array, self.sectorial_coeff_array, self.tesseral_coeff_array,\
+            r_ITRF_array[in_group], order_zonal, order_tesseral, self.normalized,\
+            self.engine, False, self.mu_earth, self.r_earth);
+            #
+            num_zonal_terms = order_zonal - 2;
+            num_tesseral_terms = order_tesseral*(order_tesseral + 1)//2 - 1;
+            #
+            self.terms_evaluated += int(np.sum(in_group))*(num_zonal_terms +\
+                                    max(num_tesseral_terms, 0));
+        #
+        self.calls += 1;
+        self.objects_evaluated += r_ITRF_array.shape[0];
+        #
+        return accel_spherical_harmonic_ITRF
+
+#
+# Test function: compare the truncated field with the full field of a degree 70
+# normalized field at random points from 200 km to 2000 km altitude, which must
+# stay below the tolerance everywhere
+#
+if __name__ == '__main__':
+    #
+    degree_max = 70;
+    rng = np.random.default_rng(6);
+    #
+    # Coefficients following Kaula's rule, 1e-5/l^2, with the EGM-96 C_bar_20
+    #
+    C_lm = np.zeros((degree_max + 1, degree_max + 1));
+    S_lm = np.zeros((degree_max + 1, degree_max + 1));
+    for l in range(2, degree_max + 1):
+        C_lm[l, 0:l + 1] = rng.normal(0.0, 1.0e-5/l**2, l + 1);
+        S_lm[l, 1:l + 1] = rng.normal(0.0, 1.0e-5/l**2, l);
+    C_lm[2, 0] = -4.84165371736e-04;
+    #
+    zonal_coeff_array = C_lm[:, 0].copy();
+    sectorial_coeff_array = C_lm.copy();
+    sectorial_coeff_array[:, 0] = 0.0;
+    tesseral_coeff_array = S_lm;
+    #
+    num_sat = 3000;
+    directions = rng.normal(size=(num_sat, 3));
+    directions = directions/np.linalg.norm(directions, axis=1)[:, None];
+    r_ITRF_array = directions*(6378136.3 + rng.uniform(200.0e3, 2000.0e3, num_sat))[:, None];
+    #
+    accel_full = spherical_harmonic_acceleration_batch(zonal_coeff_array, sectorial_coeff_array,\
+                 tesseral_coeff_array, r_ITRF_array, degree_max + 1, degree_max, True);
+    #
+    for tolerance in (1.0e-6, 1.0e-7, 1.0e-8):
+        #
+        adaptive_gravity = AdaptiveGravityTruncation(zonal_coeff_array, sectorial_coeff_array,\
+                           tesseral_coeff_array, tolerance, normalized=True);
+        truncation_error = np.linalg.norm(adaptive_gravity(r_ITRF_array) - accel_full, axis=1);
+        #
+        assert np.all(truncation_error <= tolerance), truncation_error.max()/tolerance
+        print('tolerance', tolerance, 'max truncation error', truncation_error.max(),\
+              'terms per object', adaptive_gravity.terms_evaluated/num_sat)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+This function calculates the geocentric positions and velocities of the Moon and
+the Sun with the analytic low-precision series of David Vallado's book
+"Fundamentals of Astrodynamics and Applications" (the SUN and MOON algorithms).
+It needs no ephemeris kernels and no spiceypy, so it starts instantly and is
+meant for screening runs. The Sun is accurate to about 0.01 degrees and the
+Moon to about 0.3 degrees and 0.2 % in distance. Use the SPICE ephemerides
+where better accuracy is needed.
+
+The positions are in the mean-of-date equatorial frame, which is within a
+fraction of a degree of J2000 over the decades around 2000. Julian days are
+taken as UT1 for the Sun and as TDB for the Moon; the difference of about a
+minute is below the accuracy of the series. The velocities are central
+differences of the positions over one minute. Every input may be a NumPy array
+of epochs.
+
+Inputs:
+    jday: Julian day(s) of the epoch(s) of interest
+
+Outputs:
+    rECIF_Moon: (N,3) ECIF position vectors of the Moon (km)
+    rECIF_Sun: (N,3) ECIF position vectors of the Sun (km)
+    vECIF_Moon: (N,3) ECIF velocity vectors of the Moon (km/s)
+    vECIF_Sun: (N,3) ECIF velocity vectors of the Sun (km/s)
+    The outputs are (3,) vectors if jday is a scalar.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+
+def _analytic_Sun_position(jday):
+    #
+    AU = 149597870.7; # km
+    #
+    T = (jday - 2451545.0)/36525.0;
+    #
+    mean_longitude = 280.460 + 36000.771*T; #degrees
+    mean_anomaly = np.deg2rad(357.5291092 + 35999.05034*T);
+    #
+    ecliptic_longitude = np.deg2rad(mean_longitude + 1.914666471*np.sin(mean_anomaly) +\
+                                    0.019994643*np.sin(2.0*mean_anomaly));
+    obliquity = np.deg2rad(23.439291 - 0.0130042*T);
+    #
+    r_mag = AU*(1.000140612 - 0.016708617*np.cos(mean_anomaly) -\
+                0.000139589*np.cos(2.0*mean_anomaly));
+    #
+    return r_mag[..., None]*np.stack((np.cos(ecliptic_longitude),\
+                                      np.cos(obliquity)*np.sin(ecliptic_longitude),\
+                                      np.sin(obliquity)*np.sin(ecliptic_longitude)), axis=-1)
+
+def _analytic_Moon_position(jday):
+    #
+    R_earth = 6378.1363; # km
+    #
+    T = (jday - 2451545.0)/36525.0;
+    #
+    def sin_deg(angle):
+        return np.sin(np.deg2rad(angle))
+    #
+    def cos_deg(angle):
+        return np.cos(np.deg2rad(angle))
+    #
+    ecliptic_longitude = np.deg2rad(218.32 + 481267.8813*T +\
+    6.29*sin_deg(134.9 + 477198.85*T) - 1.27*sin_deg(259.2 - 413335.38*T) +\
+    0.66*sin_deg(235.7 + 890534.23*T) + 0.21*sin_deg(269.9 + 954397.70*T) -\
+    0.19*sin_deg(357.5 + 35999.05*T) - 0.11*sin_deg(186.6 + 966404.05*T));
+    #
+    ecliptic_latitude = np.deg2rad(5.13*sin_deg(93.3 + 483202.03*T) +\
+    0.28*sin_deg(228.2 + 960400.87*T) - 0.28*sin_deg(318.3 + 6003.18*T) -\
+    0.17*sin_deg(217.6 - 407332.20*T));
+    #
+    horizontal_parallax = np.deg2rad(0.9508 + 0.0518*cos_deg(134.9 + 477198.85*T) +\
+    0.0095*cos_deg(259.2 - 413335.38*T) + 0.0078*cos_deg(235.7 + 890534.23*T) +\
+    0.0028*cos_deg(269.9 + 954397.70*T));
+    #
+    obliquity = np.deg2rad(23.439291 - 0.0130042*T);
+    #
+    r_mag = R_earth/np.sin(horizontal_parallax);
+    #
+    cos_lat = np.cos(ecliptic_latitude);
+    sin_lat = np.sin(ecliptic_latitude);
+    cos_lon = np.cos(ecliptic_longitude);
+    sin_lon = np.sin(ecliptic_longitude);
+    #
+    return r_mag[..., None]*np.stack((cos_lat*cos_lon,\
+           np.cos(obliquity)*cos_lat*sin_lon - np.sin(obliquity)*sin_lat,\
+           np.sin(obliquity)*cos_lat*sin_lon + np.cos(obliquity)*sin_lat), axis=-1)
+
+def analytic_Sun_and_Moon_Positions(jday):
+    #
+    jday = np.asarray(jday, dtype=float);
+    #
+    # Step used for the central difference velocities
+    #
+    dt = 60.0; # s
+    dt_days = dt/86400.0;
+    #
+    rECIF_Moon = _analytic_Moon_position(jday);
+    rECIF_Sun = _analytic_Sun_position(jday);
+    #
+    vECIF_Moon = (_analytic_Moon_position(jday + dt_days) -\
+                  _analytic_Moon_position(jday - dt_days))/(2.0*dt);
+    vECIF_Sun = (_analytic_Sun_position(jday + dt_days) -\
+                 _analytic_Sun_position(jday - dt_days))/(2.0*dt);
+    #
+    return rECIF_Moon, rECIF_Sun, vECIF_Moon, vECIF_Sun
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+This function calculates the atmospheric drag acceleration of a batch of
+satellites in one vectorized call. The atmosphere is assumed to co-rotate with
+the Earth, so the velocity of each satellite relative to the atmosphere is
+
+    v_rel = v - omega_earth x r
+
+The drag acceleration is then
+
+    a_drag = -1/2*rho*B*|v_rel|*v_rel
+
+with the ballistic coefficient B = C_D*A/m of each satellite and the density
+rho from jacchia_71_gill_density. The altitude is taken above an oblate Earth,
+R_earth*(1 - f*sin^2(latitude)), and the latitude is the geocentric one. Both
+are within the accuracy of the density model. Satellites at or above
+cutoff_altitude are given zero drag and their density is never evaluated. The
+cutoff may not be raised above 2500 km, the top of the tabulated helium.
+
+The per-epoch inputs of the density model (Sun position, space weather and the
+time-only terms) come from the EpochContext of the epoch, which is passed to
+jacchia_71_gill_density. A ValueError is raised if the context carries no
+F_10.7 values and K_p.
+
+Any callable with the arguments of jacchia_71_gill_density without the tables,
+such as a DensityCache or a DensityCube, can be given as density_model instead
+of the direct model. The context's space weather is then passed through as is,
+and may be None for models that do not need it, such as a DensityCube. Only
+the direct model requires it.
+
+Inputs:
+    rECIF_array: (N,3) array of satellite positions in the ECIF reference frame (m)
+    vECIF_array: (N,3) array of satellite velocities in the ECIF reference frame (m/s)
+    ballistic_coeff: Ballistic coefficient C_D*A/m of each satellite, scalar or (N,) (m^2/kg)
+    context: EpochContext of the epoch
+    cutoff_altitude: Altitude at and above which drag is neglected (m), at most 2500 km
+    density_model: Optional replacement for jacchia_71_gill_density (see above)
+
+Outputs:
+    accel_drag_ECIF: (N,3) array of drag accelerations in the ECIF reference
+    frame (m/s^2)
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from jacchia_71_gill_density import jacchia_71_gill_density
+from jacchia_71_gill_tabulated_SD_values import jacchia_71_gill_tabulated_SD_values
+from jacchia_71_gill_tabulated_helium_values import jacchia_71_gill_tabulated_helium_values,\
+     Z_helium_upper_limit
+
+def atmospheric_drag_acceleration(rECIF_array, vECIF_array, ballistic_coeff, context,\
+                                  cutoff_altitude=1000.0e3, density_model=None):
+    #
+    # Define the Earth rotation rate and the WGS-84 ellipsoid
+    #
+    omega_earth = 7.292115e-5; # rad/s
+    R_earth = 6378137.0; # m
+    flattening = 1.0/298.257223563;
+    #
+    if density_model is None and not context.has_space_weather:
+        raise ValueError('The EpochContext has no F_10.7 and K_p values for the drag density')
+    if cutoff_altitude > 1000.0*Z_helium_upper_limit:
+        raise ValueError('The drag cutoff altitude is above the range of the density model')
+    #
+    rECIF_array = np.atleast_2d(np.asarray(rECIF_array, dtype=float));
+    vECIF_array = np.atleast_2d(np.asarray(vECIF_array, dtype=float));
+    ballistic_coeff = np.broadcast_to(np.asarray(ballistic_coeff, dtype=float),\
+                                      rECIF_array.shape[:1]);
+    #
+    accel_drag_ECIF = np.zeros(rECIF_array.shape);
+    #
+    # Find the altitude of each satellite and drop those above the cutoff
+    #
+    r_mag = np.linalg.norm(rECIF_array, axis=1);
+    sin_latitude = rECIF_array[:, 2]/r_mag;
+    altitude = r_mag - R_earth*(1.0 - flattening*sin_latitude**2);
+    #
+    in_atmosphere = altitude < cutoff_altitude;
+    #
+    if not np.any(in_atmosphere):
+        return accel_drag_ECIF
+    #
+    r = rECIF_array[in_atmosphere];
+    #
+    # Velocity relative to the co-rotating atmosphere
+    #
+    v_rel = vECIF_array[in_atmosphere] - np.cross([0.0, 0.0, omega_earth], r);
+    norm_v_rel = np.linalg.norm(v_rel, axis=1);
+    #
+    # Density from the Jacchia 71 model, which works in km and degrees and
+    # returns log10 of the density in kg/m^3
+    #
+    RA_sat = np.rad2deg(np.arctan2(r[:, 1], r[:, 0]));
+    latitude_sat = np.rad2deg(np.arcsin(sin_latitude[in_atmosphere]));
+    Z = altitude[in_atmosphere]/1000.0;
+    #
+    if density_model is None:
+        log_density = jacchia_71_gill_density(RA_sat, None, Z, None, latitude_sat, None,\
+                      None, None, None, jacchia_71_gill_tabulated_SD_values(),\
+                      jacchia_71_gill_tabulated_helium_values(), context=context);
+    else:
+        log_density = density_model(RA_sat, context.RA_sun, Z, context.declination_sun,\
+                                    latitude_sat, context.jday, context.F_10p7_current,\
+                                    context.F_10p7_bar, context.K_p);
+    #
+    rho = 10**np.asarray(log_density); # kg/m^3
+    #
+    accel_drag_ECIF[in_atmosphere] = -0.5*(rho*ballistic_coeff[in_atmosphere]*\
+                                     norm_v_rel)[:, None]*v_rel;
+    #
+    return accel_drag_ECIF
+
+#
+# Test function: without space weather in the context, the direct model must
+# raise, while a density model that does not need it runs
+#
+if __name__ == '__main__':
+    #
+    from epoch_context import EpochContext
+    #
+    context = EpochContext(2458000.5, np.array([1.496e11, 0.0, 0.0]), np.array([0.0, 3.84e8, 0.0]));
+    #
+    rECIF_array = np.array([[6778137.0, 0.0, 0.0], [0.0, 0.0, 9378137.0]]);
+    vECIF_array = np.array([[0.0, 7668.0, 0.0], [6519.0, 0.0, 0.0]]);
+    #
+    try:
+        atmospheric_drag_acceleration(rECIF_array, vECIF_array, 0.01, context);
+        raise AssertionError('The direct model ran without space weather')
+    except ValueError:
+        pass
+    #
+    # Exponential atmosphere with a 60 km scale height above 400 km
+    #
+    def exponential_density(RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday,\
+                            F_10p7_current, F_10p7_bar, K_p):
+        return np.log10(3.0e-12) - (Z - 400.0)/60.0/np.log(10.0)
+    #
+    accel_drag_ECIF = atmospheric_drag_acceleration(rECIF_array, vECIF_array, 0.01, context,\
+                                                    density_model=exponential_density);
+    #
+    v_rel = vECIF_array[0] - np.cross([0.0, 0.0, 7.292115e-5], rECIF_array[0]);
+    accel_expected = -0.5*3.0e-12*0.01*np.linalg.norm(v_rel)*v_rel;
+    #
+    assert np.allclose(accel_drag_ECIF[0], accel_expected, rtol=1.0e-12, atol=0.0)
+    assert np.all(accel_drag_ECIF[1] == 0.0)
+    print('Drag without space weather through a density model:', accel_drag_ECIF[0])
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+This module builds and queries a compact Chebyshev ephemeris of the Sun and the
+Moon. Calling SPICE for every epoch inside an integrator is slow: each call to
+get_Sun_and_Moon_Positions converts a date string and reads the DE430 kernel
+twice. Instead, the geocentric positions are sampled from SPICE once over a
+requested span of ephemeris time. The span is split into segments of equal
+length, and a Chebyshev polynomial is fitted to each component on each segment
+by interpolation at the Chebyshev nodes. This is the same representation as the
+JPL kernels themselves. The coefficients are saved to a small binary .npz file.
+
+ChebyshevEphemeris loads that file and evaluates positions and velocities at
+arrays of epochs with the Clenshaw recurrence. Velocities come from the
+analytic derivative of the same polynomials. No SPICE calls are made after the
+file is built, and spiceypy is only imported by build_chebyshev_ephemeris.
+
+The accuracy depends on segment_length and num_coeff. fit_error in the file
+holds, per body, the largest position difference (km) to SPICE found at the
+midpoints between the nodes, and should be checked after a build.
+
+Functions:
+    fit_chebyshev_segments(position_fn, et_start, et_end, segment_length,
+        num_coeff): Fit the segments to position_fn, a function returning the
+        (n,3) positions at an array of n epochs. Returns the (num_segments,
+        num_coeff, 3) coefficient array and the largest fit error.
+
+    build_chebyshev_ephemeris(file_path, et_start, et_end, bodies,
+        segment_length, num_coeff): Sample the geocentric J2000 positions of
+        bodies from SPICE (the kernels must already be furnished), fit them and
+        write file_path, which should end in '.npz'. Returns the loaded
+        ChebyshevEphemeris.
+
+    ChebyshevEphemeris(file_path): position(body, et) and velocity(body, et)
+        return the (n,3) J2000 position (km) and velocity (km/s) of body
+        ('Sun' or 'Moon') at the ephemeris times et (TDB seconds past J2000),
+        or a (3,) array for a scalar et. Epochs outside of the fitted span
+        raise a ValueError.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from numpy.polynomial import chebyshev
+
+def _clenshaw(coeff, x):
+    #
+    # Evaluate sum_k coeff[..., k, :]*T_k(x) for every sample, where coeff has
+    # shape (n, K, 3) and x has shape (n,)
+    #
+    b_next = np.zeros((coeff.shape[0], 3));
+    b_next_next = np.zeros((coeff.shape[0], 3));
+    two_x = 2.0*x[:, None];
+    #
+    for k in range(coeff.shape[1] - 1, 0, -1):
+        b_next, b_next_next = coeff[:, k] + two_x*b_next - b_next_next, b_next;
+    #
+    return coeff[:, 0] + 0.5*two_x*b_next - b_next_next
+
+class ChebyshevEphemeris():
+    #
+    def __init__(self, file_path):
+        #
+        with np.load(file_path) as ephemeris_file:
+            self.bodies = [str(body) for body in ephemeris_file['bodies']];
+            self.coefficients = ephemeris_file['coefficients'];
+            self.et_start = float(ephemeris_file['et_start']);
+            self.segment_length = float(ephemeris_file['segment_length']);
+            self.fit_error = ephemeris_file['fit_error'];
+        #
+        self.num_segments = self.coefficients.shape[1];
+        self.et_end = self.et_start + self.num_segments*self.segment_length;
+        #
+        # Coefficients of the time derivative, in km/s
+        #
+        self.velocity_coefficients = chebyshev.chebder(self.coefficients, axis=2)*\
+        (2.0/self.segment_length);
+    #
+    def _segment(self, et):
+        #
+        # Segment index and scaled time in [-1, 1] for every epoch
+        #
+        if np.any(et < self.et_start) or np.any(et > self.et_end):
+            raise ValueError('Epoch outside of the span of the Chebyshev ephemeris')
+        #
+        segment_index = np.minimum(np.floor((et - self.et_start)/self.segment_length).astype(int),\
+                                   self.num_segments - 1);
+        segment_start = self.et_start + segment_index*self.segment_length;
+        x = 2.0*(et - segment_start)/self.segment_length - 1.0;
+        #
+        return segment_index, x
+    #
+    def _evaluate(self, coefficients, body, et):
+        #
+        et = np.asarray(et, dtype=float);
+        segment_index, x = self._segment(np.atleast_1d(et));
+        #
+        body_coefficients = coefficients[self.bodies.index(body.upper())];
+        result = _clenshaw(body_coefficients[segment_index], x);
+        #
+        if et.ndim == 0:
+            return result[0]
+        #
+        return result
+    #
+    def position(self, body, et):
+        return self._evaluate(self.coefficients, body, et)
+    #
+    def velocity(self, body, et):
+        return self._evaluate(self.velocity_coefficients, body, et)
+
+def fit_chebyshev_segments(position_fn, et_start, et_end, segment_length=4.0*86400.0,\
+                           num_coeff=14):
+    #
+    num_segments = int(np.ceil((et_end - et_start)/segment_length));
+    #
+    # Chebyshev nodes of the first kind on [-1, 1] and the segment midpoints
+    # between them used to measure the fit error
+    #
+    nodes = np.cos(np.pi*(np.arange(num_coeff) + 0.5)/num_coeff);
+    checks = 0.5*(nodes[1:] + nodes[:-1]);
+    #
+    segment_starts = et_start + segment_length*np.arange(num_segments);
+    et_nodes = (segment_starts[:, None] + 0.5*segment_length*(nodes + 1.0)).ravel();
+    et_checks = (segment_starts[:, None] + 0.5*segment_length*(checks + 1.0)).ravel();
+    #
+    # Sample every segment in one call of position_fn
+    #
+    r_nodes = np.asarray(position_fn(et_nodes), dtype=float).reshape(num_segments,\
+                                                                       num_coeff, 3);
+    #
+    coefficients = np.zeros((num_segments, num_coeff, 3));
+    for i in range(0, num_segments):
+        coefficients[i] = chebyshev.chebfit(nodes, r_nodes[i], num_coeff - 1);
+    #
+    r_checks = np.asarray(position_fn(et_checks), dtype=float).reshape(num_segments,\
+                                                                         num_coeff - 1, 3);
+    r_fit = np.stack([chebyshev.chebval(checks, coefficients[i]).T\
+                      for i in range(0, num_segments)]);
+    fit_error = np.max(np.linalg.norm(r_fit - r_checks, axis=-1));
+    #
+    return coefficients, fit_error
+
+def build_chebyshev_ephemeris(file_path, et_start, et_end, bodies=('Sun', 'Moon'),\
+                              segment_length=4.0*86400.0, num_coeff=14):
+    #
+    # spiceypy is only needed to build the file
+    #
+    import spiceypy as spice
+    #
+    coefficients = [];
+    fit_error = [];
+    #
+    for body in bodies:
+        #
+        def position_fn(et_array, body=body):
+            positions, light_times = spice.spkpos(body, et_array, 'J2000', 'NONE', 'Earth');
+            return positions
+        #
+        body_coefficients, body_fit_error = fit_chebyshev_segments(position_fn, et_start,\
+                                            et_end, segment_length, num_coeff);
+        coefficients.append(body_coefficients);
+        fit_error.append(body_fit_error);
+    #
+    np.savez(file_path, bodies=np.array([body.upper() for body in bodies]),\
+             coefficients=np.array(coefficients), et_start=et_start,\
+             segment_length=segment_length, fit_error=np.array(fit_error));
+    #
+    return ChebyshevEphemeris(file_path)
+
+#
+# Test function: fit the analytic Sun and Moon series over 60 days, then check
+# the positions at random epochs between the nodes against the series and the
+# velocities against central differences of the series. spiceypy is not needed
+#
+if __name__ == '__main__':
+    #
+    import os
+    import tempfile
+    from analytic_Sun_and_Moon_Positions import analytic_Sun_and_Moon_Positions
+    #
+    et_start = 2.0e8;
+    et_end = et_start + 60.0*86400.0;
+    #
+    position_fns = {'Sun': lambda et: analytic_Sun_and_Moon_Positions(2451545.0 + et/86400.0)[1],\
+                    'Moon': lambda et: analytic_Sun_and_Moon_Positions(2451545.0 + et/86400.0)[0]};
+    #
+    fits = [fit_chebyshev_segments(position_fns[body], et_start, et_end) for body in ('Sun', 'Moon')];
+    #
+    file_path = os.path.join(tempfile.mkdtemp(), 'analytic_ephemeris.npz');
+    np.savez(file_path, bodies=np.array(['SUN', 'MOON']),\
+             coefficients=np.array([fit[0] for fit in fits]), et_start=et_start,\
+             segment_length=4.0*86400.0, fit_error=np.array([fit[1] for fit in fits]));
+    ephemeris = ChebyshevEphemeris(file_path);
+    #
+    et = np.random.default_rng(15).uniform(et_start, et_end, 1000);
+    #
+    # The series take Julian days, which resolve time to about 4e-5 s, so the
+    # central differences themselves are only good to about 2e-7 at this step
+    #
+    step = 100.0; # s
+    #
+    for body, fit_error in zip(('Sun', 'Moon'), ephemeris.fit_error):
+        #
+        position_error = np.max(np.linalg.norm(ephemeris.position(body, et) -\
+                                               position_fns[body](et), axis=1));
+        #
+        v_central_differences = (position_fns[body](et + step) - position_fns[body](et - step))/\
+                                (2.0*step);
+        velocity_error = np.max(np.linalg.norm(ephemeris.velocity(body, et) -\
+                                v_central_differences, axis=1)/\
+                                np.linalg.norm(v_central_differences, axis=1));
+        #
+        assert position_error < 2.0*fit_error and velocity_error < 1.0e-6,\
+        (position_error, fit_error, velocity_error)
+        print(body, 'fit error (km)', fit_error, 'position error at random epochs (km)',\
+              position_error, 'relative velocity error', velocity_error)
+    #
+    assert ephemeris.position('Sun', et_start + 1.0).shape == (3,)
+    try:
+        ephemeris.position('Sun', et_end + 10.0);
+        raise AssertionError('Epoch outside of the span was accepted')
+    except ValueError:
+        pass
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+This class caches the Jacchia 71/Gill atmospheric density over quantized
+space-time buckets. Objects in the same altitude shell at the same time often
+fall in the same bucket, so the density only has to be computed once for all of
+them. Each sample is mapped to the integer key
+
+    (epoch bucket, altitude bucket, latitude bucket, local solar time bucket,
+     F_10.7 bucket, F_10.7 average bucket, K_p bucket)
+
+The local solar time is taken as the hour angle RA_sat - RA_sun (degrees). The
+epoch, altitude, latitude and local time are floored into their buckets, while
+F_10.7, its average and K_p are rounded to the nearest bucket. With the default
+steps, whole F_10.7 values and K_p in thirds (as published) are therefore kept
+exactly. On a miss, the density is computed with jacchia_71_gill_density at
+the center of the bucket (at the rounded value for the space weather), so
+every sample in a bucket gets the same value no matter which sample caused the
+miss. The Sun's right ascension and declination are taken from the
+sample that caused the miss. They change by less than 0.05 degrees per hour, so
+this is well within the error of the quantization for epoch steps of an hour or
+less. All misses of a call are evaluated together in one vectorized call.
+
+The error introduced is that of evaluating the model up to half a bucket away
+from the true point. For published space weather values it comes from the
+position and epoch steps. With the default steps, the altitude step dominates
+(up to about 9 % density error, 2 % RMS, over 200-1000 km), followed by the
+local time step (up to about 7 %, 1.5 % RMS), for a total of up to about 11 %
+(2.6 % RMS). Space weather values between
+the steps add up to half a step of error. The error can be reduced by making
+the steps smaller at the cost of fewer hits.
+
+The number of entries is bounded by max_entries. When the cache is full, the
+least recently used entry is evicted. The counters report how well the cache
+performs: hits and misses count samples (a sample is a miss when its bucket was
+not yet cached at the start of the call), evaluations counts the buckets the
+model was run for, and evictions the entries dropped. misses/evaluations is the
+number of samples served per model evaluation.
+
+Inputs:
+    max_entries: Largest number of buckets held in memory
+    epoch_step: Width of the epoch buckets (days)
+    altitude_step: Width of the altitude buckets (km)
+    latitude_step: Width of the latitude buckets (degrees)
+    local_time_step: Width of the local solar time (hour angle) buckets (degrees)
+    F_10p7_step: Width of the F_10.7 and F_10.7 average buckets
+    K_p_step: Width of the K_p buckets
+
+Outputs:
+    Calling the object with the arguments of jacchia_71_gill_density (without
+    the tables) returns the cached log-density, with the broadcast shape of the
+    inputs (a float if all of the inputs are scalars)
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import collections
+import numpy as np
+from jacchia_71_gill_density import jacchia_71_gill_density
+from jacchia_71_gill_tabulated_SD_values import jacchia_71_gill_tabulated_SD_values
+from jacchia_71_gill_tabulated_helium_values import jacchia_71_gill_tabulated_helium_values
+
+class DensityCache():
+    #
+    def __init__(self, max_entries=100000, epoch_step=1.0/24.0, altitude_step=5.0,\
+                 latitude_step=2.0, local_time_step=7.5, F_10p7_step=1.0,\
+                 K_p_step=1.0/3.0):
+        #
+        self.max_entries = max_entries;
+        self.steps = np.array([epoch_step, altitude_step, latitude_step,\
+                               local_time_step, F_10p7_step, F_10p7_step, K_p_step]);
+        self.rounded = np.array([False, False, False, False, True, True, True]);
+        #
+        self.c_ij_array = jacchia_71_gill_tabulated_SD_values();
+        self.h_ij_array = jacchia_71_gill_tabulated_helium_values();
+        #
+        self.entries = collections.OrderedDict();
+        self.reset_statistics();
+    #
+    def reset_statistics(self):
+        #
+        self.hits = 0;
+        self.misses = 0;
+        self.evaluations = 0;
+        self.evictions = 0;
+    #
+    def clear(self):
+        #
+        self.entries.clear();
+    #
+    def __len__(self):
+        return len(self.entries)
+    #
+    def __call__(self, RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday,\
+                 F_10p7_current, F_10p7_bar, K_p):
+        #
+        RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday, F_10p7_current,\
+        F_10p7_bar, K_p = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in\
+        (RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday, F_10p7_current,\
+         F_10p7_bar, K_p)]);
+        #
+        shape = Z.shape;
+        #
+        # Quantize every sample, with the hour angle wrapped into [0, 360)
+        #
+        hour_angle = (RA_sat - RA_sun)%360.0;
+        #
+        values = np.stack([jday.ravel(), Z.ravel(), latitude_sat.ravel(), hour_angle.ravel(),\
+                           F_10p7_current.ravel(), F_10p7_bar.ravel(), K_p.ravel()], axis=-1);
+        #
+        # Positions and epochs are floored into buckets, while the space weather
+        # is rounded to the nearest bucket so that whole F_10.7 values and K_p
+        # in thirds are used exactly
+        #
+        bucket_array = np.where(self.rounded, np.round(values/self.steps),\
+                                np.floor(values/self.steps)).astype(np.int64);
+        #
+        # Look each distinct bucket up once
+        #
+        unique_buckets, first_sample, inverse = np.unique(bucket_array, axis=0,\
+                                                          return_index=True,\
+                                                          return_inverse=True);
+        inverse = inverse.reshape(-1);
+        samples_per_bucket = np.bincount(inverse, minlength=len(unique_buckets));
+        #
+        log_density_unique = np.empty(len(unique_buckets));
+        missed = [];
+        #
+        for i, bucket in enumerate(unique_buckets):
+            key = tuple(bucket.tolist());
+            if key in self.entries:
+                self.entries.move_to_end(key);
+                log_density_unique[i] = self.entries[key];
+            else:
+                missed.append(i);
+        #
+        # Count the hits and misses per sample
+        #
+        num_missed_samples = int(np.sum(samples_per_bucket[missed]));
+        self.hits += len(inverse) - num_missed_samples;
+        self.misses += num_missed_samples;
+        self.evaluations += len(missed);
+        #
+        # Evaluate the model at the center of every missed bucket in one call
+        #
+        if missed:
+            #
+            missed = np.array(missed);
+            centers = (unique_buckets[missed] + np.where(self.rounded, 0.0, 0.5))*self.steps;
+            #
+            RA_sun_missed = RA_sun.ravel()[first_sample[missed]];
+            declination_sun_missed = declination_sun.ravel()[first_sample[missed]];
+            #
+            log_density_missed = np.atleast_1d(jacchia_71_gill_density(\
+            RA_sun_missed + centers[:, 3], RA_sun_missed, centers[:, 1],\
+            declination_sun_missed, centers[:, 2], centers[:, 0], centers[:, 4],\
+            centers[:, 5], centers[:, 6], self.c_ij_array, self.h_ij_array));
+            #
+            log_density_unique[missed] = log_density_missed;
+            #
+            for i, log_density in zip(missed, log_density_missed):
+                self.entries[tuple(unique_buckets[i].tolist())] = float(log_density);
+            #
+            # Evict the least recently used buckets
+            #
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False);
+                self.evictions += 1;
+        #
+        log_density = log_density_unique[inverse].reshape(shape);
+        #
+        # Keep returning a plain float for scalar inputs
+        #
+        if log_density.ndim == 0:
+            return float(log_density)
+        #
+        return log_density
+
+#
+# Test function: with whole F_10.7 values and K_p in thirds, the cached density
+# must match the direct model when only the space weather is bucketed, and
+# stay within the quantization error with the default steps
+#
+if __name__ == '__main__':
+    #
+    rng = np.random.default_rng(11);
+    num_samples = 20000;
+    #
+    sample_args = (rng.uniform(0.0, 360.0, num_samples), np.full(num_samples, 190.0),\
+                   rng.uniform(200.0, 1000.0, num_samples), np.full(num_samples, -5.0),\
+                   rng.uniform(-80.0, 80.0, num_samples),\
+                   2458000.5 + rng.uniform(0.0, 1.0, num_samples),\
+                   rng.integers(65, 250, num_samples).astype(float),\
+                   rng.integers(65, 200, num_samples).astype(float),\
+                   rng.integers(0, 28, num_samples)/3.0);
+    #
+    log_density_direct = jacchia_71_gill_density(*sample_args, jacchia_71_gill_tabulated_SD_values(),\
+                         jacchia_71_gill_tabulated_helium_values());
+    #
+    space_weather_cache = DensityCache(epoch_step=1.0e-8, altitude_step=1.0e-6,\
+                                       latitude_step=1.0e-6, local_time_step=1.0e-6);
+    space_weather_error = np.max(np.abs(10**(space_weather_cache(*sample_args) -\
+                                             log_density_direct) - 1.0));
+    assert space_weather_error < 1.0e-6, space_weather_error
+    #
+    default_cache = DensityCache();
+    default_error = np.abs(10**(default_cache(*sample_args) - log_density_direct) - 1.0);
+    assert default_error.max() < 0.15, default_error.max()
+    #
+    print('Relative density error from the space weather buckets:', space_weather_error)
+    print('Relative density error with the default steps: max', default_error.max(),\
+          'RMS', np.sqrt(np.mean(default_error**2)))
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+This module precomputes the Jacchia 71/Gill atmospheric density over a date
+range and serves it back by interpolation. It is meant for sensitivity studies
+that re-run many propagations over the same historical window. The analytic
+model and the space weather inputs are then only needed once, when the cube is
+built.
+
+For every hour of the date range, build_density_cube evaluates
+jacchia_71_gill_density on a global grid of altitude, geographic latitude and
+local solar time. The local solar time is the hour angle RA_sat - RA_sun in
+degrees. The log-densities are written to a memory-mapped .npy file of shape
+(hour, altitude, latitude, local time). The axes are written next to it in a
+small _index.npz header.
+
+The per-epoch inputs come from context_fn, a function of the Julian day that
+returns an EpochContext carrying the F_10.7 values and K_p of that epoch. A
+typical context_fn looks the space weather up in a stored table and builds the
+context with EpochContext.from_date, or directly from stored Sun positions.
+
+DensityCube memory-maps a cube. Queries use vectorized linear interpolation of
+the log-density in time, altitude, latitude and local time, with the local time
+axis wrapping around.
+
+Functions:
+    build_density_cube(cube_path, jday_start, num_hours, altitudes, context_fn,
+        num_latitude, num_local_time): Build the cube and write '<cube_path>.npy'
+        and '<cube_path>_index.npz'. altitudes is an increasing array of
+        altitudes (km). Returns the loaded DensityCube.
+
+    DensityCube(cube_path): Called with the arguments of
+        jacchia_71_gill_density without the tables (RA_sat, RA_sun, Z,
+        declination_sun, latitude_sat, jday, F_10p7_current, F_10p7_bar, K_p),
+        it returns the interpolated log-density with the broadcast shape of the
+        inputs (a float if all of the inputs are scalars). Only RA_sat, RA_sun,
+        Z (km), latitude_sat and jday are used; the declination of the Sun and
+        the space weather are those of the cube. A cube can therefore be given
+        as the density_model of atmospheric_drag_acceleration. Epochs or
+        altitudes outside of the cube raise a ValueError.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import itertools
+import numpy as np
+from jacchia_71_gill_density import jacchia_71_gill_density
+from jacchia_71_gill_tabulated_SD_values import jacchia_71_gill_tabulated_SD_values
+from jacchia_71_gill_tabulated_helium_values import jacchia_71_gill_tabulated_helium_values
+
+class DensityCube():
+    #
+    def __init__(self, cube_path):
+        #
+        self.log_density_cube = np.load(cube_path + '.npy', mmap_mode='r');
+        #
+        with np.load(cube_path + '_index.npz') as header:
+            self.jday_start = float(header['jday_start']);
+            self.jday_step = float(header['jday_step']);
+            self.altitudes = header['altitudes'];
+            self.latitudes = header['latitudes'];
+            self.local_times = header['local_times'];
+        #
+        self.num_hours = self.log_density_cube.shape[0];
+        self.jday_end = self.jday_start + (self.num_hours - 1)*self.jday_step;
+        self.latitude_step = self.latitudes[1] - self.latitudes[0];
+        self.local_time_step = self.local_times[1] - self.local_times[0];
+    #
+    def __call__(self, RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday,\
+                 F_10p7_current=None, F_10p7_bar=None, K_p=None):
+        #
+        # The arguments are those of jacchia_71_gill_density and DensityCache.
+        # The Sun's declination and the space weather are already in the cube
+        # and are ignored
+        #
+        RA_sat, RA_sun, Z, latitude_sat, jday = np.broadcast_arrays(*[np.asarray(value,\
+        dtype=float) for value in (RA_sat, RA_sun, Z, latitude_sat, jday)]);
+        #
+        if np.any(jday < self.jday_start) or np.any(jday > self.jday_end):
+            raise ValueError('Epoch outside of the date range of the density cube')
+        if np.any(Z < self.altitudes[0]) or np.any(Z > self.altitudes[-1]):
+            raise ValueError('Altitude outside of the range of the density cube')
+        #
+        # Find the lower grid node and the fractional position along each axis
+        #
+        hour_index = (jday - self.jday_start)/self.jday_step;
+        i_hour = np.clip(np.floor(hour_index).astype(int), 0, max(self.num_hours - 2, 0));
+        t_hour = hour_index - i_hour;
+        i_hour_next = np.minimum(i_hour + 1, self.num_hours - 1);
+        #
+        i_Z = np.clip(np.searchsorted(self.altitudes, Z) - 1, 0, len(self.altitudes) - 2);
+        t_Z = (Z - self.altitudes[i_Z])/(self.altitudes[i_Z + 1] - self.altitudes[i_Z]);
+        #
+        latitude_index = (latitude_sat - self.latitudes[0])/self.latitude_step;
+        i_lat = np.clip(np.floor(latitude_index).astype(int), 0, len(self.latitudes) - 2);
+        t_lat = latitude_index - i_lat;
+        #
+        local_time = (RA_sat - RA_sun)%360.0;
+        local_time_index = (local_time - self.local_times[0])/self.local_time_step;
+        i_lt = np.floor(local_time_index).astype(int)%len(self.local_times);
+        t_lt = local_time_index - np.floor(local_time_index);
+        i_lt_next = (i_lt + 1)%len(self.local_times);
+        #
+        corners = (((i_hour, 1.0 - t_hour), (i_hour_next, t_hour)),\
+                   ((i_Z, 1.0 - t_Z), (i_Z + 1, t_Z)),\
+                   ((i_lat, 1.0 - t_lat), (i_lat + 1, t_lat)),\
+                   ((i_lt, 1.0 - t_lt), (i_lt_next, t_lt)));
+        #
+        log_density = np.zeros(Z.shape);
+        #
+        for (i_0, w_0), (i_1, w_1), (i_2, w_2), (i_3, w_3) in itertools.product(*corners):
+            log_density += w_0*w_1*w_2*w_3*self.log_density_cube[i_0, i_1, i_2, i_3];
+        #
+        # Keep returning a plain float for scalar inputs
+        #
+        if log_density.ndim == 0:
+            return float(log_density)
+        #
+        return log_density
+
+def build_density_cube(cube_path, jday_start, num_hours, altitudes, context_fn,\
+                       num_latitude=91, num_local_time=48):
+    #
+    jday_step = 1.0/24.0;
+    altitudes = np.asarray(altitudes, dtype=float);
+    latitudes = np.linspace(-90.0, 90.0, num_latitude);
+    local_times = np.linspace(0.0, 360.0, num_local_time, endpoint=False);
+    #
+    c_ij_array = jacchia_71_gill_tabulated_SD_values();
+    h_ij_array = jacchia_71_gill_tabulated_helium_values();
+    #
+    log_density_cube = np.lib.format.open_memmap(cube_path + '.npy', mode='w+',\
+                       shape=(num_hours, len(altitudes), num_latitude, num_local_time));
+    #
+    Z_mesh, latitude_mesh, local_time_mesh = np.meshgrid(altitudes, latitudes,\
+                                                         local_times, indexing='ij');
+    #
+    # Fill the cube one hour at a time, sharing the epoch context over the grid
+    #
+    for i_hour in range(0, num_hours):
+        #
+        jday = jday_start + i_hour*jday_step;
+        context = context_fn(jday);
+        #
+        log_density_cube[i_hour] = jacchia_71_gill_density(context.RA_sun + local_time_mesh,\
+                                   None, Z_mesh, None, latitude_mesh, None, None, None,\
+                                   None, c_ij_array, h_ij_array, context=context);
+    #
+    log_density_cube.flush();
+    del log_density_cube;
+    #
+    np.savez(cube_path + '_index.npz', jday_start=jday_start, jday_step=jday_step,\
+             altitudes=altitudes, latitudes=latitudes, local_times=local_times);
+    #
+    return DensityCube(cube_path)
+
+#
+# Test function: build a three hour cube from the analytic Sun position, then
+# run the drag model with the cube and with the direct model half way between
+# two hours. The drag must agree within the interpolation error of the cube
+#
+if __name__ == '__main__':
+    #
+    import os
+    import tempfile
+    from analytic_Sun_and_Moon_Positions import analytic_Sun_and_Moon_Positions
+    from epoch_context import EpochContext
+    from atmospheric_drag_acceleration import atmospheric_drag_acceleration
+    #
+    def context_fn(jday):
+        rECIF_Moon, rECIF_Sun, vECIF_Moon, vECIF_Sun = analytic_Sun_and_Moon_Positions(jday);
+        return EpochContext(jday, 1000.0*rECIF_Sun, 1000.0*rECIF_Moon, 150.0, 140.0, 3.0)
+    #
+    jday_start = 2458000.5;
+    density_cube = build_density_cube(os.path.join(tempfile.mkdtemp(), 'test_cube'), jday_start,\
+                   3, np.arange(300.0, 610.0, 10.0), context_fn);
+    #
+    context = context_fn(jday_start + 1.5/24.0);
+    #
+    rng = np.random.default_rng(12);
+    num_sat = 500;
+    directions = rng.normal(size=(num_sat, 3));
+    directions = directions/np.linalg.norm(directions, axis=1)[:, None];
+    rECIF_array = directions*(6378137.0 + rng.uniform(320.0e3, 580.0e3, num_sat))[:, None];
+    vECIF_array = 7600.0*np.cross(directions, rng.normal(size=(num_sat, 3)));
+    vECIF_array = 7600.0*vECIF_array/np.linalg.norm(vECIF_array, axis=1)[:, None];
+    #
+    accel_direct = atmospheric_drag_acceleration(rECIF_array, vECIF_array, 0.01, context);
+    accel_cube = atmospheric_drag_acceleration(rECIF_array, vECIF_array, 0.01, context,\
+                                               density_model=density_cube);
+    drag_error = np.max(np.linalg.norm(accel_cube - accel_direct, axis=1)/\
+                        np.linalg.norm(accel_direct, axis=1));
+    #
+    # Interpolation error of the cube itself, measured at the same epoch over
+    # random points of the grid
+    #
+    RA_sat = rng.uniform(0.0, 360.0, 5000);
+    Z = rng.uniform(300.0, 600.0, 5000);
+    latitude_sat = rng.uniform(-90.0, 90.0, 5000);
+    interpolation_error = np.max(np.abs(10**(density_cube(RA_sat, context.RA_sun, Z,\
+                          context.declination_sun, latitude_sat, context.jday) -\
+                          jacchia_71_gill_density(RA_sat, None, Z, None, latitude_sat, None,\
+                          None, None, None, jacchia_71_gill_tabulated_SD_values(),\
+                          jacchia_71_gill_tabulated_helium_values(), context=context)) - 1.0));
+    #
+    assert drag_error <= interpolation_error < 0.05, (drag_error, interpolation_error)
+    print('Relative drag difference, cube vs direct:', drag_error,\
+          'cube interpolation error:', interpolation_error)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+This class precomputes the eclipse intervals of one satellite along a
+trajectory, so that the illuminated fraction nu can be looked up instead of
+running the occultation geometry of shadow_function at every force call. A
+satellite is in full sun for most of each orbit, and nu only has to be
+computed from the geometry inside the short penumbra passages.
+
+With the angles a, b and c of shadow_geometry, the shadow of each body (Earth
+and Moon) is bounded by the contact functions
+
+    outer contact: g_outer = c - (a + b)    (negative inside the penumbra)
+    inner contact: g_inner = c - |b - a|    (negative inside the umbra, or the
+                                             annular zone when a > b)
+
+The trajectory is sampled every step seconds between t_start and t_end. Every
+sign change of a contact function between two samples is refined by bisection
+to time_tolerance. The times of all the roots are sorted into event_times, and
+the segment between two events is classified once at its midpoint as full sun
+(nu = 1), umbra (nu = 0) or penumbra (nu from the geometry). A lookup is then a
+binary search of event_times, O(log n). Shadow passages shorter than step can
+be missed, so step should be well below the shortest passage expected (a few
+minutes covers Earth eclipses in LEO; Moon penumbra passages can be shorter).
+
+The trajectory is given by state_fn, a function of an array of times t (s)
+returning the (n,3) satellite, Sun and Moon positions in the ITRF reference
+system (m). It may be an interpolated ephemeris or a coarse predicted orbit.
+
+Inputs:
+    t_start: Start of the trajectory (s)
+    t_end: End of the trajectory (s)
+    state_fn: Function returning rECEF_array, r_sunECEF, r_moonECEF at times t
+    step: Sampling step of the scan (s)
+    time_tolerance: Accuracy of the event times (s)
+
+Outputs:
+    Calling the object with an array of times t returns the (n,) array of nu.
+    The positions at t may be passed as rECEF_array, r_sunECEF and r_moonECEF;
+    otherwise state_fn is called for the times that fall in a penumbra segment.
+    geometry_evaluations counts the samples for which the geometry was run.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from shadow_function import shadow_function, shadow_geometry, R_earth, R_moon
+
+FULL_SUN = 1;
+PENUMBRA = -1;
+UMBRA = 0;
+
+class EclipseIntervalIndex():
+    #
+    def __init__(self, t_start, t_end, state_fn, step=60.0, time_tolerance=1.0e-3):
+        #
+        self.t_start = t_start;
+        self.t_end = t_end;
+        self.state_fn = state_fn;
+        #
+        # Sample the contact functions along the trajectory
+        #
+        num_samples = int(np.ceil((t_end - t_start)/step)) + 1;
+        t_samples = np.linspace(t_start, t_end, num_samples);
+        g_samples = self._contact_functions(t_samples)[0];
+        #
+        # Bracket every sign change and refine all of them together by bisection
+        #
+        bracket_index, function_index = np.nonzero(np.signbit(g_samples[:-1]) !=\
+                                                   np.signbit(g_samples[1:]));
+        t_low = t_samples[bracket_index];
+        t_high = t_samples[bracket_index + 1];
+        g_low = g_samples[bracket_index, function_index];
+        #
+        sample_step = t_samples[1] - t_samples[0];
+        num_bisections = max(int(np.ceil(np.log2(sample_step/time_tolerance))), 0);
+        #
+        for i in range(0, num_bisections if len(t_low) > 0 else 0):
+            #
+            t_mid = 0.5*(t_low + t_high);
+            g_mid = self._contact_functions(t_mid)[0][np.arange(len(t_mid)), function_index];
+            #
+            same_sign = np.signbit(g_mid) == np.signbit(g_low);
+            t_low = np.where(same_sign, t_mid, t_low);
+            g_low = np.where(same_sign, g_mid, g_low);
+            t_high = np.where(same_sign, t_high, t_mid);
+        #
+        self.event_times = np.unique(0.5*(t_low + t_high));
+        #
+        # Classify each segment between events at its midpoint. The first and
+        # last segments are taken at the ends of the trajectory
+        #
+        boundaries = np.concatenate(([t_start], self.event_times, [t_end]));
+        self.segment_state = self._classify(0.5*(boundaries[:-1] + boundaries[1:]));
+        #
+        self.geometry_evaluations = 0;
+    #
+    def _contact_functions(self, t):
+        #
+        # (n,4) array of g_outer and g_inner of the Earth and of the Moon, and
+        # (n,2) array telling whether each body looks larger than the Sun
+        #
+        rECEF_array, r_sunECEF, r_moonECEF = self.state_fn(t);
+        #
+        g = [];
+        body_larger = [];
+        for r_bodyECEF, R_body in ((np.zeros(3), R_earth), (r_moonECEF, R_moon)):
+            a, b, c = shadow_geometry(rECEF_array, r_sunECEF, r_bodyECEF, R_body);
+            g.append(c - (a + b));
+            g.append(c - np.abs(b - a));
+            body_larger.append(b > a);
+        #
+        return np.stack(g, axis=-1), np.stack(body_larger, axis=-1)
+    #
+    def _classify(self, t):
+        #
+        g, body_larger = self._contact_functions(t);
+        #
+        state = np.full(len(t), FULL_SUN);
+        state[np.any(g[:, [0, 2]] < 0.0, axis=1)] = PENUMBRA;
+        #
+        # Inside an inner contact the satellite is in umbra, unless the body
+        # looks smaller than the Sun (annular), which still needs the geometry
+        #
+        state[np.any((g[:, [1, 3]] < 0.0) & body_larger, axis=1)] = UMBRA;
+        #
+        return state
+    #
+    def state(self, t):
+        #
+        # FULL_SUN, PENUMBRA or UMBRA for every time in t
+        #
+        return self.segment_state[np.searchsorted(self.event_times, t, side='right')]
+    #
+    def __call__(self, t, rECEF_array=None, r_sunECEF=None, r_moonECEF=None):
+        #
+        t = np.atleast_1d(np.asarray(t, dtype=float));
+        #
+        if np.any(t < self.t_start) or np.any(t > self.t_end):
+            raise ValueError('Time outside of the span of the eclipse interval index')
+        #
+        state = self.state(t);
+        nu = np.where(state == UMBRA, 0.0, 1.0);
+        #
+        # Run the geometry only for the times inside a penumbra segment
+        #
+        in_penumbra = state == PENUMBRA;
+        #
+        if np.any(in_penumbra):
+            #
+            if rECEF_array is None:
+                rECEF_array, r_sunECEF, r_moonECEF = self.state_fn(t[in_penumbra]);
+            else:
+                rECEF_array = np.atleast_2d(rECEF_array)[in_penumbra];
+                r_sunECEF = np.asarray(r_sunECEF, dtype=float);
+                r_moonECEF = np.asarray(r_moonECEF, dtype=float);
+                if r_sunECEF.ndim == 2:
+                    r_sunECEF = r_sunECEF[in_penumbra];
+                if r_moonECEF.ndim == 2:
+                    r_moonECEF = r_moonECEF[in_penumbra];
+            #
+            nu[in_penumbra] = shadow_function(rECEF_array, r_sunECEF, r_moonECEF);
+            self.geometry_evaluations += int(np.sum(in_penumbra));
+        #
+        return nu
+
+#
+# Test function: compare the looked up nu with shadow_function every second
+# over one day of a circular LEO orbit that passes through the Earth's shadow
+#
+if __name__ == '__main__':
+    #
+    r_orbit = 6.778e6; # m
+    mean_motion = np.sqrt(3.986004415e14/r_orbit**3);
+    inclination = np.deg2rad(51.6);
+    r_sunECEF = np.array([1.496e11, 0.0, 0.0]);
+    r_moonECEF = np.array([-1.0e8, 3.5e8, 0.5e8]);
+    #
+    def state_fn(t):
+        u = mean_motion*np.asarray(t);
+        rECEF_array = r_orbit*np.stack([np.cos(u), np.sin(u)*np.cos(inclination),\
+                                        np.sin(u)*np.sin(inclination)], axis=-1);
+        return rECEF_array, r_sunECEF, r_moonECEF
+    #
+    eclipse_index = EclipseIntervalIndex(0.0, 86400.0, state_fn);
+    #
+    t = np.arange(0.0, 86400.0, 1.0);
+    nu = eclipse_index(t);
+    nu_geometry = shadow_function(*state_fn(t));
+    #
+    nu_difference = np.max(np.abs(nu - nu_geometry));
+    assert nu_difference < 1.0e-12, nu_difference
+    #
+    # The geometry only runs in the penumbra passages, allowing for one sample
+    # at each event
+    #
+    geometry_fraction = eclipse_index.geometry_evaluations/len(t);
+    assert eclipse_index.geometry_evaluations <= np.sum((nu_geometry > 0.0) &\
+           (nu_geometry < 1.0)) + len(eclipse_index.event_times), geometry_fraction
+    #
+    print(len(eclipse_index.event_times), 'events, max difference of nu', nu_difference,\
+          'fraction of samples in umbra', np.mean(nu_geometry == 0.0),\
+          'fraction of samples run through the geometry', geometry_fraction)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+This class gathers the time dependent quantities that the force models need at
+a given epoch. They are computed once per epoch and then shared by every
+satellite evaluated at that epoch, which removes the redundant per-satellite
+work when a catalog is propagated on a common time grid. The context is
+accepted through the context keyword of third_body_accelerations,
+solar_radiation_pressure and jacchia_71_gill_density, and is the epoch input of
+atmospheric_drag_acceleration.
+
+The quantities held are:
+    - the Sun and Moon positions in the ECIF and ECEF frames and their norms
+    - the rotation between the ECIF and ECEF frames (Greenwich mean sidereal
+      time about the z-axis, IAU-82 as given by Vallado; precession, nutation
+      and polar motion are neglected)
+    - the right ascension and declination of the Sun (degrees)
+    - the Jacchia 71 exospheric temperature T_c and the time-only pieces of the
+      semi-annual (phi, tau_sa, g_of_t) and helium corrections
+
+Inputs:
+    jday: Julian day of the epoch (UTC, taken as UT1)
+    r_sun_ECIF: Position of the Sun in the ECIF reference frame (m)
+    r_moon_ECIF: Position of the Moon in the ECIF reference frame (m)
+    F_10p7_current: Current F_10.7 solar flux value
+    F_10p7_bar: 3-Solar cycle average of the F_10.7 solar flux value
+    K_p: Geomagnetic index taken at 6.7 hours prior to the epoch
+    The space weather values may be left out when no density is needed;
+    has_space_weather tells whether all three were given, and the density
+    models raise a ValueError when they are missing.
+
+Outputs:
+    epoch_context: EpochContext object holding the quantities listed above
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from jday import jday as jday_from_date
+from rECIF2RADEC import rECIF2RADEC
+
+class EpochContext():
+    #
+    def __init__(self, jday, r_sun_ECIF, r_moon_ECIF, F_10p7_current=None,\
+                 F_10p7_bar=None, K_p=None):
+        #
+        self.jday = jday;
+        self.MJD = jday - 2400000.5;
+        #
+        # Greenwich mean sidereal time (Vallado, IAU-82)
+        #
+        T_UT1 = (jday - 2451545.0)/36525.0;
+        GMST_sec = 67310.54841 + (876600.0*3600.0 + 8640184.812866)*T_UT1 +\
+        0.093104*T_UT1**2 - 6.2e-6*T_UT1**3;
+        self.GMST = np.deg2rad((GMST_sec%86400.0)/240.0);
+        #
+        cos_GMST = np.cos(self.GMST);
+        sin_GMST = np.sin(self.GMST);
+        #
+        self.ECIF_to_ECEF_matrix = np.array([[ cos_GMST, sin_GMST, 0.0],\
+                                             [-sin_GMST, cos_GMST, 0.0],\
+                                             [      0.0,      0.0, 1.0]]);
+        #
+        # Sun and Moon positions and their norms in both frames
+        #
+        self.r_sun_ECIF = np.asarray(r_sun_ECIF, dtype=float);
+        self.r_moon_ECIF = np.asarray(r_moon_ECIF, dtype=float);
+        #
+        self.r_sun_ECEF = self.ECIF_to_ECEF(self.r_sun_ECIF);
+        self.r_moon_ECEF = self.ECIF_to_ECEF(self.r_moon_ECIF);
+        #
+        self.norm_r_sun = np.linalg.norm(self.r_sun_ECIF);
+        self.norm_r_moon = np.linalg.norm(self.r_moon_ECIF);
+        #
+        # Right ascension and declination of the Sun, in degrees for Jacchia
+        #
+        RA_sun, declination_sun = rECIF2RADEC(self.r_sun_ECIF, np.zeros(3));
+        self.RA_sun = np.rad2deg(RA_sun);
+        self.declination_sun = np.rad2deg(declination_sun);
+        #
+        # Jacchia 71 terms that depend only on time and space weather
+        #
+        self.F_10p7_current = F_10p7_current;
+        self.F_10p7_bar = F_10p7_bar;
+        self.K_p = K_p;
+        #
+        self.has_space_weather = F_10p7_current is not None and F_10p7_bar is not None and\
+                                 K_p is not None;
+        #
+        if F_10p7_current is not None and F_10p7_bar is not None:
+            self.T_c = 379.0 + 3.24*F_10p7_bar + 1.3*(F_10p7_current - F_10p7_bar); #degrees K
+        else:
+            self.T_c = None;
+        #
+        self.phi = (self.MJD - 36204.0)/365.2422;
+        self.two_pi_times_phi = 2.0*np.pi*self.phi;
+        #
+        self.tau_sa = self.phi + 0.09544*((0.5 + 0.5*np.sin(self.two_pi_times_phi +\
+                      6.035))**1.65 - 0.5);
+        two_pi_times_tau_sa = 2*np.pi*self.tau_sa;
+        four_pi_times_tau_sa = 2*two_pi_times_tau_sa;
+        #
+        self.g_of_t = 0.02835 + (0.3817 + 0.17829*np.sin(two_pi_times_tau_sa + 4.137))*\
+        np.sin(four_pi_times_tau_sa + 4.259);
+        self.sin_two_pi_times_phi_plus_1p72 = np.sin(self.two_pi_times_phi + 1.72);
+        #
+        obliquity_ecliptic = 23.439291; #degrees -- taken as the mean at J2000
+        self.abs_decli_sun_over_obli_eclip = abs(self.declination_sun/obliquity_ecliptic);
+        self.decli_sun_over_abs_decli_sun = np.sign(self.declination_sun);
+    #
+    def ECIF_to_ECEF(self, r_ECIF):
+        #
+        # Rotate a (3,) or (N,3) array of ECIF vectors into the ECEF frame
+        #
+        return np.asarray(r_ECIF, dtype=float) @ self.ECIF_to_ECEF_matrix.T
+    #
+    def ECEF_to_ECIF(self, r_ECEF):
+        #
+        # Rotate a (3,) or (N,3) array of ECEF vectors into the ECIF frame
+        #
+        return np.asarray(r_ECEF, dtype=float) @ self.ECIF_to_ECEF_matrix
+    #
+    @classmethod
+    def from_date(cls, yr, mon, day, hr, mi, sec, F_10p7_current=None,\
+                  F_10p7_bar=None, K_p=None):
+        #
+        # Build the context from a calendar date, taking the Sun and Moon from
+        # the SPICE ephemerides. The import is kept local so that the context can
+        # be used without spiceypy when the positions come from elsewhere
+        #
+        from get_Sun_and_Moon_Positions import get_Sun_and_Moon_Positions
+        #
+        jd, jdfrac = jday_from_date(yr, mon, day, hr, mi, sec);
+        #
+        rECIF_Moon, rECIF_Sun, vECIF_Moon, vECIF_Sun =\
+        get_Sun_and_Moon_Positions(yr, mon, day, hr, mi, sec);
+        #
+        # SPICE returns kilometers
+        #
+        return cls(jd + jdfrac, 1000.0*rECIF_Sun, 1000.0*rECIF_Moon, F_10p7_current,\
+                   F_10p7_bar, K_p)
@@ -9,6 +9,12 @@ An associated leapsecond kernel will also need to be downloaded and refereced in
 that references the DE430 emphemeris kernel. It is strongly recommended that the user takes some time 
 to understand the basics of the the SPK framework before using or modifying this funtion. 
 
+The calendar date is taken as UTC. The ephemeris used ('spice' or 'analytic')
+is selected by mode, or by the module variable
+get_Sun_and_Moon_Positions_batch.ephemeris_mode when mode is not given. The
+positions are computed by get_Sun_and_Moon_Positions_batch, which should be
+called directly for arrays of epochs.
+
 Inputs:
     yr: Year of interest
     mon: Month of interest
@@ -16,80 +22,26 @@ Inputs:
     hr: Hour of interest
     mi: Minute of interest
     sec: Second of interest
-    
-    epoch_UTC: string in format 'mm-dd-yyyy hh:mm:ss.sss'
-    ttt: terrestrial time
+    mode: 'spice' or 'analytic' (default: ephemeris_mode)
     
 Outputs:
     
-    rECIF_Moon: ECIF 3x1 position vector of the Moon in mean-of-date coordinate frame
-    rECIF_Sun: ECIF 3x1 position vector of the Sun in mean-of-date coordinate frame
+    rECIF_Moon: ECIF 3x1 position vector of the Moon in the J2000 frame (km)
+    rECIF_Sun: ECIF 3x1 position vector of the Sun in the J2000 frame (km)
+    vECIF_Moon: ECIF 3x1 velocity vector of the Moon in the J2000 frame (km/s)
+    vECIF_Sun: ECIF 3x1 velocity vector of the Sun in the J2000 frame (km/s)
 
 Copyright (c) Trevor Wolf 2018. All Rights Reserved. 
 """
 
 
-import numpy as np
-import spiceypy as spice
+from jday import jday
+from get_Sun_and_Moon_Positions_batch import get_Sun_and_Moon_Positions_batch
 
-def get_Sun_and_Moon_Positions(yr, mon, day, hr, mi, sec):
-    #
-    # Convert the given UTC inputs into the necessary string format
-    #
-    yr_string = str(yr);
-    #
-    if mon < 10:
-        mon_string = '0' + str(mon);
-    else:
-        mon_string = str(mon);
+def get_Sun_and_Moon_Positions(yr, mon, day, hr, mi, sec, mode=None):
     #
-    if day < 10:
-        day_string = '0' + str(day);
-    else:
-        day_string = str(day)
+    # Convert the given UTC date to a Julian day and evaluate the batch version
     #
-    if hr < 10:
-        hr_string = '0' + str(hr);
-    else:
-        hr_string = str(hr);
-    #
-    if mi < 10:
-        mi_string = '0' + str(mi);
-    else:
-        mi_string = str(mi);
-    #
-    if sec < 10:
-        sec_string = '0' + str(sec);
-    else:
-        sec_string = str(sec);
-#
-# Create the total string needed for the epoch of interest
-#
-    epoch_UTC = mon_string + '-' + day_string + '-' + yr_string + ' ' + hr_string +\
-            ':' + mi_string + ':' + sec_string;
-#
-
-    epoch_UTC = epoch_UTC+' TDB'
-
-    # get et value
-    et = spice.str2et(epoch_UTC) # converts to a numeric vector -- this is seconds since J2000 in tbd -- barycentric dynamical time
-
-    #Run spkpos as a vectorized function
-    rECIF_Moon_J2000, vECIF_Moon_J2000 = spice.spkpos('Moon', et, 'J2000', 'NONE', 'Earth')
-    rECIF_Sun_J2000, vECIF_Sun_J2000 = spice.spkpos('Sun', et, 'J200', 'NONE', 'Earth')
-
-    rECIF_Moon_J2000 = np.array(rECIF_Moon_J2000); # Convert from list in np array
-    rECIF_Sun_J2000 = np.array(rECIF_Sun_J2000); 
+    jd, jdfrac = jday(yr, mon, day, hr, mi, sec);
     #
-    vECIF_Moon_J2000 = np.array(vECIF_Moon_J2000);
-    vECIF_Sun_J2000 = np.array(vECIF_Sun_J2000);
-
-    return rECIF_Moon_J2000, rECIF_Sun_J2000, vECIF_Moon_J2000, vECIF_Sun_J2000
-
-
-
-
-
-
-
-
+    return get_Sun_and_Moon_Positions_batch(jd + jdfrac, 'jd', mode)
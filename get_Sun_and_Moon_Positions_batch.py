@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+This function calculates the geocentric positions and velocities of the Moon
+and the Sun at an array of epochs in one call. The epochs may be given as
+ephemeris seconds past J2000 (TDB), as UTC Julian days, or as UTC datetime64
+values. They are converted to ephemeris time in bulk, with the leap seconds
+taken from a table (TAI - UTC, valid from 1972 until the next leap second is
+announced; TDB is taken as TT = TAI + 32.184 s, which is good to 2 ms), so there
+are no per-epoch string conversions.
+
+The ephemeris used is selected by mode, or by the module variable
+ephemeris_mode when mode is not given:
+    'spice': SPK SPICE DE430 ephemerides in the J2000 frame. The kernels must
+    already be furnished (see get_Sun_and_Moon_Positions). All epochs are passed
+    to spkezr in one call.
+    'analytic': Low-precision analytic series of analytic_Sun_and_Moon_Positions.
+    This needs no kernels, and spiceypy is never imported in this mode.
+Fast screening jobs can set get_Sun_and_Moon_Positions_batch.ephemeris_mode
+(the module variable) to 'analytic' once at startup.
+
+Inputs:
+    epochs: Scalar or array of epochs
+    epoch_format: 'et' (TDB seconds past J2000, default), 'jd' (UTC Julian day)
+    or 'datetime64' (UTC)
+    mode: 'spice' or 'analytic' (default: ephemeris_mode)
+
+Outputs:
+    rECIF_Moon: (N,3) ECIF position vectors of the Moon (km)
+    rECIF_Sun: (N,3) ECIF position vectors of the Sun (km)
+    vECIF_Moon: (N,3) ECIF velocity vectors of the Moon (km/s)
+    vECIF_Sun: (N,3) ECIF velocity vectors of the Sun (km/s)
+    The outputs are (3,) vectors if epochs is a scalar.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from analytic_Sun_and_Moon_Positions import analytic_Sun_and_Moon_Positions
+
+ephemeris_mode = 'spice';
+
+# UTC dates at which TAI - UTC changes, and its value (s) from that date on
+leap_second_dates = np.array(['1972-01-01', '1972-07-01', '1973-01-01', '1974-01-01',\
+                              '1975-01-01', '1976-01-01', '1977-01-01', '1978-01-01',\
+                              '1979-01-01', '1980-01-01', '1981-07-01', '1982-07-01',\
+                              '1983-07-01', '1985-07-01', '1988-01-01', '1990-01-01',\
+                              '1991-01-01', '1992-07-01', '1993-07-01', '1994-07-01',\
+                              '1996-01-01', '1997-07-01', '1999-01-01', '2006-01-01',\
+                              '2009-01-01', '2012-07-01', '2015-07-01', '2017-01-01'],\
+                             dtype='datetime64[s]');
+TAI_minus_UTC = np.arange(10.0, 38.0);
+
+J2000_datetime64 = np.datetime64('2000-01-01T12:00:00', 's');
+
+def _UTC_to_et(seconds_past_J2000_UTC):
+    #
+    # Convert UTC seconds past J2000 to ephemeris seconds past J2000
+    #
+    leap_second_seconds = (leap_second_dates - J2000_datetime64).astype(float);
+    #
+    leap_index = np.searchsorted(leap_second_seconds, seconds_past_J2000_UTC, side='right') - 1;
+    #
+    return seconds_past_J2000_UTC + TAI_minus_UTC[np.maximum(leap_index, 0)] + 32.184
+
+def get_Sun_and_Moon_Positions_batch(epochs, epoch_format='et', mode=None):
+    #
+    if mode is None:
+        mode = ephemeris_mode;
+    #
+    # Convert all of the epochs to ephemeris time at once
+    #
+    if epoch_format == 'et':
+        et = np.asarray(epochs, dtype=float);
+    elif epoch_format == 'jd':
+        et = _UTC_to_et((np.asarray(epochs, dtype=float) - 2451545.0)*86400.0);
+    elif epoch_format == 'datetime64':
+        seconds_past_J2000_UTC = (np.asarray(epochs, dtype='datetime64[ns]') -\
+                                  J2000_datetime64).astype(float)*1.0e-9;
+        et = _UTC_to_et(seconds_past_J2000_UTC);
+    else:
+        raise ValueError("Unknown epoch format '" + str(epoch_format) + "'")
+    #
+    if mode == 'analytic':
+        #
+        return analytic_Sun_and_Moon_Positions(2451545.0 + et/86400.0)
+    #
+    elif mode != 'spice':
+        raise ValueError("Unknown ephemeris mode '" + str(mode) + "'")
+    #
+    # spiceypy is only imported when the SPICE ephemerides are used
+    #
+    import spiceypy as spice
+    #
+    state_Moon, light_time_Moon = spice.spkezr('MOON', et.tolist(), 'J2000', 'NONE', 'EARTH');
+    state_Sun, light_time_Sun = spice.spkezr('SUN', et.tolist(), 'J2000', 'NONE', 'EARTH');
+    #
+    state_Moon = np.array(state_Moon); # Convert from list in np array
+    state_Sun = np.array(state_Sun);
+    #
+    return state_Moon[..., 0:3], state_Sun[..., 0:3], state_Moon[..., 3:6],\
+    state_Sun[..., 3:6]
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+This module builds and queries a precomputed grid of the non-central spherical
+harmonic acceleration. It is meant as a surrogate for the direct series of
+spherical_harmonic_acceleration_batch in long screening runs over a whole
+catalog. The grid is laid out over radius shells, geocentric latitude and
+longitude. The ITRF acceleration components at the grid nodes are computed once
+with the (pole safe) Cartesian engine and written to a memory-mapped .npy file.
+The grid axes and error statistics are written next to it in a small .npz
+header. Queries use vectorized trilinear interpolation in (r, latitude,
+longitude), with the longitude axis wrapping around.
+
+Error: the interpolation error of trilinear interpolation is bounded by
+(1/8)*(dr^2*|d2a/dr2| + dlat^2*|d2a/dlat2| + dlon^2*|d2a/dlon2|) for the grid
+spacings dr, dlat and dlon. Since the degree l terms vary as (R/r)^(l+2) and as
+cos(m*lambda), the error grows with the field degree and shrinks with altitude.
+Rather than rely on that bound alone, build_gravity_acceleration_grid evaluates
+the direct series at num_check random points inside the grid and records the
+largest and root-mean-square difference to the interpolated value. These are
+available as max_error and rms_error on the loaded grid and should be checked
+against the accuracy the application needs before the grid is used. As a rule
+of thumb, halving every spacing cuts the error by about four.
+
+Functions:
+    build_gravity_acceleration_grid(grid_path, zonal_coeff_array,
+        sectorial_coeff_array, tesseral_coeff_array, order_zonal, order_tesseral,
+        altitudes, num_latitude, num_longitude, normalized, num_check, mu_earth,
+        r_earth): Build the grid and write '<grid_path>.npy' and
+        '<grid_path>_axes.npz'. altitudes is an increasing array of shell
+        altitudes above the reference radius r_earth (m). mu_earth and r_earth
+        are those of the field (default EGM-96). Returns the loaded
+        GravityAccelerationGrid.
+
+    GravityAccelerationGrid(grid_path): Memory-maps a grid. Calling it with an
+        (N,3) array of ITRF positions (m) returns the interpolated (N,3)
+        accelerations (m/s^2). Positions outside the radial range of the grid
+        raise a ValueError.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from load_gravity_field import r_earth_default
+from spherical_harmonic_acceleration_batch import spherical_harmonic_acceleration_batch
+
+class GravityAccelerationGrid():
+    #
+    def __init__(self, grid_path):
+        #
+        self.accel_grid = np.load(grid_path + '.npy', mmap_mode='r');
+        #
+        with np.load(grid_path + '_axes.npz') as header:
+            self.radii = header['radii'];
+            self.latitudes = header['latitudes'];
+            self.longitudes = header['longitudes'];
+            self.max_error = float(header['max_error']);
+            self.rms_error = float(header['rms_error']);
+        #
+        self.latitude_step = self.latitudes[1] - self.latitudes[0];
+        self.longitude_step = self.longitudes[1] - self.longitudes[0];
+    #
+    def __call__(self, r_ITRF_array):
+        #
+        r_ITRF_array = np.atleast_2d(np.asarray(r_ITRF_array, dtype=float));
+        #
+        r_mag = np.linalg.norm(r_ITRF_array, axis=1);
+        latitude = np.rad2deg(np.arcsin(r_ITRF_array[:, 2]/r_mag));
+        longitude = np.rad2deg(np.arctan2(r_ITRF_array[:, 1], r_ITRF_array[:, 0]))%360.0;
+        #
+        if np.any(r_mag < self.radii[0]) or np.any(r_mag > self.radii[-1]):
+            raise ValueError('Position outside of the radial range of the gravity grid')
+        #
+        # Find the lower grid node and the fractional position along each axis
+        #
+        i_r = np.clip(np.searchsorted(self.radii, r_mag) - 1, 0, len(self.radii) - 2);
+        t_r = (r_mag - self.radii[i_r])/(self.radii[i_r + 1] - self.radii[i_r]);
+        #
+        lat_index = (latitude - self.latitudes[0])/self.latitude_step;
+        i_lat = np.clip(np.floor(lat_index).astype(int), 0, len(self.latitudes) - 2);
+        t_lat = lat_index - i_lat;
+        #
+        lon_index = (longitude - self.longitudes[0])/self.longitude_step;
+        i_lon = np.floor(lon_index).astype(int)%len(self.longitudes);
+        t_lon = lon_index - np.floor(lon_index);
+        i_lon_next = (i_lon + 1)%len(self.longitudes);
+        #
+        accel_interpolated = np.zeros(r_ITRF_array.shape);
+        #
+        for d_r, w_r in ((0, 1.0 - t_r), (1, t_r)):
+            for d_lat, w_lat in ((0, 1.0 - t_lat), (1, t_lat)):
+                for i_lon_corner, w_lon in ((i_lon, 1.0 - t_lon), (i_lon_next, t_lon)):
+                    #
+                    weight = (w_r*w_lat*w_lon)[:, None];
+                    accel_interpolated += weight*self.accel_grid[i_r + d_r,\
+                                          i_lat + d_lat, i_lon_corner];
+        #
+        return accel_interpolated
+
+def _grid_positions(radius, latitudes, longitudes):
+    #
+    latitude_mesh, longitude_mesh = np.meshgrid(np.deg2rad(latitudes),\
+                                                np.deg2rad(longitudes), indexing='ij');
+    #
+    r_ITRF_array = np.stack((radius*np.cos(latitude_mesh)*np.cos(longitude_mesh),\
+                             radius*np.cos(latitude_mesh)*np.sin(longitude_mesh),\
+                             radius*np.sin(latitude_mesh)), axis=-1);
+    #
+    return r_ITRF_array.reshape(-1, 3)
+
+def build_gravity_acceleration_grid(grid_path, zonal_coeff_array, sectorial_coeff_array,\
+                                    tesseral_coeff_array, order_zonal, order_tesseral,\
+                                    altitudes, num_latitude=181, num_longitude=360,\
+                                    normalized=False, num_check=1000, mu_earth=None,\
+                                    r_earth=None):
+    #
+    if r_earth is None:
+        r_earth = r_earth_default;
+    #
+    radii = r_earth + np.asarray(altitudes, dtype=float);
+    latitudes = np.linspace(-90.0, 90.0, num_latitude);
+    longitudes = np.linspace(0.0, 360.0, num_longitude, endpoint=False);
+    #
+    accel_grid = np.lib.format.open_memmap(grid_path + '.npy', mode='w+',\
+                 shape=(len(radii), num_latitude, num_longitude, 3));
+    #
+    # Fill the grid one radius shell at a time to bound the memory used
+    #
+    for i_r, radius in enumerate(radii):
+        #
+        r_ITRF_array = _grid_positions(radius, latitudes, longitudes);
+        #
+        accel_grid[i_r] = spherical_harmonic_acceleration_batch(zonal_coeff_array,\
+                          sectorial_coeff_array, tesseral_coeff_array, r_ITRF_array,\
+                          order_zonal, order_tesseral, normalized, 'cartesian', False,\
+                          mu_earth, r_earth).reshape(\
+                          num_latitude, num_longitude, 3);
+    #
+    accel_grid.flush();
+    del accel_grid;
+    #
+    np.savez(grid_path + '_axes.npz', radii=radii, latitudes=latitudes,\
+             longitudes=longitudes, max_error=np.inf, rms_error=np.inf);
+    #
+    # Measure the interpolation error against the direct series at random points
+    #
+    gravity_grid = GravityAccelerationGrid(grid_path);
+    #
+    random_generator = np.random.default_rng(0);
+    r_check = random_generator.uniform(radii[0], radii[-1], num_check);
+    latitude_check = np.arcsin(random_generator.uniform(-1.0, 1.0, num_check));
+    longitude_check = random_generator.uniform(0.0, 2.0*np.pi, num_check);
+    #
+    r_ITRF_check = np.stack((r_check*np.cos(latitude_check)*np.cos(longitude_check),\
+                             r_check*np.cos(latitude_check)*np.sin(longitude_check),\
+                             r_check*np.sin(latitude_check)), axis=-1);
+    #
+    accel_direct = spherical_harmonic_acceleration_batch(zonal_coeff_array,\
+                   sectorial_coeff_array, tesseral_coeff_array, r_ITRF_check,\
+                   order_zonal, order_tesseral, normalized, 'cartesian', False, mu_earth,\
+                   r_earth);
+    #
+    error_norm = np.linalg.norm(gravity_grid(r_ITRF_check) - accel_direct, axis=1);
+    #
+    np.savez(grid_path + '_axes.npz', radii=radii, latitudes=latitudes,\
+             longitudes=longitudes, max_error=error_norm.max(),\
+             rms_error=np.sqrt(np.mean(error_norm**2)));
+    #
+    return GravityAccelerationGrid(grid_path)
@@ -18,6 +18,12 @@ at the winter pole.
 The resulting density calculation will be used to calculate the atmospheric drag 
 for the that the satllite will experienc in LEO.   
 
+All of the inputs except the tables may be NumPy arrays. They are broadcast
+against each other, and the polynomial table for each sample is looked up in
+the packed (region, 6, 5) tensors by its (T_inf, Z) region index. The
+polynomials are evaluated with nested Horner's rule, so a whole catalog of
+states and epochs can be evaluated in one call.
+
 Inputs:
     RA_sat: Right-Ascension of the satellite
     RA_sun: Right-Ascension of the Sun 
@@ -32,18 +38,67 @@ Inputs:
     atmosphere according to Gill (1996)
     h_ij_array: Array containing the tabulated partial volume of Helium, tabulated 
     by Gill (1996)
+    context: Optional EpochContext of the epoch. When given, RA_sun,
+    declination_sun, jday, the F_10.7 values and K_p held by the context are
+    used (those arguments may be passed as None), and the time-only terms T_c,
+    the semi-annual variation and the helium declination factors are taken
+    from it instead of being recomputed for every satellite
     
 Outputs:
-    log_density: log-density of the atmosphere 
+    log_density: log10 of the density of the atmosphere (kg/m^3), as an array with the broadcast
+    shape of the inputs (a float if all of the inputs are scalars)
 
 
 Copyright (c) 2018 Trevor Wolf. All Rights Reserved.
 """
 import numpy as np
+from jacchia_71_gill_tabulated_SD_values import c_ij_region_index
+from jacchia_71_gill_tabulated_helium_values import h_ij_region_index, Z_helium_lower_limit,\
+     Z_helium_upper_limit, T_helium_limits
+
+def _horner_2d(coeff_ij, x, y):
+    #
+    # Evaluate sum_ij coeff_ij*x^i*y^j for every sample, where coeff_ij has shape
+    # (..., I, J). The inner Horner pass in y leaves one polynomial in x per
+    # sample, which the outer pass then evaluates
+    #
+    poly_i = coeff_ij[..., -1];
+    for j in range(coeff_ij.shape[-1] - 2, -1, -1):
+        poly_i = poly_i*y[..., None] + coeff_ij[..., j];
+    #
+    poly = poly_i[..., -1];
+    for i in range(coeff_ij.shape[-2] - 2, -1, -1):
+        poly = poly*x + poly_i[..., i];
+    #
+    return poly
 
 def jacchia_71_gill_density(RA_sat, RA_sun, Z, declination_sun, latitude_sat,\
                             jday, F_10p7_current, F_10p7_bar, K_p, c_ij_array,\
-                            h_ij_array):
+                            h_ij_array, context=None):
+    #
+    # Take the per-epoch values from the shared epoch context when one is given
+    #
+    if context is not None:
+        RA_sun = context.RA_sun;
+        declination_sun = context.declination_sun;
+        jday = context.jday;
+        if context.T_c is not None:
+            F_10p7_current = context.F_10p7_current;
+            F_10p7_bar = context.F_10p7_bar;
+        if context.K_p is not None:
+            K_p = context.K_p;
+    #
+    if F_10p7_current is None or F_10p7_bar is None or K_p is None:
+        raise ValueError('The density needs F_10p7_current, F_10p7_bar and K_p, either as '\
+                         'arguments or held by the EpochContext')
+    #
+    # Broadcast all of the inputs against each other so that a whole catalog
+    # of states and epochs can be evaluated in one call
+    #
+    RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday, F_10p7_current,\
+    F_10p7_bar, K_p = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in\
+    (RA_sat, RA_sun, Z, declination_sun, latitude_sat, jday, F_10p7_current,\
+     F_10p7_bar, K_p)]);
     #
     # Calculate the Hour Angle
     #
@@ -59,14 +114,18 @@ def jacchia_71_gill_density(RA_sat, RA_sun, Z, declination_sun, latitude_sat,\
     #
     # Calculate value of T_c
     #
-    T_c = 379.0 + 3.24*F_10p7_bar + 1.3*(F_10p7_current - F_10p7_bar); #degrees K
+    if context is not None and context.T_c is not None:
+        T_c = context.T_c;
+    else:
+        T_c = 379.0 + 3.24*F_10p7_bar + 1.3*(F_10p7_current - F_10p7_bar); #degrees K
     #
     # Calculate the value of T_1
     #
     #
     # First, find the parameters tau, theta and eta
     #
-    tau = hour_angle - 37.0 + 6.0*(hour_angle + 43.0); #degrees
+    tau = hour_angle - 37.0 + 6.0*np.sin(np.deg2rad(hour_angle + 43.0)); #degrees
+    tau = (tau + 180.0)%360.0 - 180.0; # tau is taken in [-180, 180) degrees
     theta = 0.5*(latitude_sat + declination_sun); #degrees
     eta = 0.5*(latitude_sat - declination_sun); #degrees
     #
@@ -90,7 +149,7 @@ def jacchia_71_gill_density(RA_sat, RA_sun, Z, declination_sun, latitude_sat,\
     #
     # Calculate smoothing function f
     #
-    f = 0.5*(np.arctanh(0.04*(Z - 350.0)) + 1.0);
+    f = 0.5*(np.tanh(0.04*(Z - 350.0)) + 1.0);
     one_minus_f = 1-f;
     #
     # Calculate delta_T_inf
@@ -104,183 +163,199 @@ def jacchia_71_gill_density(RA_sat, RA_sun, Z, declination_sun, latitude_sat,\
                
     # Use values of Z and T_inf to find the standard atmospheric density
     
-    # Decide which c_ij matrix subset is appropriate
-    if T_inf < 850:
-        if Z < 1000:
-            if Z < 500:
-                if Z < 180:
-                    c_ij = c_ij_array.T_less_than_850_and_Z_less_than_180
-                else:
-                    c_ij = c_ij_array.T_less_than_850_and_Z_less_than_500_greater_than_180
-            else:
-                c_ij  = c_ij_array.T_less_than_850_and_Z_less_than_1000_greater_than_500
-        else:
-            c_ij = c_ij_array.T_less_than_850_and_Z_greater_than_1000
-    else:
-        if Z < 1000:
-            if Z < 500:
-                if Z < 180:
-                    c_ij = c_ij_array.T_greater_than_850_and_Z_less_than_180
-                else:
-                    c_ij = c_ij_array.T_greater_than_850_and_Z_less_than_500_greater_than_180
-            else:
-                c_ij = c_ij_array.T_greater_than_850_and_Z_less_than_1000_greater_than_500
-        else:
-             c_ij = c_ij_array.T_greater_than_850_and_Z_greater_than_1000
-             
+    # Look up the packed c_ij table of each sample from its (T_inf, Z) region
+    # and evaluate the bivariate polynomial with nested Horner's rule
     
     Z_over_1000_km = Z / 1000; # normalize Z by 1000 km
     T_inf_over_1000_K = T_inf/1000; # normalize temperature by 1000 k
     #
-    Z_over_1000_pi_array = np.zeros(6);
-    T_over_1000_pj_array = np.zeros(5);
-    #
-    log_density_standard = 0;
+    c_ij = c_ij_array.packed[c_ij_region_index(T_inf, Z)];
     #
-    for i in range(0, 6):
-        #
-        if i == 0:
-            Z_over_1000_pi_array[i] = 1.0;
-        else:
-            Z_over_1000_pi_array[i] = Z_over_1000_pi_array[i - 1]*Z_over_1000_km;
-        #
-        for j in range(0, 5):
-            #
-            if i == 0:
-                #
-                if j == 0:
-                    T_over_1000_pj_array[j] = 1.0;
-                else:
-                    T_over_1000_pj_array[j] = T_over_1000_pj_array[j - 1]*T_inf_over_1000_K;
-                    #
-                #    
-            log_density_standard = log_density_standard + c_ij[i, j]*Z_over_1000_pi_array[i]*\
-                                    T_over_1000_pj_array[j];
+    log_density_standard = _horner_2d(c_ij, Z_over_1000_km, T_inf_over_1000_K);
                                     
     ##
     # Add corrective density terms not expressed in standard atmospheric model
     
     # if Z is less than 350 km-- add a geomagnetic density corrective term 
-    if Z < 350:
-        delta_log_density_GM = (0.012*K_p + 1.2e-5*exp_K_p)*one_minus_f;
-    else:
-        delta_log_density_GM = 0; 
+    delta_log_density_GM = np.where(Z < 350, (0.012*K_p + 1.2e-5*exp_K_p)*one_minus_f, 0.0);
             
     
     # Add corrective term for the semi-annual variation in thermosphere and lower
     # atmosphere
         
-    phi  = (MJD - 36204.0)/365.2422;
-    two_pi_times_phi = 2.0*np.pi*phi;
-    #
-    tau_sa = phi + 0.09544*((0.5 + 0.5*np.sin(two_pi_times_phi + 6.035)**1.65) -\
-             0.5);
-    two_pi_times_tau_sa = 2*np.pi*tau_sa;
-    four_pi_times_tau_sa = 2*two_pi_times_tau_sa;
+    if context is not None:
+        g_of_t = context.g_of_t;
+        sin_two_pi_times_phi_plus_1p72 = context.sin_two_pi_times_phi_plus_1p72;
+    else:
+        phi  = (MJD - 36204.0)/365.2422;
+        two_pi_times_phi = 2.0*np.pi*phi;
+        #
+        tau_sa = phi + 0.09544*((0.5 + 0.5*np.sin(two_pi_times_phi + 6.035))**1.65 -\
+                 0.5);
+        two_pi_times_tau_sa = 2*np.pi*tau_sa;
+        four_pi_times_tau_sa = 2*two_pi_times_tau_sa;
+        #
+        g_of_t = 0.02835 + (0.3817 + 0.17829*np.sin(two_pi_times_tau_sa + 4.137))*\
+        np.sin(four_pi_times_tau_sa + 4.259);
+        sin_two_pi_times_phi_plus_1p72 = np.sin(two_pi_times_phi + 1.72);
     #
     f_of_Z = (5.876e-7*Z**2.331 + 0.06328)*np.exp(-0.002868*Z);
-    g_of_t = 0.02835 + (0.3817 + 0.17829*np.sin(two_pi_times_tau_sa + 4.137))*\
-    np.sin(four_pi_times_tau_sa + 4.259);
     #
     delta_log_density_sa = f_of_Z*g_of_t;
     # 
     # Add corrective term for seasonal-latitudinal density dependence
     #
     delta_Z_90 = Z - 90; # deviation from 90 km
-    if latitude_sat < 0:
-        sign_sin_p2_lat = -np.sin(np.deg2rad(latitude_sat))**2;
-    else:
-        sign_sin_p2_lat = np.sin(np.deg2rad(latitude_sat))**2;
+    sign_sin_p2_lat = np.sign(latitude_sat)*np.sin(np.deg2rad(latitude_sat))**2;
     #
     delta_log_density_sl = 0.014*delta_Z_90*np.exp(-0.0013*delta_Z_90**2)*\
-    np.sin(two_pi_times_phi + 1.72)*sign_sin_p2_lat;
+    sin_two_pi_times_phi_plus_1p72*sign_sin_p2_lat;
     #
     # Add density corrective term for the seasonal variation of He over the winter pole
     #
-    abs_decli_sun_over_obli_eclip = abs(declination_sun / obliquity_ecliptic); #unitless
-    decli_sun_over_abs_decli_sun = declination_sun / abs(declination_sun); #unitless
+    if context is not None:
+        abs_decli_sun_over_obli_eclip = context.abs_decli_sun_over_obli_eclip;
+        decli_sun_over_abs_decli_sun = context.decli_sun_over_abs_decli_sun;
+    else:
+        abs_decli_sun_over_obli_eclip = np.abs(declination_sun / obliquity_ecliptic); #unitless
+        decli_sun_over_abs_decli_sun = np.sign(declination_sun); #unitless
     pi_over_four = np.pi/4;
-    sat_lat_over_two = latitude_sat / 2;
+    sat_lat_over_two = np.deg2rad(latitude_sat / 2); # radians
     #
     delta_log_num_He = 0.65*abs_decli_sun_over_obli_eclip*(np.sin(pi_over_four - \
     sat_lat_over_two*decli_sun_over_abs_decli_sun)**3.0 - 0.35355); # this is the correction for the amount of helium that changes semiannually 
     #
-    # Create array for storing the Z_pi and T_pj 
+    # interpolate the find log_n_He using Gill's tabulations. Outside of the
+    # tabulated altitudes (90 km to 2500 km) the correction is left out, and
+    # T_inf is clipped to the tabulated temperatures
     #
-    thousand_power_array = np.zeros(6);
+    has_helium = (Z >= Z_helium_lower_limit) & (Z < Z_helium_upper_limit);
     #
-    for iterate in range(0, 6):
-        if iterate == 0:
-            thousand_power_array[iterate] = 1;
-        else:
-            thousand_power_array[iterate] = thousand_power_array[iterate - 1]*1000;
-            
-        
-    Z_pi_array = Z_over_1000_pi_array*thousand_power_array;
-    T_pj_array = T_over_1000_pj_array*thousand_power_array[0:5];
-    
-    # Choose which set of arrays to use 
-    if Z < 2500:
-        if Z < 1000:
-            if Z < 500:
-                h_ij = h_ij_array.Z_less_than_500_greater_than_90
-            else:
-                h_ij = h_ij_array.Z_less_than_1000_greater_than_500
-        else:
-             h_ij = h_ij_array.Z_less_than_2500_greater_than_1000
-    #
-    # interpolate the find log_n_He using Gill's tabulations
-    #
-    log_num_He = 0;
-    #
-    for i in range(0, 6):
-        for j in range(0, 5):
-            #
-            log_num_He = h_ij[i, j]*Z_pi_array[i]*T_pj_array;
-            #
-        #    
+    h_ij = h_ij_array.packed[np.minimum(h_ij_region_index(Z), 2)];
+    #
+    log_num_He = _horner_2d(h_ij, np.clip(Z, Z_helium_lower_limit, Z_helium_upper_limit),\
+                            np.clip(T_inf, *T_helium_limits)); # log10 of m^-3
     #
     # Find the density correction for the Helium migration
     #
-    molar_mass_He = 4.0026; #grams per mole
+    molar_mass_He = 4.0026e-3; #kilograms per mole
     A_v = 6.022140857e23; # avagadro's number 
     #
-    delta_log_density_He = 10**log_num_He*(molar_mass_He / A_v)*\
-    (10**delta_log_num_He - 1);
+    density_He = np.where(has_helium, 10**np.where(has_helium, log_num_He, 0.0)*\
+    (molar_mass_He / A_v), 0.0); # kg/m^3
     
     #
     # Add the density of the standard atmosphere and the corrections to find the density at the 
-    # given time and location
+    # given time and location. The helium correction is a mass density, so it is
+    # added to the density rather than to its logarithm. The two tabulations are
+    # separate fits, and where the helium density exceeds the total it is taken
+    # as the total, so the corrected density stays positive
     #
     
     log_density  = log_density_standard + delta_log_density_GM + \
-    delta_log_density_sa + delta_log_density_sl + delta_log_density_He;
+    delta_log_density_sa + delta_log_density_sl;
+    #
+    density = 10**log_density;
+    density_He = np.minimum(density_He, density);
+    #
+    log_density = np.log10(density + density_He*(10**delta_log_num_He - 1));
+    #
+    # Keep returning a plain float for scalar inputs
+    #
+    if log_density.ndim == 0:
+        return float(log_density)
     #
     return log_density
 
-
-
-                                                           
-                                                    
-    
-
-
-
-
-    
-                                
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
-           
+#
+# Test function: the log-density must be finite and fall with altitude over
+# 150 km to 2500 km for low to high solar and geomagnetic activity, at the
+# poles and the equator, by day and by night, at the solstices and equinoxes.
+# The broadcast evaluation must also match scalar calls, and the Horner
+# evaluation of the packed tables must match the term by term sums
+#
+if __name__ == '__main__':
+    #
+    from jacchia_71_gill_tabulated_SD_values import jacchia_71_gill_tabulated_SD_values
+    from jacchia_71_gill_tabulated_helium_values import jacchia_71_gill_tabulated_helium_values
+    #
+    c_ij_array = jacchia_71_gill_tabulated_SD_values();
+    h_ij_array = jacchia_71_gill_tabulated_helium_values();
+    #
+    Z = np.arange(150.0, 2500.0, 1.0)[:, None]; # km
+    F_10p7, K_p, latitude_sat, declination_sun, hour_angle = [value.ravel()[None, :] for value in\
+    np.meshgrid([70.0, 150.0, 250.0], [0.0, 4.0, 9.0], [-80.0, 0.0, 60.0],\
+                [-23.44, 0.0, 23.44], [0.0, 180.0], indexing='ij')];
+    #
+    log_density = jacchia_71_gill_density(hour_angle, 0.0, Z, declination_sun, latitude_sat,\
+                  2458000.5, F_10p7, F_10p7, K_p, c_ij_array, h_ij_array);
+    #
+    assert np.all(np.isfinite(log_density)), 'Non-finite log-density'
+    assert np.all(np.diff(log_density, axis=0) < 0.0), 'Log-density does not fall with altitude'
+    print('Jacchia 71 log-density finite and decreasing from 150 km to 2500 km:',\
+          log_density.shape[1], 'conditions')
+    #
+    # The broadcast evaluation must equal scalar calls one sample at a time,
+    # which return floats
+    #
+    rng = np.random.default_rng(8);
+    sample_indices = zip(rng.integers(0, Z.shape[0], 200), rng.integers(0, F_10p7.shape[1], 200));
+    #
+    broadcast_difference = 0.0;
+    for i, k in sample_indices:
+        log_density_scalar = jacchia_71_gill_density(hour_angle[0, k], 0.0, Z[i, 0],\
+                             declination_sun[0, k], latitude_sat[0, k], 2458000.5,\
+                             F_10p7[0, k], F_10p7[0, k], K_p[0, k], c_ij_array, h_ij_array);
+        assert isinstance(log_density_scalar, float)
+        broadcast_difference = max(broadcast_difference,\
+                                   abs(log_density_scalar - log_density[i, k]));
+    #
+    assert broadcast_difference < 1.0e-12, broadcast_difference
+    print('Broadcast vs scalar max difference of log10 density:', broadcast_difference)
+    #
+    # The packed tables with Horner's rule must match the named tables picked by
+    # region masks and summed term by term, over every c_ij and h_ij region
+    #
+    T_inf_grid, Z_grid = [value.ravel() for value in np.meshgrid(np.linspace(500.0, 1900.0, 57),\
+                          np.linspace(90.0, 2499.0, 241), indexing='ij')];
+    #
+    Z_column = Z_grid[:, None, None];
+    T_inf_column = T_inf_grid[:, None, None];
+    #
+    c_ij_named = np.select([(Z_column < 180) & (T_inf_column < 850),\
+                            (Z_column < 500) & (T_inf_column < 850),\
+                            (Z_column < 1000) & (T_inf_column < 850), T_inf_column < 850,\
+                            Z_column < 180, Z_column < 500, Z_column < 1000, Z_column >= 1000],\
+                           [c_ij_array.T_less_than_850_and_Z_less_than_180,\
+                            c_ij_array.T_less_than_850_and_Z_less_than_500_greater_than_180,\
+                            c_ij_array.T_less_than_850_and_Z_less_than_1000_greater_than_500,\
+                            c_ij_array.T_less_than_850_and_Z_greater_than_1000,\
+                            c_ij_array.T_greater_than_850_and_Z_less_than_180,\
+                            c_ij_array.T_greater_than_850_and_Z_less_than_500_greater_than_180,\
+                            c_ij_array.T_greater_than_850_and_Z_less_than_1000_greater_than_500,\
+                            c_ij_array.T_greater_than_850_and_Z_greater_than_1000]);
+    h_ij_named = np.select([Z_column < 500, Z_column < 1000, Z_column >= 1000],\
+                           [h_ij_array.Z_less_than_500_greater_than_90,\
+                            h_ij_array.Z_less_than_1000_greater_than_500,\
+                            h_ij_array.Z_less_than_2500_greater_than_1000]);
+    #
+    powers_i = np.arange(6);
+    powers_j = np.arange(5);
+    #
+    for coeff_packed, coeff_named, x, y in\
+        ((c_ij_array.packed[c_ij_region_index(T_inf_grid, Z_grid)], c_ij_named,\
+          Z_grid/1000, T_inf_grid/1000),\
+         (h_ij_array.packed[h_ij_region_index(Z_grid)], h_ij_named, Z_grid, T_inf_grid)):
+        #
+        terms = coeff_named*x[:, None, None]**powers_i[:, None]*y[:, None, None]**powers_j[None, :];
+        term_by_term = np.sum(terms, axis=(1, 2));
+        horner_difference = np.abs(_horner_2d(coeff_packed, x, y) - term_by_term);
+        #
+        # The c_ij sums cancel by up to four orders of magnitude, so the
+        # difference is also given relative to the sum of the absolute terms
+        #
+        horner_error = np.max(horner_difference/np.abs(term_by_term));
+        horner_rounding = np.max(horner_difference/np.sum(np.abs(terms), axis=(1, 2)));
+        assert horner_error < 1.0e-11 and horner_rounding < 1.0e-14, (horner_error, horner_rounding)
+        print('Horner vs term by term max relative difference:', horner_error,\
+              'relative to the absolute terms:', horner_rounding)
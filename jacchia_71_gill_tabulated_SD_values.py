@@ -6,14 +6,32 @@ density Jacchia 71 model. These values were originally tabuled by Gill (1996)
 Outputs:
     c_ij_array: Class struct containing the tabulated standard density values 
     for interpolation via the modified Jacchia 71 atmospheric model proposed by
-    Gill (1996). 
+    Gill (1996). The eight tables are also packed into the contiguous (8, 6, 5)
+    tensor c_ij_array.packed, in the region order of c_ij_region_index. The
+    tables are only built on the first call and shared afterwards. 
 
 Copyright (c) Trevor Wolf 2018. All Rights Reserved. 
 """
 
 # Create class for storing c_ij values
+import functools
 import numpy as np
 
+# Altitude boundaries (km) and temperature boundary (K) of the c_ij regions
+Z_region_boundaries = np.array([180.0, 500.0, 1000.0]);
+T_region_boundary = 850.0;
+
+def c_ij_region_index(T_inf, Z):
+    #
+    # Index into c_ij_array.packed for each (T_inf, Z) sample: the four altitude
+    # regions for T_inf < 850 K come first, followed by those for T_inf >= 850 K
+    #
+    Z_index = np.searchsorted(Z_region_boundaries, Z, side='right');
+    T_index = (np.asarray(T_inf) >= T_region_boundary).astype(int);
+    #
+    return 4*T_index + Z_index
+
+@functools.lru_cache(maxsize=None)
 def jacchia_71_gill_tabulated_SD_values():
     #
     class c_ij_array_class():
@@ -87,6 +105,19 @@ def jacchia_71_gill_tabulated_SD_values():
                          [-0.1898953e3,  0.4347501e3, -0.2986011e3,  0.5423180e2,  0.5039459e1],
                          [ 0.2569577e2, -0.6282710e2,  0.4971077e2, -0.1404385e2,  0.8450500e0]]); 
     ##
+    # Pack the tables into one contiguous tensor for the vectorized density model
+    #
+    c_ij_array.packed = np.ascontiguousarray(np.stack(\
+                        [c_ij_array.T_less_than_850_and_Z_less_than_180,\
+                         c_ij_array.T_less_than_850_and_Z_less_than_500_greater_than_180,\
+                         c_ij_array.T_less_than_850_and_Z_less_than_1000_greater_than_500,\
+                         c_ij_array.T_less_than_850_and_Z_greater_than_1000,\
+                         c_ij_array.T_greater_than_850_and_Z_less_than_180,\
+                         c_ij_array.T_greater_than_850_and_Z_less_than_500_greater_than_180,\
+                         c_ij_array.T_greater_than_850_and_Z_less_than_1000_greater_than_500,\
+                         c_ij_array.T_greater_than_850_and_Z_greater_than_1000]));
+    c_ij_array.packed.setflags(write=False);
+    ##
     return c_ij_array
                                                    
 
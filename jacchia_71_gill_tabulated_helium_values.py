@@ -6,14 +6,34 @@ seasonal migration at the winter pole. This effect was first described in the
 Jacchia 71 atmospheric model and later tabulated by Gill (1996).
 
 Outputs: 
-    h_ij_array: Tabulated helium partial volume amounts according to Gill (1996)
+    h_ij_array: Tabulated helium partial volume amounts according to Gill (1996).
+    The polynomials give log10 of the helium number density (m^-3) in Z (km)
+    and T_inf (K), and join continuously at 500 km and 1000 km.
+    The three tables are also packed into the contiguous (3, 6, 5) tensor
+    h_ij_array.packed, in the region order of h_ij_region_index. The tables are
+    only built on the first call and shared afterwards.
 
 Copyright (c) Trevor Wolf 2018. All Rights Reserved. 
 """
+import functools
 import numpy as np
 
+# Altitude boundaries (km) of the h_ij regions, helium is only tabulated from
+# 90 km up to 2500 km and for exospheric temperatures of 500 K to 1900 K
+Z_region_boundaries = np.array([500.0, 1000.0]);
+Z_helium_lower_limit = 90.0;
+Z_helium_upper_limit = 2500.0;
+T_helium_limits = (500.0, 1900.0);
+
+def h_ij_region_index(Z):
+    #
+    # Index into h_ij_array.packed for each altitude sample
+    #
+    return np.searchsorted(Z_region_boundaries, Z, side='right')
+
 # Create class for storing arrays
 
+@functools.lru_cache(maxsize=None)
 def jacchia_71_gill_tabulated_helium_values():
     #
     class h_ij_array_class():
@@ -23,7 +43,7 @@ def jacchia_71_gill_tabulated_helium_values():
     h_ij_array = h_ij_array_class();
     #
     h_ij_array.Z_less_than_500_greater_than_90 = np.array(\
-     [[ 1.831549e+01,  5.887556e03,  -4.813257e-06,  1.701738e-09, -2.128374e-13],
+     [[ 1.831549e+01,  5.887556e-03,  -4.813257e-06,  1.701738e-09, -2.128374e-13],
       [-7.374008e-02, -1.251077e-04,  1.039269e-07, -3.679280e-11,  4.555258e-15],
       [ 4.384164e-04,  8.657027e-07, -7.216946e-10,  2.481534e-13, -2.859074e-17],
       [-1.411195e-06, -2.483834e-09,  2.004107e-12, -6.244985e-16,  5.561004e-20],
@@ -43,8 +63,16 @@ def jacchia_71_gill_tabulated_helium_values():
       [-2.362530e-02, -6.907613e-05,  2.251680e-07, -1.795937e-10,  4.463659e-14],
       [ 1.893899e-05,  1.145960e-07, -3.183259e-10,  2.461076e-13, -6.040423e-17],
       [-1.132198e-08, -7.438326e-11,  2.040288e-13, -1.573191e-16,  3.857032e-20],
-      [ 3.465014e-12,  2.308943e-14,  6.320466e-17,  4.871419e-20, -1.194139e-23],
+      [ 3.465014e-12,  2.308943e-14, -6.320466e-17,  4.871419e-20, -1.194139e-23],
       [-4.156710e-16, -2.791930e-18,  7.632792e-21, -5.881112e-24,  1.441455e-27]]);
+    #
+    # Pack the tables into one contiguous tensor for the vectorized density model
+    #
+    h_ij_array.packed = np.ascontiguousarray(np.stack(\
+                        [h_ij_array.Z_less_than_500_greater_than_90,\
+                         h_ij_array.Z_less_than_1000_greater_than_500,\
+                         h_ij_array.Z_less_than_2500_greater_than_1000]));
+    h_ij_array.packed.setflags(write=False);
     
     return h_ij_array
         
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+This function builds the table of recursion coefficients needed to evaluate the
+associated Legendre functions P_lm(sin(phi_gc)) used by the spherical harmonic
+gravity model. The coefficients only depend on the degree and order, so they are
+computed once for each (max_degree, max_order, normalized) combination and kept
+in a least-recently-used cache. Each evaluation of the gravity model then only
+multiplies by these precomputed constants.
+
+With t = sin(phi_gc) and u = cos(phi_gc), the recursion is written column by
+column as
+
+    P_mm = D_m*u*P_(m-1)(m-1)
+    P_lm = A_lm*t*P_(l-1)m - B_lm*P_(l-2)m        for l > m
+
+For unnormalized functions (Vallado) the coefficients are
+
+    A_lm = (2l - 1)/(l - m), B_lm = (l + m - 1)/(l - m), D_m = 2m - 1
+
+and for fully normalized functions (no Condon-Shortley phase)
+
+    A_lm = sqrt((2l + 1)(2l - 1)/((l - m)(l + m)))
+    B_lm = sqrt((2l + 1)(l + m - 1)(l - m - 1)/((l - m)(l + m)(2l - 3)))
+    D_1 = sqrt(3), D_m = sqrt((2m + 1)/(2m))
+
+The derivative with respect to latitude is dP_lm/dphi_gc = E_lm*P_l(m+1) -
+m*tan(phi_gc)*P_lm, where E_lm = 1 for unnormalized functions and
+E_lm = sqrt((l - m)(l + m + 1)/(1 + delta_0m)) for normalized functions. The
+normalized recursion is the numerically stable choice at high degree, where the
+unnormalized functions overflow.
+
+Inputs:
+    max_degree: Highest degree l in the table
+    max_order: Highest order m in the table
+    normalized: True for fully normalized functions, False for unnormalized
+
+Outputs:
+    legendre_table: LegendreRecursionTable object with the arrays A, B, D, E,
+    the (l + 1) and m factors, and the normalization factors N_lm
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import functools
+import numpy as np
+from load_gravity_field import normalization_factors
+
+class LegendreRecursionTable():
+    #
+    def __init__(self, max_degree, max_order, normalized=False):
+        #
+        self.max_degree = max_degree;
+        self.max_order = max_order;
+        self.normalized = normalized;
+        #
+        l = np.arange(max_degree + 1, dtype=float)[:, None];
+        m = np.arange(self.max_order + 1, dtype=float)[None, :];
+        #
+        l_minus_m = l - m;
+        l_plus_m = l + m;
+        below_diagonal = l_minus_m > 0;
+        #
+        # Use ones in place of the zero denominators on and above the diagonal,
+        # those entries are never used by the recursion
+        #
+        safe_l_minus_m = np.where(below_diagonal, l_minus_m, 1.0);
+        safe_l_plus_m = np.where(below_diagonal, l_plus_m, 1.0);
+        #
+        if normalized:
+            #
+            two_l_minus_three = np.where(l > 1, 2*l - 3, 1.0);
+            #
+            self.A = np.where(below_diagonal, np.sqrt(np.abs((2*l + 1)*(2*l - 1)/\
+                     (safe_l_minus_m*safe_l_plus_m))), 0.0);
+            self.B = np.where(below_diagonal & (l_minus_m > 1),\
+                     np.sqrt(np.abs((2*l + 1)*(l_plus_m - 1)*(l_minus_m - 1)/\
+                     (safe_l_minus_m*safe_l_plus_m*two_l_minus_three))), 0.0);
+            #
+            m_diagonal = np.arange(self.max_order + 1, dtype=float);
+            self.D = np.zeros(self.max_order + 1);
+            self.D[1:] = np.sqrt((2*m_diagonal[1:] + 1)/(2*m_diagonal[1:]));
+            if self.max_order >= 1:
+                self.D[1] = np.sqrt(3.0);
+            #
+            one_plus_delta = np.where(m == 0, 2.0, 1.0);
+            self.E = np.sqrt(np.clip(l_minus_m*(l_plus_m + 1), 0.0, None)/\
+                     one_plus_delta);
+            #
+        else:
+            #
+            self.A = np.where(below_diagonal, (2*l - 1)/safe_l_minus_m, 0.0);
+            self.B = np.where(below_diagonal, (l_plus_m - 1)/safe_l_minus_m, 0.0);
+            #
+            self.D = 2*np.arange(self.max_order + 1, dtype=float) - 1;
+            self.D[0] = 0.0;
+            #
+            self.E = np.ones((max_degree + 1, self.max_order + 1));
+        #
+        self.l_plus_one = np.arange(max_degree + 1, dtype=float) + 1;
+        self.m = np.arange(self.max_order + 1, dtype=float);
+        #
+        self.N = normalization_factors(max_degree, self.max_order);
+        #
+        # The tables are shared between callers, so protect them from edits
+        #
+        for table in (self.A, self.B, self.D, self.E, self.l_plus_one, self.m, self.N):
+            table.setflags(write=False);
+    #
+    def evaluate(self, sin_phi_gc, cos_phi_gc, degree=None, order=None):
+        #
+        # Evaluate P_lm for every latitude in the input arrays at once. The
+        # output has shape (N, degree + 1, order + 1)
+        #
+        if degree is None:
+            degree = self.max_degree;
+        if order is None:
+            order = self.max_order;
+        #
+        sin_phi_gc = np.atleast_1d(sin_phi_gc);
+        cos_phi_gc = np.atleast_1d(cos_phi_gc);
+        #
+        P = np.zeros((sin_phi_gc.shape[0], degree + 1, order + 1));
+        P[:, 0, 0] = 1.0;
+        #
+        for l in range(1, degree + 1):
+            #
+            m_max = min(l - 1, order);
+            #
+            if l >= 2:
+                P[:, l, :m_max + 1] = self.A[l, :m_max + 1]*sin_phi_gc[:, None]*\
+                P[:, l-1, :m_max + 1] - self.B[l, :m_max + 1]*P[:, l-2, :m_max + 1];
+            else:
+                P[:, l, :m_max + 1] = self.A[l, :m_max + 1]*sin_phi_gc[:, None]*\
+                P[:, l-1, :m_max + 1];
+            #
+            if l <= order:
+                P[:, l, l] = self.D[l]*cos_phi_gc*P[:, l-1, l-1];
+        #
+        return P
+
+@functools.lru_cache(maxsize=16)
+def get_legendre_recursion_table(max_degree, max_order, normalized=False):
+    #
+    return LegendreRecursionTable(max_degree, max_order, normalized)
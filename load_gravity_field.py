@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+This function loads a full degree and order Earth gravity field, such as EGM-96
+or EGM-2008, from a standard coefficient file. Each line of the file is expected
+to contain the degree l, the order m, and the fully normalized C_lm and S_lm
+coefficients, optionally followed by their standard deviations. Fortran style
+'D' exponents and the ICGEM 'gfc' line prefix are accepted, and header lines
+are skipped. If an ICGEM header is present, the gravitational parameter and
+reference radius are read from it.
+
+The coefficients are stored in a packed lower-triangular layout, where the
+(l, m) term lives at index l*(l+1)/2 + m. Because the layout is ordered by
+degree, a truncation to degree L is simply the first (L+1)*(L+2)/2 entries.
+The first time a coefficient file is loaded, the packed (C,S) store is written
+next to it as a binary cache ('<file>.cache.npy'). Later loads memory-map that
+cache instead of parsing the text file again. The cache is rebuilt if the text
+file is newer than the cache.
+
+Inputs:
+    coefficient_file: Path to the gravity field coefficient file
+    max_degree: Optional highest degree to keep (default: all of the file)
+    max_order: Optional highest order to keep (default: max_degree)
+
+Outputs:
+    gravity_field: GravityField object holding the packed C and S coefficients.
+    The coefficient_arrays(degree, order) method returns the zonal, sectorial
+    and tesseral arrays in the layout used by spherical_harmonic_arrays, so
+    they can be passed straight to spherical_harmonic_acceleration_batch with
+    order_zonal = degree + 1 and order_tesseral = order, together with the
+    field's mu_earth and r_earth. The acceleration(r_ITRF_array, degree, order,
+    engine, return_gradient) method does this in one call.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import os
+import math as math
+import numpy as np
+
+# EGM-96 / EGM-2008 defaults when the file has no header
+mu_earth_default = 3.986004415e14; # m^3/s^2
+r_earth_default = 6378136.3; # m
+
+def packed_index(l, m):
+    #
+    # Index of the (l, m) coefficient in the packed lower-triangular store
+    #
+    return l*(l + 1)//2 + m
+
+class GravityField():
+    #
+    def __init__(self, C_packed, S_packed, max_degree, max_order, mu_earth,\
+                 r_earth, normalized=True):
+        #
+        self.C_packed = C_packed;
+        self.S_packed = S_packed;
+        self.max_degree = max_degree;
+        self.max_order = max_order;
+        self.mu_earth = mu_earth;
+        self.r_earth = r_earth;
+        self.normalized = normalized;
+    #
+    def truncate(self, degree, order=None):
+        #
+        # Return a view of the field truncated to the requested degree and order.
+        # No coefficients are copied since the packed store is ordered by degree
+        #
+        if order is None:
+            order = degree;
+        #
+        if degree > self.max_degree:
+            raise ValueError('Requested degree %d exceeds the loaded degree %d'\
+                             % (degree, self.max_degree))
+        #
+        num_packed = packed_index(degree + 1, 0);
+        #
+        return GravityField(self.C_packed[:num_packed], self.S_packed[:num_packed],\
+                            degree, min(order, degree, self.max_order),\
+                            self.mu_earth, self.r_earth, self.normalized)
+    #
+    def coefficient(self, l, m):
+        #
+        if l > self.max_degree or m > min(l, self.max_order):
+            return 0.0, 0.0
+        #
+        index = packed_index(l, m);
+        return float(self.C_packed[index]), float(self.S_packed[index])
+    #
+    def coefficient_arrays(self, degree=None, order=None, normalized=False):
+        #
+        # Unpack the field into the zonal, sectorial and tesseral arrays used by
+        # the rest of the gravity routines. By default the coefficients are
+        # converted to the unnormalized convention of spherical_harmonic_arrays
+        #
+        if degree is None:
+            degree = self.max_degree;
+        if order is None:
+            order = degree;
+        #
+        degree = min(degree, self.max_degree);
+        order = min(order, degree, self.max_order);
+        #
+        l_index, m_index = np.tril_indices(degree + 1);
+        packed = packed_index(l_index, m_index);
+        keep = m_index <= order;
+        l_index = l_index[keep];
+        m_index = m_index[keep];
+        packed = packed[keep];
+        #
+        C_lm = np.zeros((degree + 1, order + 1));
+        S_lm = np.zeros((degree + 1, order + 1));
+        #
+        C_lm[l_index, m_index] = self.C_packed[packed];
+        S_lm[l_index, m_index] = self.S_packed[packed];
+        #
+        if self.normalized and not normalized:
+            #
+            N_lm = normalization_factors(degree, order);
+            C_lm = C_lm*N_lm;
+            S_lm = S_lm*N_lm;
+        #
+        elif normalized and not self.normalized:
+            #
+            N_lm = normalization_factors(degree, order);
+            C_lm = np.divide(C_lm, N_lm, out=np.zeros_like(C_lm), where=N_lm > 0);
+            S_lm = np.divide(S_lm, N_lm, out=np.zeros_like(S_lm), where=N_lm > 0);
+        #
+        zonal_coeff_array = C_lm[:, 0].copy();
+        #
+        sectorial_coeff_array = C_lm.copy();
+        sectorial_coeff_array[:, 0] = 0.0;
+        #
+        tesseral_coeff_array = S_lm;
+        tesseral_coeff_array[:, 0] = 0.0;
+        #
+        return zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array
+    #
+    def acceleration(self, r_ITRF_array, degree=None, order=None, engine='spherical',\
+                     return_gradient=False):
+        #
+        # Evaluate the field with its own gravitational parameter and reference
+        # radius. The import is kept local since the engines import this module
+        #
+        from spherical_harmonic_acceleration_batch import spherical_harmonic_acceleration_batch
+        #
+        zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array =\
+        self.coefficient_arrays(degree, order, self.normalized);
+        #
+        return spherical_harmonic_acceleration_batch(zonal_coeff_array, sectorial_coeff_array,\
+               tesseral_coeff_array, r_ITRF_array, len(zonal_coeff_array),\
+               sectorial_coeff_array.shape[1] - 1, self.normalized, engine, return_gradient,\
+               self.mu_earth, self.r_earth)
+
+def normalization_factors(degree, order):
+    #
+    # N_lm = sqrt((2 - delta_0m)*(2l + 1)*(l - m)!/(l + m)!) such that the
+    # unnormalized coefficient is C_lm = N_lm*C_bar_lm. Log-gamma is used so the
+    # factorials do not overflow at high degree
+    #
+    N_lm = np.zeros((degree + 1, order + 1));
+    #
+    for l in range(0, degree + 1):
+        for m in range(0, min(l, order) + 1):
+            #
+            if m == 0:
+                two_minus_delta = 1.0;
+            else:
+                two_minus_delta = 2.0;
+            #
+            N_lm[l, m] = math.sqrt(two_minus_delta*(2*l + 1)*\
+                         math.exp(math.lgamma(l - m + 1) - math.lgamma(l + m + 1)));
+    #
+    return N_lm
+
+def _parse_coefficient_file(coefficient_file):
+    #
+    mu_earth = mu_earth_default;
+    r_earth = r_earth_default;
+    #
+    l_list = [];
+    m_list = [];
+    C_list = [];
+    S_list = [];
+    #
+    with open(coefficient_file, 'r') as text_file:
+        for line in text_file:
+            #
+            tokens = line.split();
+            if len(tokens) == 0:
+                continue
+            #
+            # Pick up the ICGEM header values when they are present
+            #
+            if tokens[0] == 'earth_gravity_constant':
+                mu_earth = float(tokens[1]);
+                continue
+            if tokens[0] == 'radius':
+                r_earth = float(tokens[1]);
+                continue
+            #
+            if tokens[0] in ('gfc', 'gfct'):
+                tokens = tokens[1:];
+            #
+            if len(tokens) < 4:
+                continue
+            #
+            try:
+                l = int(tokens[0]);
+                m = int(tokens[1]);
+                C_value = float(tokens[2].replace('D', 'E').replace('d', 'e'));
+                S_value = float(tokens[3].replace('D', 'E').replace('d', 'e'));
+            except ValueError:
+                continue
+            #
+            l_list.append(l);
+            m_list.append(m);
+            C_list.append(C_value);
+            S_list.append(S_value);
+    #
+    l_array = np.array(l_list, dtype=int);
+    m_array = np.array(m_list, dtype=int);
+    #
+    max_degree = int(l_array.max());
+    #
+    # Row 0 holds C, row 1 holds S, and the last column holds mu and the radius
+    #
+    num_packed = packed_index(max_degree + 1, 0);
+    packed_store = np.zeros((2, num_packed + 1));
+    #
+    packed = packed_index(l_array, m_array);
+    packed_store[0, packed] = C_list;
+    packed_store[1, packed] = S_list;
+    #
+    # The files usually leave out the central term
+    #
+    if packed_store[0, 0] == 0.0:
+        packed_store[0, 0] = 1.0;
+    #
+    packed_store[0, -1] = mu_earth;
+    packed_store[1, -1] = r_earth;
+    #
+    return packed_store
+
+def load_gravity_field(coefficient_file, max_degree=None, max_order=None):
+    #
+    cache_file = coefficient_file + '.cache.npy';
+    #
+    if not os.path.exists(cache_file) or\
+    os.path.getmtime(cache_file) < os.path.getmtime(coefficient_file):
+        #
+        packed_store = _parse_coefficient_file(coefficient_file);
+        np.save(cache_file, packed_store);
+    #
+    packed_store = np.load(cache_file, mmap_mode='r');
+    #
+    num_packed = packed_store.shape[1] - 1;
+    file_degree = int(round((math.sqrt(8*num_packed + 1) - 3)/2));
+    #
+    gravity_field = GravityField(packed_store[0, :-1], packed_store[1, :-1],\
+                                 file_degree, file_degree,\
+                                 float(packed_store[0, -1]),\
+                                 float(packed_store[1, -1]))
+    #
+    if max_degree is not None or max_order is not None:
+        #
+        if max_degree is None:
+            max_degree = file_degree;
+        gravity_field = gravity_field.truncate(max_degree, max_order);
+    #
+    return gravity_field
+
+#
+# Test function: load a small ICGEM file with EGM-2008 style constants, check
+# the binary cache, the truncation view and the unnormalized arrays, and check
+# that the J2 acceleration uses the constants of the file
+#
+if __name__ == '__main__':
+    #
+    import tempfile
+    #
+    mu_earth_file = 3.986004415e14*1.001;
+    r_earth_file = 6378137.0;
+    C_bar_20 = -4.84165143790815e-04;
+    #
+    coefficient_file = os.path.join(tempfile.mkdtemp(), 'test_field.gfc');
+    with open(coefficient_file, 'w') as text_file:
+        text_file.write('product_type gravity_field\n');
+        text_file.write('earth_gravity_constant %r\n' % mu_earth_file);
+        text_file.write('radius %.1f\n' % r_earth_file);
+        text_file.write('end_of_head ====\n');
+        text_file.write('gfc 2 0 %.14e 0.0D+00\n' % C_bar_20);
+        text_file.write('gfc 2 2 2.43938357328313D-06 -1.40027370385934D-06\n');
+        text_file.write('gfc 3 1 2.03046201047864D-06 2.48200415856872D-07\n');
+        text_file.write('gfc 4 4 -3.95257150025701D-07 3.08862751856956D-07\n');
+    #
+    gravity_field = load_gravity_field(coefficient_file);
+    assert os.path.exists(coefficient_file + '.cache.npy')
+    assert gravity_field.mu_earth == mu_earth_file and gravity_field.r_earth == r_earth_file
+    assert gravity_field.max_degree == 4 and gravity_field.coefficient(3, 1)[1] == 2.48200415856872e-07
+    #
+    # A second load memory-maps the cache and a truncation is a view of it
+    #
+    cached_field = load_gravity_field(coefficient_file);
+    assert isinstance(cached_field.C_packed.base, np.memmap) or\
+           isinstance(cached_field.C_packed, np.memmap)
+    truncated_field = cached_field.truncate(2);
+    assert truncated_field.max_degree == 2 and truncated_field.coefficient(3, 1) == (0.0, 0.0)
+    assert np.shares_memory(truncated_field.C_packed, cached_field.C_packed)
+    #
+    zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array =\
+    gravity_field.coefficient_arrays(4, 4);
+    assert np.isclose(zonal_coeff_array[2], np.sqrt(5.0)*C_bar_20, rtol=1.0e-15, atol=0.0)
+    assert np.isclose(sectorial_coeff_array[2, 2], np.sqrt(5.0/12.0)*2.43938357328313e-06,\
+                      rtol=1.0e-15, atol=0.0)
+    #
+    # J2 alone against its closed form with the file's GM and radius
+    #
+    r_ITRF_array = np.array([[7.0e6, 0.0, 0.0], [0.0, 3.0e6, 6.5e6], [4.2e7, 1.0e6, -2.0e6]]);
+    J2 = -np.sqrt(5.0)*C_bar_20;
+    r_mag = np.linalg.norm(r_ITRF_array, axis=1);
+    five_z_p2_over_r_p2 = 5.0*r_ITRF_array[:, 2]**2/r_mag**2;
+    accel_J2_closed_form = (-1.5*J2*mu_earth_file*r_earth_file**2/r_mag**5)[:, None]*r_ITRF_array*\
+    np.stack([1.0 - five_z_p2_over_r_p2, 1.0 - five_z_p2_over_r_p2, 3.0 - five_z_p2_over_r_p2], axis=1);
+    #
+    for engine in ('spherical', 'cartesian'):
+        accel_J2 = truncated_field.truncate(2, 0).acceleration(r_ITRF_array, engine=engine);
+        J2_error = np.max(np.linalg.norm(accel_J2 - accel_J2_closed_form, axis=1)/\
+                          np.linalg.norm(accel_J2_closed_form, axis=1));
+        assert J2_error < 1.0e-13, J2_error
+        print(engine, 'J2 with the file constants vs closed form max relative error', J2_error)
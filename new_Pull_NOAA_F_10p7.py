@@ -11,227 +11,120 @@ set that contains all the information needed to do this.
 Inputs:
     yr: Year of interest 
     mon: Month of interest
+    file_cache: Optional NOAAFileCache the files are read through (default:
+    the shared cache of get_default_noaa_file_cache)
+    base_url: Optional root of the NOAA files, e.g. a local FTP or HTTP
+    stand-in server (default: NOAA_base_url of noaa_file_cache)
 
 Outputs:
     F_10p7_obs_array: Array containing past observered F_10.7 flux values
     F_10p7_adj_future_array: Array containing predicted adjusted F_10.7 flux values
+    SpaceWeatherStore holds the same values as typed columns with the 81 day mean
 
 Copyright (c) Trevor Wolf 2018. All Rights Reserved. 
 """
 import numpy as np
-import urllib.request
+from noaa_file_cache import get_default_noaa_file_cache, noaa_quarterly_urls, NOAA_base_url
+from space_weather_store import parse_DSD, parse_45DF
 
-def pull_NOAA_F_10p7(yr, mon):
-    
+def _parse_rows(parse_fn):
     #
-    # Pull future information about the F_10.7 values
+    # Rows (yr, mon, day, F_10.7) of a file, latest first
     #
-    ftp_site = 'ftp://ftp.swpc.noaa.gov/pub/latest/45DF.txt';
-    #
-    month_vec = [b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep',\
-                 b'Oct', b'Nov', b'Dec'];
+    return lambda content: np.column_stack(parse_fn(content))[::-1]
+
+def pull_NOAA_F_10p7(yr, mon, file_cache=None, base_url=None):
     #
-    response = urllib.request.urlopen(ftp_site);
+    # Read the files through the local NOAA file cache
     #
-    first_entry_flag = 1;
-    index = 0;
+    if file_cache is None:
+        file_cache = get_default_noaa_file_cache();
+    if base_url is None:
+        base_url = NOAA_base_url;
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if index >= 3:
-            #
-            if line.decode('utf-8')[0:2] == '45':
-                break
-                #
-            for i in range(0, 5):
-                #
-                if i == 0:
-                    yr_line = float('20' + line.decode('utf-8')[53:55]);
-                    #
-                    mo_line_string = line[50:53];
-                    mo_line = float(month_vec.index(mo_line_string) + 1);
-                    #
-                    day_line = float(line[48:50]);
-                    #
-                    F_10p7_value = float(line[57:59])
-                        
-                elif i == 1:
-                    yr_line = float('20' + line.decode('utf-8')[41:43]);
-                    #
-                    mo_line_string = line[38:41];
-                    mo_line = float(month_vec.index(mo_line_string) + 1);
-                    #
-                    day_line = float(line[36:38]);
-                    #
-                    F_10p7_value = float(line[45:47])
-                elif i == 2:
-                    yr_line = float('20' + line.decode('utf-8')[29:31]);
-                    #
-                    mo_line_string = line[26:29];
-                    mo_line = float(month_vec.index(mo_line_string) + 1);
-                    #
-                    day_line = float(line[24:26]);
-                    #
-                    F_10p7_value = float(line[33:35])
-                elif i == 3:
-                    yr_line = float('20' + line.decode('utf-8')[17:19]);
-                    #
-                    mo_line_string = line[14:17];
-                    mo_line = float(month_vec.index(mo_line_string) + 1);
-                    #
-                    day_line = float(line[12:14]);
-                    #
-                    F_10p7_value = float(line[21:23])
-                else:
-                    yr_line = float('20' + line.decode('utf-8')[5:7]);
-                    #
-                    mo_line_string = line[2:5];
-                    mo_line = float(month_vec.index(mo_line_string) + 1);
-                    #
-                    day_line = float(line[0:2]);
-                    #
-                    F_10p7_value = float(line[9:11]);
-                
-                #
-                if first_entry_flag == 1:
-                    #
-                    F_10p7_adj_future_array = np.array([yr_line, mo_line, day_line, F_10p7_value]);
-                    first_entry_flag = 0;
-                    #
-                else:
-                    F_10p7_adj_future_array = np.vstack((F_10p7_adj_future_array, [yr_line, mo_line,\
-                                       day_line, F_10p7_value]));
-                    #
-        index = index + 1;
-            #
-        #
-    #
-    # Pull historical information from the current and previous two quarters
+    # Pull future information about the F_10.7 values, and historical
+    # information from the current and previous three quarters
     # Note: I am assuming that the ftp site only keeps four quarters up at any 
-    # given time. For that reason, the follows if statements are structured this 
-    # way. If this turns out not to be the case, then the file will need to be 
-    # changed to accomadate. 
-    #
-    # ftp site
-    #
-    ftp_site = 'ftp://ftp.swpc.noaa.gov/pub/indices/old_indices/'
+    # given time. If this turns out not to be the case, then the file will need
+    # to be changed to accomadate. 
     #
-    if mon < 4:
-        #
-        first_file = ftp_site + str(yr) + 'Q1_DSD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q2_DSD.txt';
-        third_file = ftp_site + str(yr - 1) + 'Q3_DSD.txt';
-        second_file = ftp_site + str(yr - 1) + 'Q4_DSD.txt';
-        #
-    elif mon < 7:
-        #
-        second_file = ftp_site + str(yr) + 'Q1_DSD.txt';
-        first_file = ftp_site + str(yr) + 'Q2_DSD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q3_DSD.txt';
-        third_file = ftp_site + str(yr - 1) + 'Q4_DSD.txt';
-        #
-    elif mon < 10:
-        #
-        third_file = ftp_site + str(yr) + 'Q1_DSD.txt';
-        second_file = ftp_site + str(yr) + 'Q2_DSD.txt';
-        first_file = ftp_site + str(yr) + 'Q3_DSD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q4_DSD.txt';
-        
-    else:
-        #
-        fourth_file = ftp_site + str(yr) + 'Q1_DSD.txt';
-        third_file = ftp_site + str(yr) + 'Q2_DSD.txt';
-        second_file = ftp_site + str(yr) + 'Q3_DSD.txt';
-        first_file = ftp_site + str(yr) + 'Q4_DSD.txt';
-            
+    quarterly_files = noaa_quarterly_urls(yr, mon, 'DSD', base_url);
 #
-# Extract the values contained in these files into an arrays starting from the 
-# closest to date and moving backwards
+# All five files are fetched concurrently and each is parsed as soon as it
+# arrives. The quarterly rows are then merged starting from the closest to date
+# file and moving backwards
 #
-    response = urllib.request.urlopen(first_file);
+    file_rows = file_cache.fetch_many([base_url + 'latest/45DF.txt'] + quarterly_files,\
+                [_parse_rows(parse_45DF)] + [_parse_rows(parse_DSD)]*len(quarterly_files));
     #
-    first_entry_flag = 1;
+    F_10p7_adj_future_array = file_rows[0];
+    F_10p7_obs_array = np.concatenate(file_rows[1:]);
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        F_10p7_value = float(line[13:15]);
-        #
-        if first_entry_flag == 1:
-            #
-            F_10p7_obs_array = np.array([yr_line, mo_line, day_line, F_10p7_value]);
-            first_entry_flag = 0;
-            #
-        else:
-            F_10p7_obs_array = np.vstack((F_10p7_obs_array, [yr_line, mo_line,\
-                               day_line, F_10p7_value]));
-            #
+    return F_10p7_obs_array, F_10p7_adj_future_array
+
 #
-# Repeat the above for the next files in order from closest to-date to latest
+# Test function: pull synthetic 45DF and quarterly DSD files from a local mirror
+# in offline mode and compare with the line by line parse of the original
+# loops, reading the full three digit F_10.7 fields and -999 as NaN
 #
-    response = urllib.request.urlopen(second_file);
+if __name__ == '__main__':
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        F_10p7_value = float(line[13:15]);
-        #
-        F_10p7_obs_array = np.vstack((F_10p7_obs_array, [yr_line, mo_line,\
-                               day_line, F_10p7_value]));
+    import os
+    import tempfile
+    from noaa_file_cache import NOAAFileCache
     #
-    response = urllib.request.urlopen(third_file);
+    yr = 2018;
+    mon = 9;
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        F_10p7_value = float(line[13:15]);
-        #
-        F_10p7_obs_array = np.vstack((F_10p7_obs_array, [yr_line, mo_line,\
-                               day_line, F_10p7_value]));
-    #
-    response = urllib.request.urlopen(fourth_file);
-    #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        F_10p7_value = float(line[13:15]);
-        #
-        F_10p7_obs_array = np.vstack((F_10p7_obs_array, [yr_line, mo_line,\
-                               day_line, F_10p7_value]));
-        #
+    mirror_dir = tempfile.mkdtemp();
+    rng = np.random.default_rng(25);
+    month_vec = [b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep',\
+                 b'Oct', b'Nov', b'Dec'];
     #
-    return F_10p7_obs_array, F_10p7_adj_future_array
-
-yr = 2018;
-mon = 9;
-
-F_10p7_obs_array, F_10p7_adj_future_array = pull_NOAA_F_10p7(yr, mon)
-        
-        
-    
-
-
+    for url in noaa_quarterly_urls(yr, mon, 'DSD'):
+        #
+        quarter_month = 3*int(os.path.basename(url)[5]) - 2;
+        lines = [b'#  Date  Radio Flux'];
+        for day in range(1, 4):
+            F_10p7_value = rng.choice([-999, 68, 135, 250]);
+            lines.append(('%4d %02d %02d %4d' % (int(os.path.basename(url)[0:4]), quarter_month, day,\
+                          F_10p7_value)).encode() + b'     13     30      0    -999      *   3');
+        #
+        with open(os.path.join(mirror_dir, os.path.basename(url)), 'wb') as mirror_file:
+            mirror_file.write(b'\n'.join(lines) + b'\n');
+    #
+    forecast_lines = [b':Product: 45DF.txt', b'45-DAY AP FORECAST',\
+                      b'03Oct18 005 04Oct18 005 05Oct18 005 06Oct18 005 07Oct18 005',\
+                      b'45-DAY F10.7 CM FLUX FORECAST'];
+    for week in range(0, 2):
+        forecast_lines.append(b' '.join(b'%02d%s18 %03d' % (1 + 5*week + i, month_vec[9],\
+                              rng.integers(65, 200)) for i in range(0, 5)));
+    forecast_lines = forecast_lines + [b'FORECASTER: TEST', b'99999'];
+    with open(os.path.join(mirror_dir, '45DF.txt'), 'wb') as mirror_file:
+        mirror_file.write(b'\n'.join(forecast_lines) + b'\n');
+    #
+    file_cache = NOAAFileCache(tempfile.mkdtemp(), offline=True, mirror_dir=mirror_dir);
+    F_10p7_obs_array, F_10p7_adj_future_array = pull_NOAA_F_10p7(yr, mon, file_cache);
+    #
+    reference_obs_rows = [];
+    for url in noaa_quarterly_urls(yr, mon, 'DSD'):
+        with open(os.path.join(mirror_dir, os.path.basename(url)), 'rb') as mirror_file:
+            for line in reversed(mirror_file.readlines()):
+                if line[0:1] == b'#':
+                    break
+                F_10p7_value = float(line[10:15]);
+                reference_obs_rows.append([float(line[0:4]), float(line[5:7]), float(line[8:10]),\
+                                           F_10p7_value if F_10p7_value >= 0.0 else np.nan]);
+    #
+    reference_future_rows = [];
+    for line in reversed(forecast_lines[4:-2]):
+        for i in range(4, -1, -1):
+            entry = line[12*i:12*i + 11];
+            reference_future_rows.append([float(b'20' + entry[5:7]),\
+                                          float(month_vec.index(entry[2:5]) + 1),\
+                                          float(entry[0:2]), float(entry[8:11])]);
+    #
+    assert np.array_equal(F_10p7_obs_array, np.array(reference_obs_rows), equal_nan=True)
+    assert np.array_equal(F_10p7_adj_future_array, np.array(reference_future_rows))
+    print('F_10.7 rows match the line by line parse:', F_10p7_obs_array.shape,\
+          F_10p7_adj_future_array.shape)
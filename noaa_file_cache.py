@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+This class keeps a persistent local copy of the NOAA space weather files used by
+pull_NOAA_K_p and new_Pull_NOAA_F_10p7, so that they are not downloaded from the
+NOAA FTP site on every call. Files are stored in cache_dir under a name derived
+from their URL, with a small .json record of the URL and the time of the
+download.
+
+Freshness policy:
+    - Quarterly files (YYYYQn_DGD.txt, YYYYQn_DSD.txt) are final and never
+      refetched once their last data line is the last day of the quarter. A
+      copy downloaded just after the quarter closed that still lacks the
+      closing day is refetched like any other file.
+    - All other files (the quarterly file of the current quarter, 45DF.txt, ...)
+      are refetched once their copy is older than max_age seconds.
+If a refetch fails, the stale copy is returned rather than failing the run.
+
+Downloads are validated before they replace a cached copy. They must be
+non-empty ASCII text. Quarterly files must also contain a '#' header and end
+with a dated data line, and 45DF.txt must contain its '45' header line.
+
+In offline mode no network access is made. Files are read from the cache, or
+from mirror_dir, a local directory holding copies of the NOAA files under
+their original file names. The mirror is also consulted in online mode before
+the network when a file is not cached. The environment variables
+SSA_NOAA_CACHE_DIR, SSA_NOAA_OFFLINE (set to 1) and SSA_NOAA_MIRROR_DIR
+configure the shared cache returned by get_default_noaa_file_cache, so that
+air-gapped nodes need no code changes.
+
+Inputs:
+    cache_dir: Directory of the cache (default ~/.cache/SSA-telescope/noaa)
+    offline: If True, never access the network
+    mirror_dir: Optional local directory mirror of the NOAA files
+    max_age: Age (s) after which files that may still change are refetched
+    timeout: Timeout (s) of each download; a hung server then falls back to the
+    stale copy like any other failed download
+    max_connections_per_host: Largest number of concurrent downloads from one
+    host in fetch_many (default 5, the files of one pull function)
+
+fetch_many(urls, parse_fn, max_workers) fetches several files concurrently on a
+thread pool and passes each one to parse_fn (one function, or a list with one
+per url) as soon as it arrives, so a cold start costs about one round trip
+instead of one per file. An FTP control connection carries one transfer at a
+time, so every file being downloaded at once has its own connection. At most
+max_connections_per_host downloads run against one host at a time. Each
+worker thread has its own urllib opener, whose CacheFTPHandler keeps its
+connection open for the next file it fetches from the same host within the
+call. noaa_quarterly_urls
+builds the URLs of the quarterly files under base_url (NOAA_base_url by
+default), which can point to a local FTP or HTTP stand-in server.
+
+Outputs:
+    fetch(url) returns the content of the file as bytes. A FileNotFoundError
+    is raised in offline mode when the file is neither cached nor mirrored, and
+    a ValueError when a download fails validation and there is no cached copy.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+quarterly_file_pattern = re.compile(r'(\d{4})Q([1-4])_D[GS]D\.txt$');
+
+# Root of the NOAA SWPC files. A local FTP or HTTP server holding the same
+# 'indices/old_indices/' and 'latest/' layout can be used instead
+NOAA_base_url = 'ftp://ftp.swpc.noaa.gov/pub/';
+
+def noaa_quarterly_urls(yr, mon, file_type, base_url=None):
+    #
+    # URLs of the quarterly files ('DGD' or 'DSD') of the quarter containing
+    # the month of interest and of the three quarters before it, most recent first
+    #
+    if base_url is None:
+        base_url = NOAA_base_url;
+    #
+    quarter_index = 4*yr + (mon - 1)//3;
+    #
+    return [base_url + 'indices/old_indices/' + str((quarter_index - k)//4) + 'Q' +\
+            str((quarter_index - k)%4 + 1) + '_' + file_type + '.txt' for k in range(0, 4)]
+
+class NOAAFileCache():
+    #
+    def __init__(self, cache_dir=None, offline=False, mirror_dir=None, max_age=12.0*3600.0,\
+                 timeout=60.0, max_connections_per_host=5):
+        #
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'SSA-telescope', 'noaa');
+        #
+        self.cache_dir = cache_dir;
+        self.offline = offline;
+        self.mirror_dir = mirror_dir;
+        self.max_age = max_age;
+        self.timeout = timeout;
+        self.max_connections_per_host = max_connections_per_host;
+        #
+        self.hits = 0;
+        self.downloads = 0;
+        #
+        self._thread_local = threading.local();
+        self._counter_lock = threading.Lock();
+    #
+    def _count(self, counter):
+        #
+        # Increment hits or downloads, which fetch_many updates from its threads
+        #
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1);
+    #
+    def _opener(self):
+        #
+        # One opener per thread. Its CacheFTPHandler keeps the thread's FTP
+        # connection to a host open for the next file it fetches there
+        #
+        if not hasattr(self._thread_local, 'opener'):
+            self._thread_local.opener = urllib.request.build_opener(\
+                                        urllib.request.CacheFTPHandler());
+        #
+        return self._thread_local.opener
+    #
+    def _cache_paths(self, url):
+        #
+        # Path of the cached content and of its .json record
+        #
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16];
+        content_path = os.path.join(self.cache_dir, key + '_' + os.path.basename(url));
+        #
+        return content_path, content_path + '.json'
+    #
+    def _is_final(self, url, content):
+        #
+        # A quarterly file is final once it holds the last day of its quarter
+        #
+        match = quarterly_file_pattern.search(url);
+        if match is None:
+            return False
+        #
+        yr = int(match.group(1));
+        quarter = int(match.group(2));
+        #
+        if quarter == 4:
+            quarter_end = datetime.date(yr + 1, 1, 1);
+        else:
+            quarter_end = datetime.date(yr, 3*quarter + 1, 1);
+        last_day = (quarter_end - datetime.timedelta(days=1)).strftime('%Y %m %d');
+        #
+        data_lines = [line for line in content.splitlines() if line[0:4].isdigit()];
+        #
+        return len(data_lines) > 0 and data_lines[-1].decode('ascii', 'replace')[0:10] == last_day
+    #
+    def _validate(self, url, content):
+        #
+        try:
+            text = content.decode('ascii');
+        except UnicodeDecodeError:
+            return False
+        #
+        lines = [line for line in text.splitlines() if line.strip()];
+        if not lines:
+            return False
+        #
+        file_name = os.path.basename(url);
+        #
+        if quarterly_file_pattern.search(file_name):
+            return any(line.startswith('#') for line in lines) and\
+            re.match(r'\d{4} \d{2} \d{2}', lines[-1]) is not None
+        #
+        if file_name == '45DF.txt':
+            return any(line.startswith('45') for line in lines)
+        #
+        return True
+    #
+    def _read_cached(self, url):
+        #
+        # Cached content and fetch time, or (None, None)
+        #
+        content_path, record_path = self._cache_paths(url);
+        #
+        if not (os.path.exists(content_path) and os.path.exists(record_path)):
+            return None, None
+        #
+        with open(record_path, 'r') as record_file:
+            fetched_time = json.load(record_file)['fetched'];
+        with open(content_path, 'rb') as content_file:
+            content = content_file.read();
+        #
+        return content, fetched_time
+    #
+    def _read_mirror(self, url):
+        #
+        if self.mirror_dir is None:
+            return None
+        #
+        mirror_path = os.path.join(self.mirror_dir, os.path.basename(url));
+        if not os.path.exists(mirror_path):
+            return None
+        #
+        with open(mirror_path, 'rb') as mirror_file:
+            return mirror_file.read()
+    #
+    def _store(self, url, content, fetched_time):
+        #
+        # Write the content and its record atomically
+        #
+        os.makedirs(self.cache_dir, exist_ok=True);
+        content_path, record_path = self._cache_paths(url);
+        #
+        with open(content_path + '.tmp', 'wb') as content_file:
+            content_file.write(content);
+        os.replace(content_path + '.tmp', content_path);
+        #
+        with open(record_path + '.tmp', 'w') as record_file:
+            json.dump({'url': url, 'fetched': fetched_time}, record_file);
+        os.replace(record_path + '.tmp', record_path);
+    #
+    def fetch(self, url):
+        #
+        content, fetched_time = self._read_cached(url);
+        #
+        if content is not None:
+            if self.offline or self._is_final(url, content) or\
+               time.time() - fetched_time < self.max_age:
+                self._count('hits');
+                return content
+        #
+        if content is None:
+            mirror_content = self._read_mirror(url);
+            if mirror_content is not None:
+                self._count('hits');
+                return mirror_content
+        #
+        if self.offline:
+            raise FileNotFoundError('No cached or mirrored copy of ' + url + ' in offline mode')
+        #
+        # Download the file, falling back to a stale copy if that fails
+        #
+        try:
+            with self._opener().open(url, timeout=self.timeout) as response:
+                downloaded = response.read();
+        except OSError:
+            if content is not None:
+                return content
+            raise
+        #
+        self._count('downloads');
+        #
+        if not self._validate(url, downloaded):
+            if content is not None:
+                return content
+            raise ValueError('The file downloaded from ' + url + ' failed validation')
+        #
+        self._store(url, downloaded, time.time());
+        #
+        return downloaded
+    #
+    def fetch_many(self, urls, parse_fn=None, max_workers=None):
+        #
+        # Fetch the files concurrently on a thread pool. Each file is passed to
+        # parse_fn (one function, or one per url) as soon as it arrives, and the
+        # results are returned in the order of urls
+        #
+        results = [None]*len(urls);
+        #
+        if not urls:
+            return results
+        #
+        if parse_fn is None or callable(parse_fn):
+            parse_fn = [parse_fn]*len(urls);
+        #
+        # Limit the concurrent downloads from each host
+        #
+        host_slots = {};
+        for url in urls:
+            host = urllib.parse.urlsplit(url).netloc;
+            if host not in host_slots:
+                host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host);
+        #
+        def fetch_in_host_slot(url):
+            with host_slots[urllib.parse.urlsplit(url).netloc]:
+                return self.fetch(url)
+        #
+        with concurrent.futures.ThreadPoolExecutor(max_workers or len(urls)) as executor:
+            #
+            future_index = {executor.submit(fetch_in_host_slot, url): i for i, url in\
+                            enumerate(urls)};
+            #
+            for future in concurrent.futures.as_completed(future_index):
+                content = future.result();
+                i = future_index[future];
+                results[i] = content if parse_fn[i] is None else parse_fn[i](content);
+        #
+        return results
+
+_default_noaa_file_cache = None;
+
+def get_default_noaa_file_cache():
+    #
+    # Shared cache configured from the environment variables
+    #
+    global _default_noaa_file_cache
+    #
+    if _default_noaa_file_cache is None:
+        _default_noaa_file_cache = NOAAFileCache(os.environ.get('SSA_NOAA_CACHE_DIR'),\
+                                   os.environ.get('SSA_NOAA_OFFLINE', '0') == '1',\
+                                   os.environ.get('SSA_NOAA_MIRROR_DIR'));
+    #
+    return _default_noaa_file_cache
+
+#
+# Test function: serve NOAA style files from a threaded local HTTP server and
+# count the requests of cold, warm, offline and stale runs, check the per-host
+# connection limit and the rejection of an invalid download
+#
+if __name__ == '__main__':
+    #
+    import functools
+    import http.server
+    import tempfile
+    #
+    server_dir = tempfile.mkdtemp();
+    os.makedirs(os.path.join(server_dir, 'indices', 'old_indices'));
+    os.makedirs(os.path.join(server_dir, 'latest'));
+    #
+    def write_server_file(relative_path, content):
+        with open(os.path.join(server_dir, relative_path), 'wb') as server_file:
+            server_file.write(content);
+    #
+    # The quarters before 2018Q3 are complete, 2018Q3 is still being filled
+    #
+    for url in noaa_quarterly_urls(2018, 9, 'DGD') + noaa_quarterly_urls(2018, 9, 'DSD'):
+        #
+        file_name = os.path.basename(url);
+        yr = int(file_name[0:4]);
+        quarter = int(file_name[5]);
+        last_day = datetime.date(yr, 9, 15) if (yr, quarter) == (2018, 3) else\
+        datetime.date(yr + quarter//4, 3*quarter%12 + 1, 1) - datetime.timedelta(days=1);
+        #
+        write_server_file(os.path.join('indices', 'old_indices', file_name),\
+                          b'# Header\n' + last_day.strftime('%Y %m %d').encode() + b'  70\n');
+    #
+    write_server_file(os.path.join('latest', '45DF.txt'),\
+                      b':Product: 45DF.txt\n45-DAY F10.7 CM FLUX FORECAST\n');
+    write_server_file(os.path.join('latest', 'binary.txt'), b'\xff\xfe\x00');
+    #
+    # Request handler counting the requests and the most concurrent ones
+    #
+    request_counts = {'total': 0, 'active': 0, 'max_active': 0};
+    request_lock = threading.Lock();
+    #
+    class CountingHandler(http.server.SimpleHTTPRequestHandler):
+        #
+        def do_GET(self):
+            with request_lock:
+                request_counts['total'] += 1;
+                request_counts['active'] += 1;
+                request_counts['max_active'] = max(request_counts['max_active'],\
+                                                   request_counts['active']);
+            try:
+                time.sleep(0.05);
+                super().do_GET();
+            finally:
+                with request_lock:
+                    request_counts['active'] -= 1;
+        #
+        def log_message(self, *args):
+            pass
+    #
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),\
+             functools.partial(CountingHandler, directory=server_dir));
+    threading.Thread(target=server.serve_forever, daemon=True).start();
+    base_url = 'http://127.0.0.1:%d/' % server.server_address[1];
+    #
+    urls = noaa_quarterly_urls(2018, 9, 'DGD', base_url) +\
+           noaa_quarterly_urls(2018, 9, 'DSD', base_url) + [base_url + 'latest/45DF.txt'];
+    #
+    def requests_made(fetch_fn):
+        # Number of server requests made by fetch_fn
+        count_before = request_counts['total'];
+        fetch_fn();
+        return request_counts['total'] - count_before
+    #
+    cache_dir = tempfile.mkdtemp();
+    file_cache = NOAAFileCache(cache_dir, max_connections_per_host=2);
+    #
+    # Cold: every file is downloaded, at most two at a time
+    #
+    cold_results = [];
+    cold_requests = requests_made(lambda: cold_results.extend(file_cache.fetch_many(urls)));
+    assert cold_requests == 9 and file_cache.downloads == 9, cold_requests
+    cold_max_active = request_counts['max_active'];
+    assert cold_max_active == 2, cold_max_active
+    assert cold_results[-1].startswith(b':Product')
+    #
+    # Warm and offline: everything is served from the cache
+    #
+    warm_requests = requests_made(lambda: file_cache.fetch_many(urls));
+    assert warm_requests == 0 and file_cache.hits == 9, warm_requests
+    #
+    offline_cache = NOAAFileCache(cache_dir, offline=True);
+    offline_requests = requests_made(lambda: offline_cache.fetch_many(urls));
+    assert offline_requests == 0 and offline_cache.hits == 9, offline_requests
+    #
+    # Stale: only the incomplete 2018Q3 files and 45DF.txt are refetched, the
+    # complete quarters are final
+    #
+    stale_cache = NOAAFileCache(cache_dir, max_age=0.0);
+    stale_requests = requests_made(lambda: stale_cache.fetch_many(urls));
+    assert stale_requests == 3, stale_requests
+    #
+    # Invalid downloads: a cached copy is kept when the new download fails
+    # validation, and a file with no cached copy raises a ValueError
+    #
+    write_server_file(os.path.join('latest', '45DF.txt'), b'Service unavailable\n');
+    stale_content = stale_cache.fetch(base_url + 'latest/45DF.txt');
+    assert stale_content.startswith(b':Product')
+    #
+    try:
+        stale_cache.fetch(base_url + 'latest/binary.txt');
+        raise AssertionError('An invalid download was accepted')
+    except ValueError:
+        pass
+    #
+    server.shutdown();
+    print('Requests: cold', cold_requests, 'warm', warm_requests, 'offline', offline_requests,\
+          'stale', stale_requests, 'most concurrent when cold', cold_max_active);
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+This module computes the point-mass perturbations of any number of third bodies
+on a batch of satellites. third_body_accelerations is limited to the Sun and
+the Moon, while GEO and HEO objects also feel Venus and Jupiter. With s the
+geocentric position of a body and d = s - r the satellite-to-body vector, the
+perturbation is written in Battin's form
+
+    q = r.(r - 2*s)/(s.s),   F(q) = q*(3 + 3*q + q^2)/(1 + (1 + q)^(3/2))
+    accel = -mu_body/|d|^3*(r + F(q)*s)
+
+which equals mu_body*(d/|d|^3 - s/|s|^3). It avoids the cancellation between
+the direct and indirect terms when the body is far away, and it needs no series
+cut-off. All bodies and satellites are evaluated in one (bodies x satellites
+x 3) broadcast and then summed over the bodies.
+
+PointMassPerturbations draws the body positions from an ephemeris provider with
+a position(body, et) method returning km, such as ChebyshevEphemeris. The
+positions of the last epoch are kept, so repeated calls at one epoch (for
+example over several batches of a catalog) query the ephemeris once.
+
+Functions:
+    point_mass_perturbations(rECIF_array, r_bodies, mu_bodies): (N,3) satellite
+        positions (m), (K,3) body positions (m) and (K,) gravitational
+        parameters (m^3/s^2). Returns the (N,3) total acceleration (m/s^2).
+
+    PointMassPerturbations(ephemeris, bodies, mu_bodies): Calling it with an
+        (N,3) array of ECIF positions (m) and an ephemeris time et returns the
+        (N,3) total acceleration (m/s^2). bodies are the ephemeris body names.
+        mu_bodies defaults to the values in mu_body_table.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+
+# Gravitational parameters (m^3/s^2) of the bodies in the DE430 ephemerides
+mu_body_table = {'SUN': 1.32712440018e20,\
+                 'MOON': 4.9048695e12,\
+                 'MERCURY': 2.2031780e13,\
+                 'VENUS': 3.24858592e14,\
+                 'MARS BARYCENTER': 4.282837e13,\
+                 'JUPITER BARYCENTER': 1.26712764e17,\
+                 'SATURN BARYCENTER': 3.7940585e16};
+
+def _battin_F(q):
+    #
+    # Battin's F(q) = (1 + q)^(3/2) - 1, written to avoid cancellation for small q
+    #
+    return q*(3.0 + 3.0*q + q**2)/(1.0 + (1.0 + q)**1.5)
+
+def point_mass_perturbations(rECIF_array, r_bodies, mu_bodies):
+    #
+    rECIF_array = np.atleast_2d(np.asarray(rECIF_array, dtype=float));
+    r_bodies = np.atleast_2d(np.asarray(r_bodies, dtype=float));
+    mu_bodies = np.atleast_1d(np.asarray(mu_bodies, dtype=float));
+    #
+    # Broadcast over (bodies, satellites, 3)
+    #
+    r = rECIF_array[None, :, :];
+    s = r_bodies[:, None, :];
+    #
+    d = s - r;
+    norm_d = np.linalg.norm(d, axis=-1);
+    #
+    q = np.sum(r*(r - 2.0*s), axis=-1)/np.sum(s*s, axis=-1);
+    #
+    accel_bodies = -(mu_bodies[:, None]/norm_d**3)[..., None]*(r + _battin_F(q)[..., None]*s);
+    #
+    return np.sum(accel_bodies, axis=0)
+
+class PointMassPerturbations():
+    #
+    def __init__(self, ephemeris, bodies=('Sun', 'Moon', 'Venus', 'Jupiter Barycenter'),\
+                 mu_bodies=None):
+        #
+        self.ephemeris = ephemeris;
+        self.bodies = list(bodies);
+        #
+        if mu_bodies is None:
+            mu_bodies = [mu_body_table[body.upper()] for body in self.bodies];
+        #
+        self.mu_bodies = np.asarray(mu_bodies, dtype=float);
+        #
+        self.et_cached = None;
+        self.r_bodies_cached = None;
+    #
+    def body_positions(self, et):
+        #
+        # (K,3) body positions (m) at et, reusing those of the last epoch
+        #
+        if et != self.et_cached:
+            self.r_bodies_cached = 1000.0*np.array([self.ephemeris.position(body, et)\
+                                                    for body in self.bodies]);
+            self.et_cached = et;
+        #
+        return self.r_bodies_cached
+    #
+    def __call__(self, rECIF_array, et):
+        return point_mass_perturbations(rECIF_array, self.body_positions(et), self.mu_bodies)
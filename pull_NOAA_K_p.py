@@ -6,223 +6,96 @@ in the Jacchia 71' atmospheric model.
 Input:
     yr: Year of interest
     mon: Month of interest
+    file_cache: Optional NOAAFileCache the files are read through (default:
+    the shared cache of get_default_noaa_file_cache)
+    base_url: Optional root of the NOAA files, e.g. a local FTP or HTTP
+    stand-in server (default: NOAA_base_url of noaa_file_cache)
 Output: 
     K_p_array: Array containing the K_p and the yr, month, day and hr that the 
-               The observation was taken at 
+               The observation was taken at. Missing values are NaN.
+               SpaceWeatherStore holds the same values as typed columns.
     
 Copyright (c) Trevor Wolf 2018. All Rights Reserved.
 """
-import urllib.request
+from noaa_file_cache import get_default_noaa_file_cache, noaa_quarterly_urls
+from space_weather_store import parse_DGD
 import numpy as np
 
-def pull_NOAA_K_p(yr, mon):
+def _parse_DGD_rows(content):
     #
-    # Pull historical information from the current and previous two quarters
-    # Note: I am assuming that the ftp site only keeps four quarters up at any 
-    # given time. For that reason, the follows if statements are structured this 
-    # way. If this turns out not to be the case, then the file will need to be 
-    # changed to accomadate. 
+    # Rows (yr, mon, day, hr, K_p) of a quarterly DGD file, latest first. The
+    # hr is the start of the 3 hr interval the K_p value averages over
     #
-    # ftp site
+    date, K_p = parse_DGD(content);
     #
-    ftp_site = 'ftp://ftp.swpc.noaa.gov/pub/indices/old_indices/'
+    return np.column_stack((date, K_p))[::-1]
+
+def pull_NOAA_K_p(yr, mon, file_cache=None, base_url=None):
     #
-    if mon < 4:
-        #
-        first_file = ftp_site + str(yr) + 'Q1_DGD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q2_DGD.txt';
-        third_file = ftp_site + str(yr - 1) + 'Q3_DGD.txt';
-        second_file = ftp_site + str(yr - 1) + 'Q4_DGD.txt';
-        #
-    elif mon < 7:
-        #
-        second_file = ftp_site + str(yr) + 'Q1_DGD.txt';
-        first_file = ftp_site + str(yr) + 'Q2_DGD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q3_DGD.txt';
-        third_file = ftp_site + str(yr - 1) + 'Q4_DGD.txt';
-        #
-    elif mon < 10:
-        #
-        third_file = ftp_site + str(yr) + 'Q1_DGD.txt';
-        second_file = ftp_site + str(yr) + 'Q2_DGD.txt';
-        first_file = ftp_site + str(yr) + 'Q3_DGD.txt';
-        fourth_file = ftp_site + str(yr - 1) + 'Q4_DGD.txt';
-        
-    else:
-        #
-        fourth_file = ftp_site + str(yr) + 'Q1_DGD.txt';
-        third_file = ftp_site + str(yr) + 'Q2_DGD.txt';
-        second_file = ftp_site + str(yr) + 'Q3_DGD.txt';
-        first_file = ftp_site + str(yr) + 'Q4_DGD.txt';
-            
-#
-# Extract the values contained in these files into an arrays starting from the 
-# closest to date and moving backwards
-#
-    response = urllib.request.urlopen(first_file);
+    # Read the files through the local NOAA file cache
     #
-    first_entry_flag = 1;
+    if file_cache is None:
+        file_cache = get_default_noaa_file_cache();
     #
-    hr_vec = [21, 18, 15, 12, 9, 6, 3, 0]; # This assumes that the average over three hours
-    # is the value given at the epoch three hours prior
+    # Pull historical information from the current and previous three quarters
+    # Note: I am assuming that the ftp site only keeps four quarters up at any 
+    # given time. If this turns out not to be the case, then the file will need
+    # to be changed to accomadate. 
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        # Find the values that are updated in 3-hr intervals
-        for i in range(0, 8):
-            #
-            hr_line = hr_vec[i];
-            #
-            if i == 0:
-                K_p_value = float(line[77:79]);
-            elif i == 1:
-                K_p_value = float(line[75:77]);
-            elif i == 2:
-                K_p_value = float(line[73:75]);
-            elif i == 3:
-                K_p_value = float(line[71:73]);
-            elif i == 4:
-                K_p_value = float(line[69:71]);
-            elif i == 5:
-                K_p_value = float(line[67:69]);
-            elif i == 7:
-                K_p_value = float(line[65:67]);
-            #
-            if first_entry_flag == 1:
-                #
-                K_p_array = np.array([yr_line, mo_line, day_line, hr_line,\
-                                             K_p_value]);
-                first_entry_flag = 0;
-                #
-            else:
-                K_p_array = np.vstack((K_p_array, [yr_line, mo_line,\
-                               day_line, hr_line, K_p_value]));
-            #
+    quarterly_files = noaa_quarterly_urls(yr, mon, 'DGD', base_url);
 #
-# Repeat the above for the next files in order from closest to-date to latest
+# The four files are fetched concurrently and each is parsed as soon as it
+# arrives. The rows are then merged starting from the closest to date file and
+# moving backwards
 #
-    response = urllib.request.urlopen(second_file);
+    file_rows = file_cache.fetch_many(quarterly_files, _parse_DGD_rows);
     #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        # Find the values that are updated in 3-hr intervals
-        for i in range(0, 8):
-            #
-            hr_line = hr_vec[i];
-            #
-            if i == 0:
-                K_p_value = float(line[77:79]);
-            elif i == 1:
-                K_p_value = float(line[75:77]);
-            elif i == 2:
-                K_p_value = float(line[73:75]);
-            elif i == 3:
-                K_p_value = float(line[71:73]);
-            elif i == 4:
-                K_p_value = float(line[69:71]);
-            elif i == 5:
-                K_p_value = float(line[67:69]);
-            elif i == 7:
-                K_p_value = float(line[65:67]);
-            #
-            K_p_array = np.vstack((K_p_array, [yr_line, mo_line,\
-                               day_line, hr_line, K_p_value]));
-            #
-    #
-    response = urllib.request.urlopen(third_file);
-    #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        # Find the values that are updated in 3-hr intervals
-        for i in range(0, 8):
-            #
-            hr_line = hr_vec[i];
-            #
-            if i == 0:
-                K_p_value = float(line[77:79]);
-            elif i == 1:
-                K_p_value = float(line[75:77]);
-            elif i == 2:
-                K_p_value = float(line[73:75]);
-            elif i == 3:
-                K_p_value = float(line[71:73]);
-            elif i == 4:
-                K_p_value = float(line[69:71]);
-            elif i == 5:
-                K_p_value = float(line[67:69]);
-            elif i == 7:
-                K_p_value = float(line[65:67]);
-            #
-            K_p_array = np.vstack((K_p_array, [yr_line, mo_line,\
-                               day_line, hr_line, K_p_value]));
-    #
-    response = urllib.request.urlopen(fourth_file);
-    #
-    for line in reversed(list(response.readlines())):
-        #
-        if line.decode('utf-8')[0] == '#':
-            break
-        #
-        yr_line = float(line[0:4]);
-        mo_line = float(line[5:7]);
-        day_line = float(line[8:10]);
-        #
-        # Find the values that are updated in 3-hr intervals
-        for i in range(0, 8):
-            #
-            hr_line = hr_vec[i];
-            #
-            if i == 0:
-                K_p_value = float(line[77:79]);
-            elif i == 1:
-                K_p_value = float(line[75:77]);
-            elif i == 2:
-                K_p_value = float(line[73:75]);
-            elif i == 3:
-                K_p_value = float(line[71:73]);
-            elif i == 4:
-                K_p_value = float(line[69:71]);
-            elif i == 5:
-                K_p_value = float(line[67:69]);
-            elif i == 7:
-                K_p_value = float(line[65:67]);
-            #
-            K_p_array = np.vstack((K_p_array, [yr_line, mo_line,\
-                               day_line, hr_line, K_p_value]));
-        #
+    K_p_array = np.concatenate(file_rows);
     #
     return K_p_array
 
 #
-# Test function
+# Test function: pull four synthetic quarterly files from a local mirror in
+# offline mode and compare with the line by line parse of the original loops,
+# reading hr 21 to hr 0 from columns 77:79 down to 63:65 and -1 as NaN
 #
-yr = 2018;
-mon = 9;
-
-
-K_p_array = pull_NOAA_K_p(yr, mon)
-
-
-
-
+if __name__ == '__main__':
+    #
+    import os
+    import tempfile
+    from noaa_file_cache import NOAAFileCache
+    #
+    yr = 2018;
+    mon = 9;
+    #
+    mirror_dir = tempfile.mkdtemp();
+    rng = np.random.default_rng(25);
+    #
+    for url in noaa_quarterly_urls(yr, mon, 'DGD'):
+        #
+        quarter_month = 3*int(os.path.basename(url)[5]) - 2;
+        lines = [b'#  Date        A     K-indices        A     K-indices        A     K-indices'];
+        for day in range(1, 4):
+            K_p_values = rng.integers(-1, 10, 8);
+            lines.append(('%4d %02d %02d' % (int(os.path.basename(url)[0:4]), quarter_month, day)).encode() +\
+                         b' '*53 + b''.join(b'%2d' % K_p_value for K_p_value in K_p_values));
+        #
+        with open(os.path.join(mirror_dir, os.path.basename(url)), 'wb') as mirror_file:
+            mirror_file.write(b'\n'.join(lines) + b'\n');
+    #
+    file_cache = NOAAFileCache(tempfile.mkdtemp(), offline=True, mirror_dir=mirror_dir);
+    K_p_array = pull_NOAA_K_p(yr, mon, file_cache);
+    #
+    reference_rows = [];
+    for url in noaa_quarterly_urls(yr, mon, 'DGD'):
+        with open(os.path.join(mirror_dir, os.path.basename(url)), 'rb') as mirror_file:
+            for line in reversed(mirror_file.readlines()):
+                if line[0:1] == b'#':
+                    break
+                for i, hr_line in enumerate([21, 18, 15, 12, 9, 6, 3, 0]):
+                    K_p_value = float(line[77 - 2*i:79 - 2*i]);
+                    reference_rows.append([float(line[0:4]), float(line[5:7]), float(line[8:10]),\
+                                           hr_line, K_p_value if K_p_value >= 0.0 else np.nan]);
+    #
+    assert np.array_equal(K_p_array, np.array(reference_rows), equal_nan=True)
+    print('K_p rows match the line by line parse:', K_p_array.shape)
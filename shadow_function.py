@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+This function calculates the fraction nu of the solar disk that is visible from
+a batch of satellites, considering occultation by the Earth and by the Moon. It
+uses the same conical shadow geometry as solar_radiation_pressure (Montenbruck
+and Gill, "Satellite Orbits", section 3.4.2). For each occulting body, a is the
+apparent radius of the Sun, b the apparent radius of the body, and c the
+apparent distance between their centers, all seen from the satellite. Then
+
+    c >= a + b:          no occultation
+    c <= b - a:          total occultation (umbra)
+    c <= a - b:          annular occultation, the fraction b^2/a^2 is hidden
+    otherwise:           partial occultation (penumbra), the hidden fraction is
+                         the overlap area of the two disks over pi*a^2
+
+The cases are resolved with masks over the whole batch, so whole arcs or
+catalogs are processed in one call. The hidden fractions of the Earth and the
+Moon are subtracted from one and the result is clipped to [0, 1].
+
+shadow_geometry(rECEF_array, r_sunECEF, r_bodyECEF, R_body) returns the
+angles a, b and c of one occulting body.
+
+Inputs:
+    rECEF_array: (N,3) array of satellite positions in the ITRF reference system (m)
+    r_sunECEF: Position of the Sun in the ITRF reference system, (3,) or (N,3) (m)
+    r_moonECEF: Position of the Moon in the ITRF reference system, (3,) or (N,3) (m)
+
+Outputs:
+    nu: (N,) array of the illuminated fractions of the solar disk (1 in full
+    sun, 0 in umbra)
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+
+R_sun = 6.957e8; # Radius of the Sun - meters
+R_moon = 1.737e6; #Radius of the Moon - meters
+R_earth = 6.371e6; # Radius of the Earth - meters
+
+def shadow_geometry(rECEF_array, r_sunECEF, r_bodyECEF, R_body):
+    #
+    # Apparent radius a of the Sun, b of the occulting body and apparent
+    # distance c between their centers, seen from each satellite
+    #
+    r_sun_minus_r_sat = r_sunECEF - rECEF_array;
+    norm_r_sun_minus_r_sat = np.linalg.norm(r_sun_minus_r_sat, axis=-1);
+    #
+    a = np.arcsin(R_sun/norm_r_sun_minus_r_sat);
+    #
+    s_vec = rECEF_array - r_bodyECEF;
+    norm_s_vec = np.linalg.norm(s_vec, axis=-1);
+    #
+    b = np.arcsin(np.minimum(R_body/norm_s_vec, 1.0));
+    c = np.arccos(np.clip(np.sum(-s_vec*r_sun_minus_r_sat, axis=-1)/\
+                          (norm_s_vec*norm_r_sun_minus_r_sat), -1.0, 1.0));
+    #
+    return a, b, c
+
+def _occulted_fraction(a, b, c):
+    #
+    # Fraction of the solar disk (apparent radius a) hidden by a body of
+    # apparent radius b whose center is at apparent distance c
+    #
+    fraction = np.zeros(np.shape(c));
+    #
+    umbra = c <= b - a;
+    annular = c <= a - b;
+    penumbra = (c < a + b) & ~umbra & ~annular;
+    #
+    fraction[umbra] = 1.0;
+    fraction[annular] = (b[annular]/a[annular])**2;
+    #
+    if np.any(penumbra):
+        #
+        a_p = a[penumbra];
+        b_p = b[penumbra];
+        c_p = c[penumbra];
+        #
+        a_squared = a_p**2;
+        b_squared = b_p**2;
+        #
+        # Calculate the parameters x and y
+        #
+        x = (c_p**2 + a_squared - b_squared)/(2.0*c_p);
+        y = np.sqrt(np.maximum(a_squared - x**2, 0.0));
+        #
+        occulted_area = a_squared*np.arccos(np.clip(x/a_p, -1.0, 1.0)) +\
+        b_squared*np.arccos(np.clip((c_p - x)/b_p, -1.0, 1.0)) - c_p*y;
+        #
+        fraction[penumbra] = occulted_area/(np.pi*a_squared);
+    #
+    return fraction
+
+def shadow_function(rECEF_array, r_sunECEF, r_moonECEF):
+    #
+    rECEF_array = np.atleast_2d(np.asarray(rECEF_array, dtype=float));
+    r_sunECEF = np.asarray(r_sunECEF, dtype=float);
+    r_moonECEF = np.asarray(r_moonECEF, dtype=float);
+    #
+    nu = np.ones(rECEF_array.shape[0]);
+    #
+    for r_bodyECEF, R_body in ((np.zeros(3), R_earth), (r_moonECEF, R_moon)):
+        #
+        a, b, c = shadow_geometry(rECEF_array, r_sunECEF, r_bodyECEF, R_body);
+        #
+        nu = nu - _occulted_fraction(a, b, c);
+    #
+    return np.clip(nu, 0.0, 1.0)
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+This class holds the space weather indices used by the Jacchia 71' atmospheric
+model in a columnar store: one typed array per quantity instead of a float
+matrix of (yr, mo, day, hr, value) rows.
+
+    3-hourly columns: K_p_jd (start of each 3 hr interval, Julian date), K_p, a_p
+    Daily columns: F_10p7_jd (0 hr of each day, Julian date), F_10p7,
+                   F_10p7_bar (81 day centered mean), F_10p7_predicted
+
+Epochs are stored as float Julian dates; K_p_datetime64 and F_10p7_datetime64
+return them as numpy datetime64. a_p is converted from the integer planetary
+K_p of the DGD files with the planetary K_p to a_p table (0, 4, 7, 15, 27, 48,
+80, 132, 207, 400 for K_p = 0 to 9). F_10p7_bar is the mean
+of the valid F_10.7 values within 40 days of each day, so it uses fewer days
+near the ends of the record. Days of the 45 day forecast (45DF.txt) are flagged
+in F_10p7_predicted; observed values take precedence when both exist.
+
+The NOAA files are parsed by the vectorized fixed-width parsers parse_DGD,
+parse_DSD and parse_45DF. The lines of a file are loaded into one (lines x
+columns) character array and every field is converted for all lines at once,
+so there is no per-line Python loop. Missing values are stored as NaN. The
+store is saved to and loaded from a compact .npz file.
+
+Inputs:
+    K_p_date: (n,4) array of yr, mon, day, hr of the K_p values
+    K_p: (n,) array of planetary K_p values
+    F_10p7_date: (m,3) array of yr, mon, day of the F_10.7 values
+    F_10p7: (m,) array of F_10.7 values
+    F_10p7_predicted: Optional (m,) boolean array flagging forecast values
+
+Outputs:
+    from_noaa(yr, mon, file_cache, base_url) builds the store from the NOAA
+    files of the current and previous three quarters and the 45 day forecast.
+    save(file_path) and load(file_path) write and read the store.
+    values_at(jd) returns K_p, F_10p7 of the previous day and F_10p7_bar,
+    taking the last valid value where entries are missing or NaN.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from noaa_file_cache import get_default_noaa_file_cache, noaa_quarterly_urls, NOAA_base_url
+
+# Planetary a_p of the integer planetary K_p values 0 to 9 (the station K to
+# a_K table differs at K = 1, 7 and 8)
+a_p_from_K_p_table = np.array([0.0, 4.0, 7.0, 15.0, 27.0, 48.0, 80.0, 132.0, 207.0, 400.0]);
+
+month_names = np.array([b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug',\
+                        b'Sep', b'Oct', b'Nov', b'Dec']);
+
+def _character_array(lines, width=80):
+    #
+    # (lines x width) array of the characters of the lines, padded with spaces
+    #
+    chars = np.array(lines, dtype='S' + str(width)).view(np.uint8).reshape(len(lines), width);
+    #
+    return np.where(chars == 0, ord(' '), chars).astype(np.uint8)
+
+def _field(chars, start, stop, dtype=float):
+    #
+    # Column [start:stop] of every line as numbers. Blank fields are NaN
+    #
+    text = np.ascontiguousarray(chars[:, start:stop]).view('S' + str(stop - start)).ravel();
+    #
+    if dtype is bytes:
+        return text
+    #
+    return np.where(np.char.strip(text) == b'', b'nan', text).astype(dtype)
+
+def _data_lines(content):
+    #
+    # Lines of a quarterly file that start with a date
+    #
+    return [line for line in content.splitlines() if line[0:4].isdigit()]
+
+def _julian_date(yr, mon, day, hr=0.0):
+    #
+    # Vectorized form of jday
+    #
+    return 367.0*yr - np.floor((7.0*(yr + np.floor((mon + 9.0)/12.0)))*0.25) +\
+    np.floor(275*mon/9.0) + day + 1721013.5 + hr/24.0
+
+def parse_DGD(content):
+    #
+    # Date (yr, mon, day, hr) and planetary K_p of every 3 hr interval of a
+    # quarterly DGD file, in time order. The eight K_p fields end at column 79
+    #
+    chars = _character_array(_data_lines(content));
+    num_days = chars.shape[0];
+    #
+    K_p = np.empty((num_days, 8));
+    for i in range(0, 8):
+        K_p[:, i] = _field(chars, 63 + 2*i, 65 + 2*i);
+    K_p[K_p < 0.0] = np.nan; # -1 marks a missing value
+    #
+    date = np.empty((num_days, 8, 4));
+    date[:, :, 0] = _field(chars, 0, 4)[:, None];
+    date[:, :, 1] = _field(chars, 5, 7)[:, None];
+    date[:, :, 2] = _field(chars, 8, 10)[:, None];
+    date[:, :, 3] = 3.0*np.arange(0, 8);
+    #
+    return date.reshape(8*num_days, 4), K_p.ravel()
+
+def parse_DSD(content):
+    #
+    # Date (yr, mon, day) and F_10.7 of every day of a quarterly DSD file
+    #
+    chars = _character_array(_data_lines(content));
+    #
+    date = np.column_stack((_field(chars, 0, 4), _field(chars, 5, 7), _field(chars, 8, 10)));
+    F_10p7 = _field(chars, 10, 15);
+    F_10p7[F_10p7 < 0.0] = np.nan; # -999 marks a missing value
+    #
+    return date, F_10p7
+
+def parse_45DF(content):
+    #
+    # Date (yr, mon, day) and F_10.7 of every day of the 45 day forecast. The
+    # forecast lines follow the '45' header of the F_10.7 section and hold five
+    # 12 character entries (ddMonyy fff)
+    #
+    lines = content.splitlines();
+    first = [i for i, line in enumerate(lines) if line.startswith(b'45')][-1] + 1;
+    last = first;
+    while last < len(lines) and lines[last][0:2].isdigit():
+        last = last + 1;
+    #
+    chars = _character_array(lines[first:last], 60);
+    #
+    date = np.empty((chars.shape[0], 5, 3));
+    F_10p7 = np.empty((chars.shape[0], 5));
+    for i in range(0, 5):
+        column = 12*i;
+        month = _field(chars, column + 2, column + 5, bytes);
+        date[:, i, 0] = 2000.0 + _field(chars, column + 5, column + 7);
+        date[:, i, 1] = np.argmax(month[:, None] == month_names[None, :], axis=1) + 1.0;
+        date[:, i, 2] = _field(chars, column, column + 2);
+        F_10p7[:, i] = _field(chars, column + 8, column + 11);
+    #
+    return date.reshape(-1, 3), F_10p7.ravel()
+
+class SpaceWeatherStore():
+    #
+    def __init__(self, K_p_date, K_p, F_10p7_date, F_10p7, F_10p7_predicted=None):
+        #
+        K_p_date = np.asarray(K_p_date, dtype=float).reshape(-1, 4);
+        F_10p7_date = np.asarray(F_10p7_date, dtype=float).reshape(-1, 3);
+        if F_10p7_predicted is None:
+            F_10p7_predicted = np.zeros(len(F_10p7_date), dtype=bool);
+        #
+        # Sort each group of columns by epoch. Where an epoch appears twice the
+        # first entry is kept, so observations should be given before forecasts
+        #
+        K_p_jd, K_p_index = np.unique(_julian_date(K_p_date[:, 0], K_p_date[:, 1],\
+                                      K_p_date[:, 2], K_p_date[:, 3]), return_index=True);
+        F_10p7_jd, F_10p7_index = np.unique(_julian_date(F_10p7_date[:, 0],\
+                                  F_10p7_date[:, 1], F_10p7_date[:, 2]), return_index=True);
+        #
+        self._set_columns(K_p_jd, np.asarray(K_p, dtype=float)[K_p_index], F_10p7_jd,\
+                          np.asarray(F_10p7, dtype=float)[F_10p7_index],\
+                          np.asarray(F_10p7_predicted, dtype=bool)[F_10p7_index]);
+    #
+    @staticmethod
+    def _centered_mean(jd, values, half_width):
+        #
+        # Mean of the valid values within half_width days of each epoch, from
+        # cumulative sums, O(n log n)
+        #
+        valid = np.isfinite(values);
+        value_sum = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))));
+        value_count = np.concatenate(([0], np.cumsum(valid)));
+        #
+        low = np.searchsorted(jd, jd - half_width, side='left');
+        high = np.searchsorted(jd, jd + half_width, side='right');
+        #
+        count = value_count[high] - value_count[low];
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, (value_sum[high] - value_sum[low])/count, np.nan)
+    #
+    @classmethod
+    def from_noaa_files(cls, DGD_contents, DSD_contents, forecast_content=None):
+        #
+        # Parse the file contents and fill preallocated columns
+        #
+        K_p_parts = [parse_DGD(content) for content in DGD_contents];
+        F_10p7_parts = [parse_DSD(content) for content in DSD_contents];
+        if forecast_content is not None:
+            F_10p7_parts.append(parse_45DF(forecast_content));
+        #
+        num_K_p = sum(len(part[1]) for part in K_p_parts);
+        num_F_10p7 = sum(len(part[1]) for part in F_10p7_parts);
+        #
+        K_p_date = np.empty((num_K_p, 4));
+        K_p = np.empty(num_K_p);
+        F_10p7_date = np.empty((num_F_10p7, 3));
+        F_10p7 = np.empty(num_F_10p7);
+        F_10p7_predicted = np.zeros(num_F_10p7, dtype=bool);
+        #
+        start = 0;
+        for date, values in K_p_parts:
+            K_p_date[start:start + len(values)] = date;
+            K_p[start:start + len(values)] = values;
+            start = start + len(values);
+        #
+        start = 0;
+        for date, values in F_10p7_parts:
+            F_10p7_date[start:start + len(values)] = date;
+            F_10p7[start:start + len(values)] = values;
+            start = start + len(values);
+        if forecast_content is not None:
+            F_10p7_predicted[num_F_10p7 - len(F_10p7_parts[-1][1]):] = True;
+        #
+        return cls(K_p_date, K_p, F_10p7_date, F_10p7, F_10p7_predicted)
+    #
+    @classmethod
+    def from_noaa(cls, yr, mon, file_cache=None, base_url=None):
+        #
+        # Fetch the DGD, DSD and forecast files concurrently and build the store
+        #
+        if file_cache is None:
+            file_cache = get_default_noaa_file_cache();
+        if base_url is None:
+            base_url = NOAA_base_url;
+        #
+        DGD_files = noaa_quarterly_urls(yr, mon, 'DGD', base_url);
+        DSD_files = noaa_quarterly_urls(yr, mon, 'DSD', base_url);
+        #
+        contents = file_cache.fetch_many(DGD_files + DSD_files + [base_url + 'latest/45DF.txt']);
+        #
+        return cls.from_noaa_files(contents[0:4], contents[4:8], contents[8])
+    #
+    def save(self, file_path):
+        #
+        np.savez(file_path, K_p_jd=self.K_p_jd, K_p=self.K_p.astype(np.float32),\
+                 F_10p7_jd=self.F_10p7_jd, F_10p7=self.F_10p7.astype(np.float32),\
+                 F_10p7_predicted=self.F_10p7_predicted);
+    #
+    @classmethod
+    def load(cls, file_path):
+        #
+        # Rebuild the store from the saved columns. a_p and F_10p7_bar are
+        # recomputed
+        #
+        store = cls.__new__(cls);
+        with np.load(file_path) as data:
+            store._set_columns(data['K_p_jd'], data['K_p'], data['F_10p7_jd'],\
+                               data['F_10p7'], data['F_10p7_predicted']);
+        #
+        return store
+    #
+    def _set_columns(self, K_p_jd, K_p, F_10p7_jd, F_10p7, F_10p7_predicted):
+        #
+        # Store the sorted columns and derive a_p and F_10p7_bar
+        #
+        self.K_p_jd = np.asarray(K_p_jd, dtype=float);
+        self.K_p = np.asarray(K_p, dtype=float);
+        self.a_p = np.full(len(self.K_p_jd), np.nan);
+        valid = np.isfinite(self.K_p);
+        self.a_p[valid] = a_p_from_K_p_table[np.clip(np.round(self.K_p[valid]).astype(int), 0, 9)];
+        #
+        self.F_10p7_jd = np.asarray(F_10p7_jd, dtype=float);
+        self.F_10p7 = np.asarray(F_10p7, dtype=float);
+        self.F_10p7_predicted = np.asarray(F_10p7_predicted, dtype=bool);
+        self.F_10p7_bar = self._centered_mean(self.F_10p7_jd, self.F_10p7, 40.0);
+    #
+    @property
+    def K_p_datetime64(self):
+        return _jd_to_datetime64(self.K_p_jd)
+    #
+    @property
+    def F_10p7_datetime64(self):
+        return _jd_to_datetime64(self.F_10p7_jd)
+    #
+    @staticmethod
+    def _last_valid(column_jd, values, jd):
+        #
+        # Value of the last finite entry at or before each jd (the first finite
+        # entry for earlier epochs)
+        #
+        valid = np.flatnonzero(np.isfinite(values));
+        if len(valid) == 0:
+            return np.full(np.shape(jd), np.nan)
+        #
+        index = np.clip(np.searchsorted(column_jd[valid], jd, side='right') - 1, 0, len(valid) - 1);
+        #
+        return values[valid[index]]
+    #
+    def values_at(self, jd):
+        #
+        # K_p of the 3 hr interval containing jd, F_10.7 of the day containing
+        # jd - 1 and F_10p7_bar of the day containing jd. Each is looked up by
+        # epoch among the valid entries only, so both gaps in the record and
+        # entries marked missing in the files (NaN) take the last valid value
+        # before them
+        #
+        jd = np.asarray(jd, dtype=float);
+        #
+        return self._last_valid(self.K_p_jd, self.K_p, jd),\
+               self._last_valid(self.F_10p7_jd, self.F_10p7, jd - 1.0),\
+               self._last_valid(self.F_10p7_jd, self.F_10p7_bar, jd)
+
+def _jd_to_datetime64(jd):
+    #
+    # Julian date to datetime64 with millisecond resolution
+    #
+    milliseconds = np.round((np.asarray(jd) - 2440587.5)*86400000.0).astype(np.int64);
+    #
+    return np.datetime64('1970-01-01T00:00:00', 'ms') + milliseconds.astype('timedelta64[ms]')
+
+#
+# Test function: parse lines in the NOAA formats with known values, check the
+# a_p table, the previous day lookup across a gap and the .npz round trip
+#
+if __name__ == '__main__':
+    #
+    import os
+    import tempfile
+    #
+    DGD_content = b'#  Date        A     K-indices        A     K-indices        A     K-indices\n' +\
+    b'2018 09 29     5  1 1 1 2 2 1 1 1     6  1 1 1 3 2 0 0 0     9  0 1 2 3 4 5 6 7\n' +\
+    b'2018 09 30     5  1 1 1 2 2 1 1 1     6  1 1 1 3 2 0 0 0    99  8 9-1 1 1 1 1 1\n';
+    DSD_content = b'#  Date  Radio Flux\n' +\
+    b'2018 09 29   68     13     30      0    -999      *   3  0  0  0  0  0  0\n' +\
+    b'2018 10 02  135     13     30      0    -999      *   3  0  0  0  0  0  0\n';
+    forecast_content = b':Product: 45DF.txt\n45-DAY AP FORECAST\n' +\
+    b'03Oct18 005 04Oct18 005 05Oct18 005 06Oct18 005 07Oct18 005\n' +\
+    b'45-DAY F10.7 CM FLUX FORECAST\n' +\
+    b'02Oct18 070 03Oct18 071 04Oct18 102 05Oct18 073 06Oct18 074\n' +\
+    b'FORECASTER: TEST\n99999\n';
+    #
+    date, K_p = parse_DGD(DGD_content);
+    assert np.array_equal(date[8], [2018.0, 9.0, 30.0, 0.0]) and np.array_equal(date[15, 3], 21.0)
+    assert np.array_equal(K_p[0:8], np.arange(0.0, 8.0))
+    assert np.array_equal(K_p[8:16], [8.0, 9.0, np.nan, 1.0, 1.0, 1.0, 1.0, 1.0], equal_nan=True)
+    #
+    date, F_10p7 = parse_DSD(DSD_content);
+    assert np.array_equal(date[1], [2018.0, 10.0, 2.0]) and np.array_equal(F_10p7, [68.0, 135.0])
+    #
+    date, F_10p7 = parse_45DF(forecast_content);
+    assert np.array_equal(date[2], [2018.0, 10.0, 4.0]) and np.array_equal(F_10p7[0:3], [70.0, 71.0, 102.0])
+    #
+    store = SpaceWeatherStore.from_noaa_files([DGD_content], [DSD_content], forecast_content);
+    assert np.array_equal(store.a_p[0:16], [0, 4, 7, 15, 27, 48, 80, 132, 207, 400, np.nan,\
+                                            4, 4, 4, 4, 4], equal_nan=True)
+    #
+    # Observed 2 Oct is kept over its forecast. 30 Sep and 1 Oct are missing,
+    # so the previous day of 2 Oct 12:00 is 29 Sep
+    #
+    assert store.F_10p7[1] == 135.0 and not store.F_10p7_predicted[1]
+    assert store.values_at(_julian_date(2018, 10, 2, 12.0))[1] == 68.0
+    assert store.values_at(_julian_date(2018, 10, 4, 12.0))[1] == 71.0
+    #
+    # Entries marked missing (-1 K_p on 30 Sep 06:00, -999 F_10.7 on 1 Oct) take
+    # the last valid value before them
+    #
+    missing_DSD_content = DSD_content.replace(b'2018 10 02  135', b'2018 10 01 -999');
+    missing_store = SpaceWeatherStore.from_noaa_files([DGD_content], [missing_DSD_content]);
+    assert np.isnan(missing_store.K_p[10]) and np.isnan(missing_store.F_10p7[1])
+    assert missing_store.values_at(_julian_date(2018, 9, 30, 7.0))[0] == 9.0
+    assert missing_store.values_at(_julian_date(2018, 10, 2, 12.0)) == (1.0, 68.0, 68.0)
+    #
+    file_path = os.path.join(tempfile.mkdtemp(), 'space_weather.npz');
+    store.save(file_path);
+    loaded = SpaceWeatherStore.load(file_path);
+    for name in ('K_p_jd', 'K_p', 'a_p', 'F_10p7_jd', 'F_10p7', 'F_10p7_bar', 'F_10p7_predicted'):
+        assert np.array_equal(getattr(store, name), getattr(loaded, name), equal_nan=True), name
+    print('Space weather parsers, a_p table, lookups and .npz round trip check out')
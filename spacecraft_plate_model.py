@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+This class describes a spacecraft as a set of flat plates (for example a
+box-wing model of a GEO payload) and evaluates its solar radiation pressure
+acceleration. The plate normals, areas and optical coefficients are kept in
+contiguous arrays. The acceleration is evaluated over all plates and all
+satellites in one (satellites x plates x 3) broadcast, instead of a Python loop
+over plates.
+
+Each plate i with outward unit normal n_i, area A_i, specular reflectivity
+rho_s_i and diffuse reflectivity rho_d_i contributes
+
+    a_i = -nu*P_sun*(AU/d)^2*A_i/m*cos(theta_i)*((1 - rho_s_i)*e_sun +
+          2*(rho_s_i*cos(theta_i) + rho_d_i/3)*n_i)
+
+where e_sun is the unit vector from the satellite to the Sun, d the distance to
+the Sun and cos(theta_i) = n_i.e_sun. Plates facing away from the Sun
+(cos(theta_i) <= 0) are masked out. With one plate and rho_d = 0 this is the
+flat plate model of solar_radiation_pressure, with epsilon = rho_s.
+
+The normals are given in the spacecraft body frame. An optional (N,3,3) array
+of attitude matrices rotates them into the ITRF frame for each satellite; by
+default the body frame is taken to be aligned with the ITRF frame. Plates
+flagged in sun_tracking (the solar wings of a GEO payload) do not follow the
+attitude: their normal is e_sun, as for a wing that is driven to face the Sun.
+A nadir-pointing bus with sun-tracking wings is then described by the bus
+attitude alone. box_wing builds such a model, with one sun-tracking wing plate
+for the lit face, unless sun_tracking_wings is False, in which case the wing is
+two sided and fixed along the body x-axis.
+
+Inputs:
+    normals: (P,3) array of plate normals in the body frame (normalized on input)
+    areas: (P,) array of plate areas (m^2)
+    specular_reflectivity: (P,) array or scalar of specular reflectivities
+    diffuse_reflectivity: (P,) array or scalar of diffuse reflectivities
+    mass_sat: Mass of the satellite (kg)
+    sun_tracking: Optional (P,) boolean array or scalar flagging the plates whose
+    normal tracks the Sun (default: none)
+
+Outputs:
+    acceleration(rECEF_array, r_sunECEF, r_moonECEF, attitude, nu) returns the
+    (N,3) solar radiation pressure accelerations in the ITRF reference frame
+    (m/s^2). nu is computed with shadow_function unless it is given.
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from shadow_function import shadow_function
+
+class SpacecraftPlateModel():
+    #
+    def __init__(self, normals, areas, specular_reflectivity, diffuse_reflectivity, mass_sat,\
+                 sun_tracking=False):
+        #
+        normals = np.atleast_2d(np.asarray(normals, dtype=float));
+        num_plates = normals.shape[0];
+        #
+        self.normals = np.ascontiguousarray(normals/np.linalg.norm(normals, axis=1)[:, None]);
+        self.areas = np.ascontiguousarray(np.broadcast_to(np.asarray(areas, dtype=float),\
+                                                          (num_plates,)));
+        self.specular_reflectivity = np.ascontiguousarray(np.broadcast_to(\
+        np.asarray(specular_reflectivity, dtype=float), (num_plates,)));
+        self.diffuse_reflectivity = np.ascontiguousarray(np.broadcast_to(\
+        np.asarray(diffuse_reflectivity, dtype=float), (num_plates,)));
+        self.sun_tracking = np.ascontiguousarray(np.broadcast_to(\
+        np.asarray(sun_tracking, dtype=bool), (num_plates,)));
+        self.mass_sat = mass_sat;
+    #
+    @classmethod
+    def box_wing(cls, bus_size, wing_area, bus_specular, bus_diffuse, wing_specular,\
+                 wing_diffuse, mass_sat, sun_tracking_wings=True):
+        #
+        # Six bus faces of a box with sides bus_size = (x, y, z) and a solar
+        # wing of area wing_area. A sun-tracking wing is one plate facing the
+        # Sun; a fixed wing is two sided with its normal along the body x-axis
+        #
+        size_x, size_y, size_z = bus_size;
+        #
+        normals = [[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0],\
+                   [0.0, -1.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, -1.0]];
+        areas = [size_y*size_z, size_y*size_z, size_x*size_z, size_x*size_z,\
+                 size_x*size_y, size_x*size_y];
+        num_wing_plates = 1 if sun_tracking_wings else 2;
+        #
+        normals = np.array(normals + [[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0]][0:num_wing_plates]);
+        areas = np.array(areas + [wing_area]*num_wing_plates);
+        specular = np.array([bus_specular]*6 + [wing_specular]*num_wing_plates);
+        diffuse = np.array([bus_diffuse]*6 + [wing_diffuse]*num_wing_plates);
+        sun_tracking = np.array([False]*6 + [sun_tracking_wings]*num_wing_plates);
+        #
+        return cls(normals, areas, specular, diffuse, mass_sat, sun_tracking)
+    #
+    def acceleration(self, rECEF_array, r_sunECEF, r_moonECEF, attitude=None, nu=None):
+        #
+        AU = 1.496e11; # Astronimical Unit - meters
+        P_sun = 4.56e-6; # Solar radiation pressure at 1 AU - N/m^2
+        #
+        rECEF_array = np.atleast_2d(np.asarray(rECEF_array, dtype=float));
+        r_sunECEF = np.asarray(r_sunECEF, dtype=float);
+        #
+        if nu is None:
+            nu = shadow_function(rECEF_array, r_sunECEF, r_moonECEF);
+        #
+        # Unit vector from each satellite to the Sun and the distance to the Sun
+        #
+        r_sat_sun = r_sunECEF - rECEF_array;
+        d_sun = np.linalg.norm(r_sat_sun, axis=-1);
+        e_sun = r_sat_sun/d_sun[:, None];
+        #
+        # Plate normals of every satellite in the ITRF frame, (N,P,3). The
+        # sun-tracking plates face the Sun whatever the attitude
+        #
+        if attitude is None:
+            normals = np.broadcast_to(self.normals, (rECEF_array.shape[0],) +\
+                                      self.normals.shape);
+        else:
+            normals = np.einsum('nij,pj->npi', attitude, self.normals);
+        #
+        if np.any(self.sun_tracking):
+            normals = np.array(normals);
+            normals[:, self.sun_tracking, :] = e_sun[:, None, :];
+        #
+        cos_theta = np.einsum('npi,ni->np', normals, e_sun);
+        cos_theta = np.where(cos_theta > 0.0, cos_theta, 0.0); # back-facing plates
+        #
+        plate_force = (self.areas*cos_theta)[..., None]*((1.0 -\
+        self.specular_reflectivity)[:, None]*e_sun[:, None, :] + (2.0*(\
+        self.specular_reflectivity*cos_theta + self.diffuse_reflectivity/3.0))[..., None]*\
+        normals);
+        #
+        scale = -nu*P_sun*(AU/d_sun)**2/self.mass_sat;
+        #
+        return scale[:, None]*np.sum(plate_force, axis=1)
+
+#
+# Test function: one plate against solar_radiation_pressure, and a sun-tracking
+# wing on a nadir-pointing GEO bus against the analytic force of a plate facing
+# the Sun, -P_sun*(AU/d)^2*A/m*(1 + rho_s + 2*rho_d/3)*e_sun
+#
+if __name__ == '__main__':
+    #
+    from solar_radiation_pressure import solar_radiation_pressure
+    #
+    AU = 1.496e11;
+    P_sun = 4.56e-6;
+    #
+    r_sunECEF = np.array([1.2e11, -8.0e10, 3.0e10]);
+    r_moonECEF = np.array([-2.0e8, 3.2e8, 1.1e8]);
+    rECEF = 4.2164e7*np.array([0.6, 0.8, 0.0]);
+    #
+    n = np.array([0.6, -0.8, 0.0]);
+    flat_plate = SpacecraftPlateModel(n, 10.0, 0.3, 0.0, 1500.0);
+    accel_plate = flat_plate.acceleration(rECEF, r_sunECEF, r_moonECEF)[0];
+    accel_flat = solar_radiation_pressure(rECEF, r_sunECEF, r_moonECEF, n, 0.3, 10.0, 1500.0);
+    #
+    # solar_radiation_pressure takes e_sun from the Earth rather than from the
+    # satellite, which differs by about |r|/d
+    #
+    assert np.linalg.norm(accel_plate - accel_flat) < 1.0e-3*np.linalg.norm(accel_flat)
+    #
+    # Nadir-pointing bus: body x-axis towards the Earth, z-axis along the orbit normal
+    #
+    x_body = -rECEF/np.linalg.norm(rECEF);
+    z_body = np.array([0.0, 0.0, 1.0]);
+    attitude = np.stack([x_body, np.cross(z_body, x_body), z_body], axis=1)[None, :, :];
+    #
+    wing_only = SpacecraftPlateModel.box_wing((1.0e-9, 1.0e-9, 1.0e-9), 40.0, 0.0, 0.0,\
+                                              0.2, 0.1, 3000.0);
+    accel_wing = wing_only.acceleration(rECEF, r_sunECEF, r_moonECEF, attitude, nu=1.0)[0];
+    #
+    r_sat_sun = r_sunECEF - rECEF;
+    d_sun = np.linalg.norm(r_sat_sun);
+    accel_analytic = -P_sun*(AU/d_sun)**2*40.0/3000.0*(1.0 + 0.2 + 2.0*0.1/3.0)*r_sat_sun/d_sun;
+    #
+    assert np.linalg.norm(accel_wing - accel_analytic) < 1.0e-12*np.linalg.norm(accel_analytic)
+    print('Plate model matches solar_radiation_pressure and the sun-tracking wing force')
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+This function is the batched counterpart of spherical_harmonic_acceleration.
+Instead of a single ITRF position it accepts an (N,3) array of positions and
+returns the (N,3) array of non-central accelerations caused by the spherical
+harmonic mass model of the Earth. The Legendre recursion and the cos(m*lambda)
+and sin(m*lambda) tables are built as arrays over all N objects at once, so the
+Python loops only run over degree and order and never over the objects.
+
+The same formulation as spherical_harmonic_acceleration is used (Vallado,
+"Fundamentals of Astrodynamics", section 8.6.1). The recursion and derivative
+factors come from the cached table of legendre_recursion_table, so either
+unnormalized coefficients (as in spherical_harmonic_arrays) or fully normalized
+coefficients (as in the EGM-96/EGM-2008 files) can be used.
+Zonal terms are summed for degrees 2 through order_zonal - 1. Sectorial and
+tesseral terms are summed for degrees 2 through order_tesseral and orders 1
+through l.
+
+Inputs:
+    zonal_coeff_array: numpy array containing the terms that describe the mass
+    distribution of the Earth with respect to latitude
+    sectorial_coeff_array: numpy array containing the C_lm terms
+    tesseral_coeff_array: numpy array containing the S_lm terms
+    r_ITRF_array: (N,3) array of positions in the ITRF reference frame (m)
+    order_zonal: Number of zonal terms to consider
+    order_tesseral: Highest degree of the sectorial and tesseral terms to consider
+    normalized: True if the coefficient arrays are fully normalized (default False)
+    engine: 'spherical' (default) for the latitude/longitude formulation above,
+    or 'cartesian' for the singularity-free formulation of
+    spherical_harmonic_acceleration_cartesian. Both give the same result away
+    from the poles, so they can be compared side by side at runtime
+    return_gradient: If True, also return the (N,3,3) gravity gradient. This is
+    computed with the Cartesian engine regardless of the engine setting
+    mu_earth: Gravitational parameter of the field (m^3/s^2, default EGM-96)
+    r_earth: Reference radius of the field (m, default EGM-96). Fields loaded
+    with load_gravity_field carry both as gravity_field.mu_earth and
+    gravity_field.r_earth
+
+Outputs:
+    accel_spherical_harmonic_ITRF: (N,3) array of accelerations caused by the
+    spherical harmonic Earth gravitational model in the ITRF reference frame (m/s^2)
+    gravity_gradient_ITRF: (N,3,3) array of d(a_i)/d(r_j) in the ITRF reference
+    frame (1/s^2), only returned when return_gradient is True
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from load_gravity_field import mu_earth_default, r_earth_default
+from legendre_recursion_table import get_legendre_recursion_table
+from spherical_harmonic_acceleration_cartesian import spherical_harmonic_acceleration_cartesian
+
+def spherical_harmonic_acceleration_batch(zonal_coeff_array, sectorial_coeff_array,\
+                                          tesseral_coeff_array, r_ITRF_array,\
+                                          order_zonal, order_tesseral,\
+                                          normalized=False, engine='spherical',\
+                                          return_gradient=False, mu_earth=None,\
+                                          r_earth=None):
+    #
+    if engine not in ('spherical', 'cartesian'):
+        raise ValueError("engine must be 'spherical' or 'cartesian'")
+    #
+    # Hand off to the Cartesian (Cunningham) engine when it is selected. The
+    # gravity gradient is always formed from the Cartesian recursion, which
+    # gives the acceleration and gradient from one pass over the same tables
+    #
+    if engine == 'cartesian' or return_gradient:
+        return spherical_harmonic_acceleration_cartesian(zonal_coeff_array,\
+               sectorial_coeff_array, tesseral_coeff_array, r_ITRF_array,\
+               order_zonal, order_tesseral, normalized, return_gradient, mu_earth, r_earth)
+    #
+    # Use the EGM-96 gravitational parameter and reference radius unless those
+    # of the field are given
+    #
+    if mu_earth is None:
+        mu_earth = mu_earth_default;
+    if r_earth is None:
+        r_earth = r_earth_default;
+    #
+    r_ITRF_array = np.atleast_2d(np.asarray(r_ITRF_array, dtype=float));
+    num_sat = r_ITRF_array.shape[0];
+    #
+    degree_max = order_zonal - 1;
+    degree_tesseral = min(order_tesseral, degree_max);
+    #
+    # Find the geocentric latitude and longitude of every object
+    #
+    ri_p2_plus_rj_p2 = r_ITRF_array[:, 0]**2 + r_ITRF_array[:, 1]**2;
+    sqrt_ri_p2_plus_rj_p2 = np.sqrt(ri_p2_plus_rj_p2);
+    r_ITRF_mag = np.sqrt(ri_p2_plus_rj_p2 + r_ITRF_array[:, 2]**2);
+    #
+    sin_phi_gc = r_ITRF_array[:, 2] / r_ITRF_mag;
+    cos_phi_gc = sqrt_ri_p2_plus_rj_p2 / r_ITRF_mag;
+    tan_phi_gc = sin_phi_gc / cos_phi_gc;
+    #
+    lambda_sat = np.arctan2(r_ITRF_array[:, 1], r_ITRF_array[:, 0]);
+    #
+    # Evaluate the legendre functions with the cached recursion table. The order
+    # axis holds one extra column for the P[l, m+1] term of d/d(phi_gc)
+    #
+    legendre_table = get_legendre_recursion_table(degree_max, degree_tesseral + 1,\
+                                                  normalized);
+    #
+    P = legendre_table.evaluate(sin_phi_gc, cos_phi_gc);
+    #
+    l_plus_one = legendre_table.l_plus_one;
+    m_array = legendre_table.m;
+    E = legendre_table.E;
+    #
+    # Build the cos(m*lambda) and sin(m*lambda) tables with the angle addition
+    # recursion so only one trig evaluation per object is needed
+    #
+    cos_m_times_lambda_array = np.zeros((num_sat, degree_tesseral + 1));
+    sin_m_times_lambda_array = np.zeros((num_sat, degree_tesseral + 1));
+    #
+    cos_m_times_lambda_array[:, 0] = 1.0;
+    if degree_tesseral >= 1:
+        cos_m_times_lambda_array[:, 1] = np.cos(lambda_sat);
+        sin_m_times_lambda_array[:, 1] = np.sin(lambda_sat);
+    #
+    for m in range(2, degree_tesseral + 1):
+        cos_m_times_lambda_array[:, m] = cos_m_times_lambda_array[:, m-1]*\
+        cos_m_times_lambda_array[:, 1] - sin_m_times_lambda_array[:, m-1]*\
+        sin_m_times_lambda_array[:, 1];
+        sin_m_times_lambda_array[:, m] = sin_m_times_lambda_array[:, m-1]*\
+        cos_m_times_lambda_array[:, 1] + cos_m_times_lambda_array[:, m-1]*\
+        sin_m_times_lambda_array[:, 1];
+    #
+    r_earth_over_rmag = r_earth / r_ITRF_mag;
+    #
+    # Compute partial derivatives of the potential w.r.t r, phi_gc and lambda_sat
+    #
+    sum_d_rmag = np.zeros(num_sat);
+    sum_d_phi_gc = np.zeros(num_sat);
+    sum_d_lambda_sat = np.zeros(num_sat);
+    #
+    r_earth_over_rmag_p_l = r_earth_over_rmag.copy();
+    #
+    for l in range(2, degree_max + 1):
+        #
+        r_earth_over_rmag_p_l = r_earth_over_rmag_p_l*r_earth_over_rmag;
+        #
+        sum_d_rmag = sum_d_rmag + r_earth_over_rmag_p_l*l_plus_one[l]*P[:, l, 0]*\
+        zonal_coeff_array[l];
+        sum_d_phi_gc = sum_d_phi_gc + r_earth_over_rmag_p_l*E[l, 0]*P[:, l, 1]*\
+        zonal_coeff_array[l];
+        #
+        if l > degree_tesseral:
+            continue
+        #
+        m = m_array[1:l + 1];
+        #
+        C_lm = sectorial_coeff_array[l, 1:l + 1];
+        S_lm = tesseral_coeff_array[l, 1:l + 1];
+        #
+        C_cos_plus_S_sin = C_lm*cos_m_times_lambda_array[:, 1:l + 1] +\
+        S_lm*sin_m_times_lambda_array[:, 1:l + 1];
+        S_cos_minus_C_sin = S_lm*cos_m_times_lambda_array[:, 1:l + 1] -\
+        C_lm*sin_m_times_lambda_array[:, 1:l + 1];
+        #
+        P_lm = P[:, l, 1:l + 1];
+        P_l_m_plus_one = P[:, l, 2:l + 2];
+        #
+        sum_d_rmag = sum_d_rmag + r_earth_over_rmag_p_l*l_plus_one[l]*\
+        np.sum(P_lm*C_cos_plus_S_sin, axis=1);
+        sum_d_phi_gc = sum_d_phi_gc + r_earth_over_rmag_p_l*\
+        np.sum((E[l, 1:l + 1]*P_l_m_plus_one - m*tan_phi_gc[:, None]*P_lm)*\
+        C_cos_plus_S_sin, axis=1);
+        sum_d_lambda_sat = sum_d_lambda_sat + r_earth_over_rmag_p_l*\
+        np.sum(m*P_lm*S_cos_minus_C_sin, axis=1);
+    #
+    d_potential_d_rmag = (-mu_earth/r_ITRF_mag**2)*sum_d_rmag;
+    d_potential_d_phi_gc = (mu_earth/r_ITRF_mag)*sum_d_phi_gc;
+    d_potential_d_lambda_sat = (mu_earth/r_ITRF_mag)*sum_d_lambda_sat;
+    #
+    # Compute the necessary arguements for finding the accelerations
+    #
+    one_over_ri_p2_plus_rj_p2 = 1/ri_p2_plus_rj_p2;
+    one_over_r_mag = 1/r_ITRF_mag;
+    r_mag_squared = r_ITRF_mag**2;
+    #
+    rk_over_rmag_p2_times_sqrt_ri_p2_plus_rj_p2 = r_ITRF_array[:, 2]/\
+    (r_mag_squared*sqrt_ri_p2_plus_rj_p2);
+    #
+    radial_factor = one_over_r_mag*d_potential_d_rmag -\
+    rk_over_rmag_p2_times_sqrt_ri_p2_plus_rj_p2*d_potential_d_phi_gc;
+    #
+    accel_spherical_harmonic_ITRF = np.zeros((num_sat, 3));
+    #
+    accel_spherical_harmonic_ITRF[:, 0] = radial_factor*r_ITRF_array[:, 0] -\
+    one_over_ri_p2_plus_rj_p2*d_potential_d_lambda_sat*r_ITRF_array[:, 1];
+    #
+    accel_spherical_harmonic_ITRF[:, 1] = radial_factor*r_ITRF_array[:, 1] +\
+    one_over_ri_p2_plus_rj_p2*d_potential_d_lambda_sat*r_ITRF_array[:, 0];
+    #
+    accel_spherical_harmonic_ITRF[:, 2] = one_over_r_mag*d_potential_d_rmag*\
+    r_ITRF_array[:, 2] + sqrt_ri_p2_plus_rj_p2/r_mag_squared*d_potential_d_phi_gc;
+    #
+    return accel_spherical_harmonic_ITRF
+
+#
+# Test function: a batch of positions gives the same accelerations as the
+# positions taken one at a time, and the J2 term alone matches its closed form
+#
+if __name__ == '__main__':
+    #
+    from spherical_harmonic_arrays import spherical_harmonic_arrays
+    #
+    zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array = spherical_harmonic_arrays();
+    order_zonal = zonal_coeff_array.size;
+    order_tesseral = sectorial_coeff_array.shape[0] - 1;
+    #
+    # Positions from LEO to GEO in random directions
+    #
+    rng = np.random.default_rng(1);
+    directions = rng.normal(size=(50, 3));
+    directions = directions/np.linalg.norm(directions, axis=1)[:, None];
+    r_ITRF_array = directions*rng.uniform(6.7e6, 4.3e7, 50)[:, None];
+    #
+    accel_batch = spherical_harmonic_acceleration_batch(zonal_coeff_array,\
+                  sectorial_coeff_array, tesseral_coeff_array, r_ITRF_array,\
+                  order_zonal, order_tesseral);
+    accel_single = np.array([spherical_harmonic_acceleration_batch(zonal_coeff_array,\
+                   sectorial_coeff_array, tesseral_coeff_array, r_ITRF, order_zonal,\
+                   order_tesseral)[0] for r_ITRF in r_ITRF_array]);
+    #
+    batch_error = np.max(np.linalg.norm(accel_batch - accel_single, axis=1)/\
+                         np.linalg.norm(accel_batch, axis=1));
+    assert batch_error < 1.0e-15, batch_error
+    #
+    # J2 alone against a = -3/2*J2*mu*R^2/r^5*(x*(1 - 5z^2/r^2), y*(1 - 5z^2/r^2), z*(3 - 5z^2/r^2))
+    #
+    J2_only = np.zeros(order_zonal);
+    J2_only[2] = zonal_coeff_array[2];
+    #
+    accel_J2 = spherical_harmonic_acceleration_batch(J2_only, np.zeros((1, 1)),\
+               np.zeros((1, 1)), r_ITRF_array, 3, 0);
+    #
+    mu_earth = 3.986004415e14;
+    r_earth = 6378136.3;
+    J2 = -zonal_coeff_array[2];
+    r_mag = np.linalg.norm(r_ITRF_array, axis=1);
+    J2_factor = -1.5*J2*mu_earth*r_earth**2/r_mag**5;
+    five_z_p2_over_r_p2 = 5.0*r_ITRF_array[:, 2]**2/r_mag**2;
+    accel_J2_closed_form = J2_factor[:, None]*r_ITRF_array*\
+    np.stack([1.0 - five_z_p2_over_r_p2, 1.0 - five_z_p2_over_r_p2, 3.0 - five_z_p2_over_r_p2], axis=1);
+    #
+    J2_error = np.max(np.linalg.norm(accel_J2 - accel_J2_closed_form, axis=1)/\
+                      np.linalg.norm(accel_J2_closed_form, axis=1));
+    assert J2_error < 1.0e-13, J2_error
+    #
+    print('batch vs single max relative difference', batch_error)
+    print('J2 vs closed form max relative error', J2_error)
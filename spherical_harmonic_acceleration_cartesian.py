@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+This function computes the same non-central spherical harmonic acceleration as
+spherical_harmonic_acceleration_batch, but only uses Cartesian recursions. The
+geopotential is expanded in the solid harmonics V_nm and W_nm of Cunningham
+(Montenbruck and Gill, "Satellite Orbits", section 3.2.4), which are functions of
+x, y and z alone. No trig functions are evaluated and there is no division by
+sqrt(x^2 + y^2), so the model is free of the singularity at the poles.
+
+With rho = R_earth/r^2, the recursions are
+
+    V_00 = R_earth/r, W_00 = 0
+    V_mm = (2m - 1)*(x*rho*V_(m-1)(m-1) - y*rho*W_(m-1)(m-1))
+    W_mm = (2m - 1)*(x*rho*W_(m-1)(m-1) + y*rho*V_(m-1)(m-1))
+    V_nm = (2n - 1)/(n - m)*z*rho*V_(n-1)m - (n + m - 1)/(n - m)*R_earth*rho*V_(n-2)m
+
+and likewise for W_nm. The recursion factors are taken from the cached
+unnormalized table of legendre_recursion_table. The partial derivatives of
+V_nm and W_nm are again linear combinations of V and W one degree higher. The
+acceleration is therefore a weighted sum of V_(n+1)m and W_(n+1)m, and the
+weights depend only on the coefficients, so they are formed once per call. In
+the same way, the gravity gradient (the Jacobian of the acceleration with
+respect to position) is a weighted sum of V_(n+2)m and W_(n+2)m. Both are
+accumulated in a single recursion pass when the gradient is requested.
+
+Normalized coefficients are accepted and unnormalized internally. Because the
+Cartesian recursion is unnormalized, it is intended for fields up to degree
+~150. Higher degrees overflow and should use the spherical engine with
+normalized coefficients.
+
+Inputs:
+    zonal_coeff_array: numpy array containing the C_l0 terms
+    sectorial_coeff_array: numpy array containing the C_lm terms
+    tesseral_coeff_array: numpy array containing the S_lm terms
+    r_ITRF_array: (N,3) array of positions in the ITRF reference frame (m)
+    order_zonal: Number of zonal terms to consider
+    order_tesseral: Highest degree of the sectorial and tesseral terms to consider
+    normalized: True if the coefficient arrays are fully normalized (default False)
+    return_gradient: If True, also return the gravity gradient (default False)
+    mu_earth: Gravitational parameter of the field (m^3/s^2, default EGM-96)
+    r_earth: Reference radius of the field (m, default EGM-96)
+
+Outputs:
+    accel_spherical_harmonic_ITRF: (N,3) array of accelerations caused by the
+    spherical harmonic Earth gravitational model in the ITRF reference frame (m/s^2)
+    gravity_gradient_ITRF: (N,3,3) array of the partial derivatives of the
+    acceleration with respect to position, d(a_i)/d(r_j) (1/s^2). Only returned
+    when return_gradient is True
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from load_gravity_field import mu_earth_default, r_earth_default
+from legendre_recursion_table import get_legendre_recursion_table
+
+def _assemble_coefficients(zonal_coeff_array, sectorial_coeff_array,\
+                           tesseral_coeff_array, order_zonal, order_tesseral,\
+                           normalized):
+    #
+    # Gather the truncated coefficients into square C_nm and S_nm arrays, using
+    # the same truncation as spherical_harmonic_acceleration_batch
+    #
+    degree_max = order_zonal - 1;
+    degree_tesseral = min(order_tesseral, degree_max);
+    #
+    C_nm = np.zeros((degree_max + 1, degree_max + 1));
+    S_nm = np.zeros((degree_max + 1, degree_max + 1));
+    #
+    C_nm[2:, 0] = zonal_coeff_array[2:degree_max + 1];
+    #
+    for n in range(2, degree_tesseral + 1):
+        C_nm[n, 1:n + 1] = sectorial_coeff_array[n, 1:n + 1];
+        S_nm[n, 1:n + 1] = tesseral_coeff_array[n, 1:n + 1];
+    #
+    if normalized:
+        #
+        N_nm = get_legendre_recursion_table(degree_max, degree_max, True).N;
+        C_nm = C_nm*N_nm;
+        S_nm = S_nm*N_nm;
+    #
+    return C_nm, S_nm
+
+def _differentiate(V_weights, W_weights, axis):
+    #
+    # Given the weights of a sum of V_nm and W_nm terms, return the weights of
+    # its partial derivative along x (0), y (1) or z (2) in units of 1/R_earth.
+    # The result is one degree and one order larger than the input
+    #
+    size = V_weights.shape[0];
+    #
+    n = np.arange(size)[:, None];
+    m = np.arange(size)[None, :];
+    k = ((n - m + 2)*(n - m + 1))[:, 1:];
+    #
+    dV_weights = np.zeros((size + 1, size + 1));
+    dW_weights = np.zeros((size + 1, size + 1));
+    #
+    if axis == 0:
+        #
+        dV_weights[1:, 1] -= V_weights[:, 0];
+        dV_weights[1:, 2:] -= 0.5*V_weights[:, 1:];
+        dV_weights[1:, :size - 1] += 0.5*k*V_weights[:, 1:];
+        dW_weights[1:, 2:] -= 0.5*W_weights[:, 1:];
+        dW_weights[1:, :size - 1] += 0.5*k*W_weights[:, 1:];
+        #
+    elif axis == 1:
+        #
+        dW_weights[1:, 1] -= V_weights[:, 0];
+        dW_weights[1:, 2:] -= 0.5*V_weights[:, 1:];
+        dW_weights[1:, :size - 1] -= 0.5*k*V_weights[:, 1:];
+        dV_weights[1:, 2:] += 0.5*W_weights[:, 1:];
+        dV_weights[1:, :size - 1] += 0.5*k*W_weights[:, 1:];
+        #
+    else:
+        #
+        dV_weights[1:, :size] -= (n - m + 1)*V_weights;
+        dW_weights[1:, :size] -= (n - m + 1)*W_weights;
+    #
+    # V_n0 and W_n0 are the only terms with m = 0, and W_n0 is identically zero
+    #
+    dW_weights[:, 0] = 0.0;
+    #
+    return dV_weights, dW_weights
+
+def _sum_solid_harmonics(r_ITRF_array, r_earth, weight_list):
+    #
+    # Run the V_nm/W_nm recursion over all objects and accumulate every weighted
+    # sum in weight_list while only two degrees of V and W are held in memory
+    #
+    num_sat = r_ITRF_array.shape[0];
+    degree_max = weight_list[0][0].shape[0] - 1;
+    #
+    legendre_table = get_legendre_recursion_table(degree_max, degree_max, False);
+    A = legendre_table.A;
+    B = legendre_table.B;
+    D = legendre_table.D;
+    #
+    x = r_ITRF_array[:, 0];
+    y = r_ITRF_array[:, 1];
+    z = r_ITRF_array[:, 2];
+    r_mag_squared = x**2 + y**2 + z**2;
+    #
+    rho = r_earth/r_mag_squared;
+    x_rho = (x*rho)[:, None];
+    y_rho = (y*rho)[:, None];
+    z_rho = (z*rho)[:, None];
+    r_earth_rho = (r_earth*rho)[:, None];
+    #
+    sums = np.zeros((len(weight_list), num_sat));
+    #
+    V_previous = np.zeros((num_sat, degree_max + 1));
+    W_previous = np.zeros((num_sat, degree_max + 1));
+    V_current = np.zeros((num_sat, degree_max + 1));
+    W_current = np.zeros((num_sat, degree_max + 1));
+    #
+    V_current[:, 0] = r_earth/np.sqrt(r_mag_squared);
+    #
+    for n in range(0, degree_max + 1):
+        #
+        if n >= 1:
+            #
+            V_next = np.zeros((num_sat, degree_max + 1));
+            W_next = np.zeros((num_sat, degree_max + 1));
+            #
+            V_next[:, :n] = A[n, :n]*z_rho*V_current[:, :n] -\
+            B[n, :n]*r_earth_rho*V_previous[:, :n];
+            W_next[:, :n] = A[n, :n]*z_rho*W_current[:, :n] -\
+            B[n, :n]*r_earth_rho*W_previous[:, :n];
+            #
+            V_next[:, n] = D[n]*(x_rho[:, 0]*V_current[:, n-1] -\
+                           y_rho[:, 0]*W_current[:, n-1]);
+            W_next[:, n] = D[n]*(x_rho[:, 0]*W_current[:, n-1] +\
+                           y_rho[:, 0]*V_current[:, n-1]);
+            #
+            V_previous = V_current;
+            W_previous = W_current;
+            V_current = V_next;
+            W_current = W_next;
+        #
+        for i, (V_weights, W_weights) in enumerate(weight_list):
+            sums[i] += V_current[:, :n + 1] @ V_weights[n, :n + 1] +\
+            W_current[:, :n + 1] @ W_weights[n, :n + 1];
+    #
+    return sums
+
+def spherical_harmonic_acceleration_cartesian(zonal_coeff_array, sectorial_coeff_array,\
+                                              tesseral_coeff_array, r_ITRF_array,\
+                                              order_zonal, order_tesseral,\
+                                              normalized=False,\
+                                              return_gradient=False, mu_earth=None,\
+                                              r_earth=None):
+    #
+    # Use the EGM-96 gravitational parameter and reference radius unless those
+    # of the field are given
+    #
+    if mu_earth is None:
+        mu_earth = mu_earth_default;
+    if r_earth is None:
+        r_earth = r_earth_default;
+    #
+    r_ITRF_array = np.atleast_2d(np.asarray(r_ITRF_array, dtype=float));
+    #
+    C_nm, S_nm = _assemble_coefficients(zonal_coeff_array, sectorial_coeff_array,\
+                                        tesseral_coeff_array, order_zonal,\
+                                        order_tesseral, normalized);
+    #
+    # Form the weights of V_(n+1)m and W_(n+1)m for each acceleration component
+    #
+    weight_list = [_differentiate(C_nm, S_nm, axis) for axis in range(0, 3)];
+    #
+    if not return_gradient:
+        #
+        sums = _sum_solid_harmonics(r_ITRF_array, r_earth, weight_list);
+        #
+        accel_spherical_harmonic_ITRF = (mu_earth/r_earth**2)*sums.T;
+        #
+        return accel_spherical_harmonic_ITRF
+    #
+    # Differentiate the acceleration weights once more for the six unique
+    # entries of the gravity gradient, then pad the acceleration weights to the
+    # same size so one recursion pass up to degree n+2 serves both
+    #
+    gradient_pairs = [(0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2)];
+    #
+    gradient_weight_list = [_differentiate(weight_list[i][0], weight_list[i][1], j)\
+                            for i, j in gradient_pairs];
+    #
+    weight_list = [(np.pad(V_weights, ((0, 1), (0, 1))), np.pad(W_weights, ((0, 1), (0, 1))))\
+                   for V_weights, W_weights in weight_list];
+    #
+    sums = _sum_solid_harmonics(r_ITRF_array, r_earth,\
+                                weight_list + gradient_weight_list);
+    #
+    accel_spherical_harmonic_ITRF = (mu_earth/r_earth**2)*sums[0:3].T;
+    #
+    gravity_gradient_ITRF = np.zeros((r_ITRF_array.shape[0], 3, 3));
+    for k, (i, j) in enumerate(gradient_pairs):
+        gravity_gradient_ITRF[:, i, j] = (mu_earth/r_earth**3)*sums[3 + k];
+        gravity_gradient_ITRF[:, j, i] = gravity_gradient_ITRF[:, i, j];
+    #
+    return accel_spherical_harmonic_ITRF, gravity_gradient_ITRF
+
+#
+# Test function: compare with the latitude/longitude formulation away from the
+# poles, check that the Cartesian form stays finite over the poles, and check
+# the gravity gradient against central differences
+#
+if __name__ == '__main__':
+    #
+    from spherical_harmonic_arrays import spherical_harmonic_arrays
+    from spherical_harmonic_acceleration_batch import spherical_harmonic_acceleration_batch
+    #
+    zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array = spherical_harmonic_arrays();
+    order_zonal = zonal_coeff_array.size;
+    order_tesseral = sectorial_coeff_array.shape[0] - 1;
+    #
+    rng = np.random.default_rng(2);
+    directions = rng.normal(size=(50, 3));
+    directions = directions/np.linalg.norm(directions, axis=1)[:, None];
+    r_ITRF_array = directions*rng.uniform(6.7e6, 4.3e7, 50)[:, None];
+    #
+    accel_cartesian = spherical_harmonic_acceleration_cartesian(zonal_coeff_array,\
+                      sectorial_coeff_array, tesseral_coeff_array, r_ITRF_array,\
+                      order_zonal, order_tesseral);
+    accel_spherical = spherical_harmonic_acceleration_batch(zonal_coeff_array,\
+                      sectorial_coeff_array, tesseral_coeff_array, r_ITRF_array,\
+                      order_zonal, order_tesseral, engine='spherical');
+    #
+    engine_difference = np.max(np.linalg.norm(accel_cartesian - accel_spherical, axis=1)/\
+                               np.linalg.norm(accel_spherical, axis=1));
+    assert engine_difference < 1.0e-13, engine_difference
+    #
+    r_poles = np.array([[0.0, 0.0, 7.0e6], [0.0, 0.0, -7.0e6]]);
+    accel_poles = spherical_harmonic_acceleration_cartesian(zonal_coeff_array,\
+                  sectorial_coeff_array, tesseral_coeff_array, r_poles, order_zonal,\
+                  order_tesseral);
+    assert np.all(np.isfinite(accel_poles))
+    #
+    # Gravity gradient against central differences of the acceleration with a
+    # 10 m step, including a point over the pole
+    #
+    r_gradient = np.vstack([r_ITRF_array[0:20], r_poles[0:1]]);
+    accel_gradient, gravity_gradient_ITRF = spherical_harmonic_acceleration_cartesian(\
+    zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array, r_gradient,\
+    order_zonal, order_tesseral, return_gradient=True);
+    #
+    step = 10.0; # m
+    gradient_central_differences = np.zeros(gravity_gradient_ITRF.shape);
+    for j in range(0, 3):
+        offset = np.zeros(3);
+        offset[j] = step;
+        gradient_central_differences[:, :, j] = (spherical_harmonic_acceleration_cartesian(\
+        zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array, r_gradient + offset,\
+        order_zonal, order_tesseral) - spherical_harmonic_acceleration_cartesian(\
+        zonal_coeff_array, sectorial_coeff_array, tesseral_coeff_array, r_gradient - offset,\
+        order_zonal, order_tesseral))/(2.0*step);
+    #
+    gradient_error = np.max(np.linalg.norm(gravity_gradient_ITRF - gradient_central_differences,\
+                            axis=(1, 2))/np.linalg.norm(gravity_gradient_ITRF, axis=(1, 2)));
+    assert np.all(np.isfinite(gravity_gradient_ITRF)) and gradient_error < 1.0e-8, gradient_error
+    #
+    print('cartesian vs spherical max relative difference', engine_difference)
+    print('acceleration over the poles', accel_poles)
+    print('gradient vs central differences max relative error', gradient_error)
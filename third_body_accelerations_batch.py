@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+This function calculates the third body perturbations of the Sun and the Moon
+on a batch of satellites at one epoch. It evaluates the same series as
+third_body_accelerations. With h = |r|/|r_body| and P_l the Legendre
+polynomials of the cosine of the angle between the satellite and the body, the
+series is
+
+    B = sum_(l=1..5) P_l*h^l,   beta = 3*B + 3*B^2 + B^3
+    accel = -mu_body/|r_body|^3*(r - beta*(r_body - r))
+
+The Sun and Moon positions and norms are shared by the whole batch. The
+Legendre recursion and the sum for B run over all satellites at once as array
+operations.
+
+By default the series is cut at l = 5 as above. When a tolerance is given, the
+number of terms L is instead chosen per body from the largest h in the batch.
+Since |P_l| <= 1, the terms dropped after L add up to at most
+h^(L+1)/(1 - h), while the acceleration itself is of order h*mu_body/|r_body|^2.
+L is therefore the smallest number of terms with h^L <= tolerance*(1 - h),
+which bounds the relative error of the acceleration by about the tolerance. A
+LEO satellite then needs 3 Sun terms and 6 Moon terms at a tolerance of 1e-9,
+while a GEO satellite needs 10 Moon terms.
+
+The series converges slowly as h approaches 1 and diverges beyond it. For
+satellites with h above h_series_limit (0.5, about half way to the Moon) the
+exact point-mass difference of point_mass_perturbations, in Battin's form, is
+used instead, and the number of terms is chosen from the remaining satellites.
+
+Inputs:
+    rECEF_array: (N,3) array of satellite positions in the ITRF reference system (m)
+    r_sunECEF: Position of the Sun in the ITRF reference system (m)
+    r_moonECEF: Position of the Moon in the ITRF reference system (m)
+    context: Optional EpochContext of the epoch. When given, the Sun and Moon
+    positions and norms are taken from it and r_sunECEF, r_moonECEF may be None
+    tolerance: Optional relative accuracy used to choose the number of terms
+    return_term_counts: If True, also return the number of terms used
+
+Output:
+    accel_third_body_array: (N,3) array of the accelerations in the ITRF
+    reference frame caused by the Sun and the Moon (m/s^2)
+    term_counts: Dictionary of the number of series terms used for 'Sun' and
+    'Moon' (0 if every satellite used the exact form). Only returned when
+    return_term_counts is True
+
+Copyright (c) Trevor Wolf 2018. All Rights Reserved.
+"""
+import numpy as np
+from point_mass_perturbations import point_mass_perturbations
+
+# Largest h = |r|/|r_body| for which the Legendre series is used
+h_series_limit = 0.5;
+
+def _number_of_terms(h_max, tolerance, max_terms=60):
+    #
+    # Smallest L with h_max^L <= tolerance*(1 - h_max). Only valid for h_max
+    # below h_series_limit, where L <= max_terms down to a tolerance of 1e-16
+    #
+    if h_max <= 0.0:
+        return 1
+    if h_max > h_series_limit:
+        raise ValueError('The third body series is not used for h above h_series_limit')
+    #
+    num_terms = int(np.ceil(np.log(tolerance*(1.0 - h_max))/np.log(h_max)));
+    #
+    return min(max(num_terms, 1), max_terms)
+
+def _third_body_series(rECEF_array, norm_rECEF, r_bodyECEF, norm_r_bodyECEF, mu_body,\
+                       num_terms=5):
+    #
+    # Acceleration of every satellite caused by one perturbing body, summing
+    # the Legendre series up to l = num_terms
+    #
+    r_sat_bodyECEF = r_bodyECEF - rECEF_array;
+    #
+    # Argument of the Legendre polynomials and the ratio h
+    #
+    legendre_arg = (rECEF_array @ r_bodyECEF)/(norm_rECEF*norm_r_bodyECEF);
+    h = norm_rECEF/norm_r_bodyECEF;
+    #
+    # Sum P_l*h^l for l = 1..num_terms while running the Legendre recursion
+    #
+    P_previous = np.ones(rECEF_array.shape[0]);
+    P_current = legendre_arg;
+    h_power = h;
+    #
+    B = P_current*h_power;
+    #
+    for l in range(2, num_terms + 1):
+        P_previous, P_current = P_current, ((2*l - 1)*legendre_arg*P_current -\
+                                            (l - 1)*P_previous)/l;
+        h_power = h_power*h;
+        B = B + P_current*h_power;
+    #
+    beta = 3.0*B + 3.0*B**2.0 + B**3.0;
+    #
+    return -mu_body/(norm_r_bodyECEF**3.0)*(rECEF_array - beta[:, None]*r_sat_bodyECEF)
+
+def third_body_accelerations_batch(rECEF_array, r_sunECEF=None, r_moonECEF=None,\
+                                   context=None, tolerance=None, return_term_counts=False):
+    #
+    # Define gravitational constant parameters
+    #
+    mu_sun = 1.32712440018e20;
+    mu_moon = 4.9048695e12;
+    #
+    rECEF_array = np.atleast_2d(np.asarray(rECEF_array, dtype=float));
+    #
+    # Take the Sun and Moon positions and their norms from the shared epoch
+    # context when one is given
+    #
+    if context is not None:
+        r_sunECEF = context.r_sun_ECEF;
+        r_moonECEF = context.r_moon_ECEF;
+        norm_r_sunECEF = context.norm_r_sun;
+        norm_r_moonECEF = context.norm_r_moon;
+    else:
+        r_sunECEF = np.asarray(r_sunECEF, dtype=float);
+        r_moonECEF = np.asarray(r_moonECEF, dtype=float);
+        norm_r_sunECEF = np.linalg.norm(r_sunECEF);
+        norm_r_moonECEF = np.linalg.norm(r_moonECEF);
+    #
+    norm_rECEF = np.linalg.norm(rECEF_array, axis=1);
+    #
+    # Evaluate each body with the series, or with the exact point-mass
+    # difference for the satellites too far out for the series
+    #
+    accel_third_body_array = np.zeros(rECEF_array.shape);
+    term_counts = {};
+    #
+    for body, r_bodyECEF, norm_r_bodyECEF, mu_body in\
+        (('Sun', r_sunECEF, norm_r_sunECEF, mu_sun), ('Moon', r_moonECEF, norm_r_moonECEF, mu_moon)):
+        #
+        h = norm_rECEF/norm_r_bodyECEF;
+        use_series = h <= h_series_limit;
+        #
+        # Choose the number of terms from the requested accuracy
+        #
+        if not np.any(use_series):
+            num_terms = 0;
+        elif tolerance is None:
+            num_terms = 5;
+        else:
+            num_terms = _number_of_terms(np.max(h[use_series]), tolerance);
+        term_counts[body] = num_terms;
+        #
+        if np.all(use_series):
+            accel_third_body_array += _third_body_series(rECEF_array, norm_rECEF,\
+                                      r_bodyECEF, norm_r_bodyECEF, mu_body, num_terms);
+            continue
+        #
+        if num_terms > 0:
+            accel_third_body_array[use_series] += _third_body_series(rECEF_array[use_series],\
+            norm_rECEF[use_series], r_bodyECEF, norm_r_bodyECEF, mu_body, num_terms);
+        accel_third_body_array[~use_series] += point_mass_perturbations(\
+        rECEF_array[~use_series], r_bodyECEF, mu_body);
+    #
+    if return_term_counts:
+        return accel_third_body_array, term_counts
+    #
+    return accel_third_body_array
+
+#
+# Test function: compare with the exact point-mass difference from LEO out to
+# beyond the series limit, where the exact form takes over
+#
+if __name__ == '__main__':
+    #
+    r_sunECEF = np.array([1.2e11, -8.0e10, 3.0e10]);
+    r_moonECEF = np.array([-2.0e8, 3.2e8, 1.1e8]);
+    norm_r_moon = np.linalg.norm(r_moonECEF);
+    #
+    directions = np.array([[1.0, 0.0, 0.0], [0.0, 0.6, 0.8], [-0.48, 0.6, 0.64]]);
+    radii = np.array([6.778e6, 2.6562e7, 0.3*norm_r_moon, 0.7*norm_r_moon, 0.99*norm_r_moon]);
+    rECEF_array = (radii[:, None, None]*directions[None, :, :]).reshape(-1, 3);
+    #
+    accel_exact = point_mass_perturbations(rECEF_array, np.stack([r_sunECEF, r_moonECEF]),\
+                  [1.32712440018e20, 4.9048695e12]);
+    #
+    for tolerance in (1.0e-6, 1.0e-9, 1.0e-12):
+        accel, term_counts = third_body_accelerations_batch(rECEF_array, r_sunECEF, r_moonECEF,\
+                             tolerance=tolerance, return_term_counts=True);
+        relative_error = np.max(np.linalg.norm(accel - accel_exact, axis=1)/\
+                                np.linalg.norm(accel_exact, axis=1));
+        assert np.all(np.isfinite(accel)) and relative_error < 10.0*tolerance, relative_error
+        print('tolerance', tolerance, 'terms', term_counts, 'max relative error', relative_error)